@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""Microbenchmark of the fast paths for excerpts which are already in canonical
+form (pre-processed and sorted), compared to the same work on equivalent
+excerpts which are not known to be canonical."""
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from mdtk import degradations
+from mdtk.note_array import NoteArray
+
+
+def random_excerpt(num_notes, seed=0):
+    """
+    Create a random, sorted, pre-processed note_df.
+
+    Parameters
+    ----------
+    num_notes : int
+        The number of notes in the excerpt.
+
+    seed : int
+        The random seed to use.
+
+    Returns
+    -------
+    note_df : pd.DataFrame
+        A random note_df in canonical form.
+    """
+    rng = np.random.default_rng(seed)
+    note_df = pd.DataFrame(
+        {
+            "onset": rng.integers(0, 100 * num_notes, num_notes),
+            "track": rng.integers(0, 2, num_notes),
+            "pitch": rng.integers(21, 109, num_notes),
+            "dur": rng.integers(50, 500, num_notes),
+            "velocity": 100,
+        }
+    )
+    return degradations.pre_process(note_df, sort=True)
+
+
+def time_call(func, number, repeat):
+    """Get the fastest time per call of func over repeat runs, in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def run_benchmarks(num_notes, number, repeat):
+    """
+    Time each fast path against the slow path it replaces.
+
+    Parameters
+    ----------
+    num_notes : int
+        The number of notes in each excerpt.
+
+    number : int
+        The number of calls in each timing run.
+
+    repeat : int
+        The number of timing runs, of which the fastest is used.
+
+    Returns
+    -------
+    results : list(tuple(string, float, float))
+        The name, slow path time, and fast path time (in microseconds per
+        call) of each benchmark.
+    """
+    note_df = random_excerpt(num_notes)
+    # An identical df with a non-range index is not recognised as canonical
+    slow_df = note_df.set_index(pd.Index(list(range(len(note_df)))))
+    notes = NoteArray.from_df(note_df)
+    sorted_notes = notes.sort()
+
+    benchmarks = [
+        (
+            "pre_process",
+            lambda: degradations.pre_process(slow_df),
+            lambda: degradations.pre_process(note_df),
+        ),
+        (
+            "pre_process(sort=True)",
+            lambda: degradations.pre_process(slow_df, sort=True),
+            lambda: degradations.pre_process(note_df, sort=True),
+        ),
+        (
+            "post_process",
+            lambda: note_df.sort_values(degradations.NOTE_DF_SORT_ORDER).reset_index(
+                drop=True
+            ),
+            lambda: degradations.post_process(note_df),
+        ),
+        (
+            "NoteArray.sort",
+            lambda: notes.copy().sort(),
+            lambda: sorted_notes.sort(),
+        ),
+        (
+            "join_notes",
+            lambda: degradations.join_notes(notes.copy(), seed=0),
+            lambda: degradations.join_notes(sorted_notes, seed=0),
+        ),
+    ]
+    return [
+        (name, time_call(slow, number, repeat), time_call(fast, number, repeat))
+        for name, slow, fast in benchmarks
+    ]
+
+
+def parse_args(args_input=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--num-notes",
+        type=int,
+        default=50,
+        help="The number of notes in each excerpt.",
+    )
+    parser.add_argument(
+        "--number", type=int, default=1000, help="The number of calls per run."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="The number of runs per benchmark."
+    )
+    return parser.parse_args(args=args_input)
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    print(f"{'benchmark':<24}{'slow (us)':>12}{'fast (us)':>12}{'speedup':>10}")
+    for name, slow, fast in run_benchmarks(ARGS.num_notes, ARGS.number, ARGS.repeat):
+        print(f"{name:<24}{slow:>12.1f}{fast:>12.1f}{slow / fast:>9.1f}x")
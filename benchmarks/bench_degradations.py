@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+"""Benchmark suite for every degradation, Degrader.degrade, get_random_excerpt,
+get_random_excerpts, and remove_pitch_overlaps, on synthetic excerpts of various
+sizes and polyphony levels, with each alignment flag. Results are written as
+json, and can be compared against the results of an earlier run to find
+regressions."""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from mdtk import degradations
+from mdtk.degrader import Degrader
+from mdtk.df_utils import (
+    get_random_excerpt,
+    get_random_excerpts,
+    remove_pitch_overlaps,
+)
+from mdtk.synth import synthetic_df, synthetic_notes
+
+SIZES_DEFAULT = [10, 100, 1000, 10000, 100000]
+POLYPHONY_DEFAULT = [1, 4, 16]
+
+# The keyword arguments of each benchmarked variant of each degradation
+DEGRADATION_VARIANTS = {
+    "pitch_shift": [{}, {"align_pitch": True}],
+    "time_shift": [{}, {"align_onset": True}],
+    "onset_shift": [{}, {"align_onset": True}, {"align_dur": True}],
+    "offset_shift": [{}, {"align_dur": True}],
+    "remove_note": [{}],
+    "add_note": [
+        {},
+        {"align_pitch": True},
+        {"align_time": True},
+        {"align_velocity": True},
+    ],
+    "split_note": [{}],
+    "join_notes": [{}, {"only_first": True}],
+}
+
+# The number of tracks of each synthetic excerpt
+NUM_TRACKS = 2
+
+# The proportion of notes which overlap the previous note of the same track and
+# pitch in the raw (uncleaned) excerpts given to remove_pitch_overlaps
+RAW_OVERLAP_RATE = 0.2
+
+
+def time_call(func, repeat, min_time):
+    """
+    Time the given function.
+
+    Parameters
+    ----------
+    func : function
+        The function to time, with no arguments.
+
+    repeat : int
+        The number of timing runs, of which the fastest is used.
+
+    min_time : float
+        The minimum duration of each timing run, in seconds. Each run calls
+        func as many times as needed to take at least this long.
+
+    Returns
+    -------
+    seconds : float
+        The fastest time per call, in seconds.
+
+    number : int
+        The number of calls in each timing run.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        seconds = timer.timeit(number)
+        if seconds >= min_time:
+            break
+        number *= max(2, min(10, int(min_time / max(seconds, 1e-9))))
+    runs = [seconds] + timer.repeat(repeat=repeat - 1, number=number)
+    return min(runs) / number, number
+
+
+def get_benchmarks(num_notes, polyphony):
+    """
+    Get the benchmarks to run on excerpts of the given size and polyphony.
+
+    Parameters
+    ----------
+    num_notes : int
+        The number of notes in each excerpt.
+
+    polyphony : float
+        The average polyphony of each excerpt.
+
+    Returns
+    -------
+    benchmarks : list(tuple(string, dict, function))
+        The name, keyword arguments, and function (with no arguments) of each
+        benchmark.
+    """
+    notes = synthetic_notes(
+        num_notes, polyphony, num_tracks=NUM_TRACKS, rng=np.random.default_rng(0)
+    )
+    raw_df = synthetic_df(
+        num_notes,
+        polyphony=polyphony,
+        num_tracks=NUM_TRACKS,
+        overlap_rate=RAW_OVERLAP_RATE,
+        rng=np.random.default_rng(0),
+    )
+    note_df = notes.to_df()
+
+    benchmarks = []
+    for name, variants in DEGRADATION_VARIANTS.items():
+        for kwargs in variants:
+            rng = np.random.default_rng(0)
+            func = degradations.DEGRADATIONS[name]
+            benchmarks.append(
+                (name, kwargs, lambda f=func, k=kwargs, r=rng: f(notes, rng=r, **k))
+            )
+
+    degrader = Degrader(seed=0, clean_prop=0)
+    benchmarks.append(("Degrader.degrade", {}, lambda: degrader.degrade(notes)))
+
+    rng = np.random.default_rng(0)
+    benchmarks.append(
+        (
+            "get_random_excerpt",
+            {},
+            lambda: get_random_excerpt(note_df, min_notes=1, rng=rng),
+        )
+    )
+    kwargs = {"num_excerpts": 10}
+    benchmarks.append(
+        (
+            "get_random_excerpts",
+            kwargs,
+            lambda: get_random_excerpts(note_df, min_notes=1, rng=rng, **kwargs),
+        )
+    )
+    benchmarks.append(
+        ("remove_pitch_overlaps", {}, lambda: remove_pitch_overlaps(raw_df))
+    )
+    return benchmarks
+
+
+def run_benchmarks(sizes, polyphonies, names=None, repeat=3, min_time=0.1):
+    """
+    Run every benchmark on synthetic excerpts of each size and polyphony.
+
+    Parameters
+    ----------
+    sizes : list(int)
+        The number of notes in each excerpt.
+
+    polyphonies : list(float)
+        The average polyphony of each excerpt.
+
+    names : list(string)
+        The names of the benchmarks to run. None to run all of them.
+
+    repeat : int
+        The number of timing runs per benchmark.
+
+    min_time : float
+        The minimum duration of each timing run, in seconds.
+
+    Returns
+    -------
+    results : list(dict)
+        The name, parameters, time per call (in seconds), and number of calls
+        per run of each benchmark.
+    """
+    # Degrader re-enables logging after each call, so raise the level instead
+    logger = logging.getLogger()
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    results = []
+    for num_notes in sizes:
+        for polyphony in polyphonies:
+            for name, kwargs, func in get_benchmarks(num_notes, polyphony):
+                if names is not None and name not in names:
+                    continue
+                seconds, number = time_call(func, repeat, min_time)
+                results.append(
+                    {
+                        "name": name,
+                        "kwargs": kwargs,
+                        "num_notes": num_notes,
+                        "polyphony": polyphony,
+                        "seconds": seconds,
+                        "number": number,
+                    }
+                )
+                print(
+                    f"{name:<22}{json.dumps(kwargs):<24}{num_notes:>8}"
+                    f"{polyphony:>6}{seconds * 1e6:>14.1f}",
+                    flush=True,
+                )
+    logger.setLevel(level)
+    return results
+
+
+def benchmark_key(result):
+    """Get a hashable key identifying the benchmark of a result."""
+    return (
+        result["name"],
+        json.dumps(result["kwargs"], sort_keys=True),
+        result["num_notes"],
+        result["polyphony"],
+    )
+
+
+def compare_results(old_results, new_results, threshold):
+    """
+    Find the benchmarks which got slower between two runs.
+
+    Parameters
+    ----------
+    old_results, new_results : list(dict)
+        The results of each run, from run_benchmarks.
+
+    threshold : float
+        The minimum ratio of new time to old time to count as a regression.
+
+    Returns
+    -------
+    regressions : list(tuple(dict, float))
+        Each new result which regressed, with its ratio to the old time.
+    """
+    old_times = {benchmark_key(result): result["seconds"] for result in old_results}
+    regressions = []
+    for result in new_results:
+        old_time = old_times.get(benchmark_key(result))
+        if old_time is not None and result["seconds"] > threshold * old_time:
+            regressions.append((result, result["seconds"] / old_time))
+    return regressions
+
+
+def environment_info():
+    """Get a dict describing the environment the benchmarks were run in."""
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def parse_args(args_input=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        metavar="N",
+        type=int,
+        nargs="+",
+        default=SIZES_DEFAULT,
+        help="The number of notes in the excerpts.",
+    )
+    parser.add_argument(
+        "--polyphony",
+        metavar="P",
+        type=float,
+        nargs="+",
+        default=POLYPHONY_DEFAULT,
+        help="The average polyphony levels of the excerpts.",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        metavar="name",
+        nargs="+",
+        default=None,
+        help="The names of the benchmarks to run (degradation names, "
+        "Degrader.degrade, get_random_excerpt, get_random_excerpts, or "
+        "remove_pitch_overlaps). "
+        "By default, all are run.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="The number of runs per benchmark."
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.1,
+        help="The minimum duration of each run, in seconds.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="json_file",
+        default=None,
+        help="The file to write the results to, as json.",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="json_file",
+        default=None,
+        help="The results of an earlier run to compare against.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="The slowdown ratio above which a benchmark counts as a "
+        "regression in --compare.",
+    )
+    return parser.parse_args(args=args_input)
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    print(f"{'benchmark':<22}{'kwargs':<24}{'notes':>8}{'poly':>6}{'time (us)':>14}")
+    RESULTS = run_benchmarks(
+        ARGS.sizes, ARGS.polyphony, ARGS.benchmarks, ARGS.repeat, ARGS.min_time
+    )
+
+    if ARGS.output is not None:
+        with open(ARGS.output, "w") as file:
+            json.dump(
+                {"environment": environment_info(), "results": RESULTS},
+                file,
+                indent=4,
+            )
+
+    if ARGS.compare is not None:
+        with open(ARGS.compare, "r") as file:
+            old_results = json.load(file)["results"]
+        regressions = compare_results(old_results, RESULTS, ARGS.threshold)
+        print(f"\n{len(regressions)} regression(s) against {ARGS.compare}")
+        for result, ratio in regressions:
+            print(
+                f"\t* {result['name']} {json.dumps(result['kwargs'])} "
+                f"({result['num_notes']} notes, polyphony {result['polyphony']}):"
+                f" {ratio:.2f}x slower"
+            )
+        if len(regressions) > 0:
+            sys.exit(1)
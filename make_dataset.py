@@ -6,16 +6,21 @@ import logging
 import os
 import shutil
 import sys
+from functools import partial
 from glob import glob
+from multiprocessing import Pool
 from pathlib import Path
 from zipfile import BadZipfile
 
 import numpy as np
 from tqdm import tqdm
 
-from mdtk import degradations, downloaders, fileio
-from mdtk.df_utils import get_random_excerpt
+from mdtk import degradations, downloaders, fileio, instrumentation
+from mdtk.df_utils import get_random_excerpt, get_random_excerpts
 from mdtk.formatters import FORMATTERS, create_corpus_csvs
+from mdtk.note_array import NoteArray, NoteBatch
+from mdtk.parse_cache import DEFAULT_PARSE_CACHE_PATH, ParseCache
+from mdtk.rng import derive_rng
 
 logo_path = Path(__file__, "..", "img", "logo.txt").resolve()
 with open(logo_path, "r") as ff:
@@ -24,6 +29,13 @@ with open(logo_path, "r") as ff:
 
 DESCRIPTION = "Make datasets of altered and corrupted midi excerpts."
 
+MANIFEST_NAME = "manifest.jsonl"
+META_HEADER = "altered_csv_path,degraded,degradation_id,clean_csv_path,split\n"
+# Additional columns of metadata.csv for a dataset written to shards
+META_SHARD_HEADER = "shard_path,shard_index"
+
+OUTPUT_FORMATS = ["csv", "shards", "both"]
+
 
 def parse_degradation_kwargs(kwarg_dict):
     """Convenience function to parse a dictionary of keyword arguments for
@@ -102,6 +114,1133 @@ def clean_download_cache(dir_path=downloaders.DEFAULT_CACHE_PATH, prompt=True):
     return True
 
 
+def excerpt_rel_path(rel_path, index, num_excerpts):
+    """
+    Get the path identifying one of the excerpts of a piece, which is used in
+    place of the piece's path for that excerpt's csvs and manifest record.
+
+    Parameters
+    ----------
+    rel_path : string
+        The path of the piece within its dataset directory.
+
+    index : int
+        The index of the excerpt.
+
+    num_excerpts : int
+        The number of excerpts taken from each piece. If this is 1, the path is
+        the piece's own path, as it always was.
+
+    Returns
+    -------
+    excerpt_path : string
+        The piece's path, with _{index} added before its extension if
+        num_excerpts is more than 1.
+    """
+    if num_excerpts == 1:
+        return rel_path
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}_{index}{ext}"
+
+
+def load_excerpt(
+    path,
+    load_func,
+    load_kwargs,
+    rel_start,
+    dataset,
+    seed,
+    excerpt_kwargs,
+    cache=None,
+    num_excerpts=1,
+    overlapping=False,
+):
+    """
+    Load a piece and take its random excerpts. Only the excerpts are returned,
+    so that the full piece does not need to be kept in memory.
+
+    Parameters
+    ----------
+    path : string
+        The path of the file to load.
+
+    load_func : function
+        The function to load the file with, such as fileio.midi_to_df.
+
+    load_kwargs : dict
+        Keyword arguments for load_func.
+
+    rel_start : int
+        The index in path at which the piece's path relative to its dataset
+        begins.
+
+    dataset : string
+        The name of the piece's dataset.
+
+    seed : int
+        The master random seed.
+
+    excerpt_kwargs : dict
+        Keyword arguments for get_random_excerpt.
+
+    cache : ParseCache
+        A cache of parsed files to load the file through. None to always parse
+        it with load_func.
+
+    num_excerpts : int
+        The number of excerpts to take. If this is more than 1, they are taken
+        with get_random_excerpts (ignoring the iterations in excerpt_kwargs).
+
+    overlapping : boolean
+        True to allow the excerpts of a piece to share notes.
+
+    Returns
+    -------
+    excerpts : list(tuple(pd.DataFrame, np.random.Generator))
+        num_excerpts tuples of an excerpt (or None if fewer valid excerpts
+        were found) and its random number generator. With 1 excerpt, this is
+        the piece's generator (keyed by its dataset and path), which has been
+        used to take the excerpt. Otherwise, each excerpt has its own generator
+        (keyed by its excerpt_rel_path). None if the file could not be loaded.
+    """
+    if cache is None:
+        note_df = load_func(path, **load_kwargs)
+    else:
+        note_df = cache.load(path, load_func, **load_kwargs)
+    if note_df is None:
+        return None
+
+    rel_path = path[rel_start:]
+    piece_rng = derive_rng(seed, dataset, f"{rel_path[:-3]}csv")
+    if num_excerpts == 1:
+        excerpt = get_random_excerpt(note_df, rng=piece_rng, **excerpt_kwargs)
+        return [(excerpt, piece_rng)]
+
+    excerpts = get_random_excerpts(
+        note_df,
+        num_excerpts=num_excerpts,
+        min_notes=excerpt_kwargs["min_notes"],
+        excerpt_length=excerpt_kwargs["excerpt_length"],
+        first_onset_range=excerpt_kwargs["first_onset_range"],
+        overlapping=overlapping,
+        rng=piece_rng,
+    )
+    excerpts += [None] * (num_excerpts - len(excerpts))
+    results = []
+    for index, excerpt in enumerate(excerpts):
+        excerpt_path = excerpt_rel_path(rel_path, index, num_excerpts)
+        results.append((excerpt, derive_rng(seed, dataset, f"{excerpt_path[:-3]}csv")))
+    return results
+
+
+def parallel_map(func, items, kwargs, workers=1, desc=None):
+    """
+    Apply a function to each of the given items, optionally in parallel, with
+    a progress bar.
+
+    Parameters
+    ----------
+    func : function
+        The function to apply, such as load_excerpt. Its first argument is an
+        item. It must be picklable (a module-level function) if workers is
+        more than 1.
+
+    items : list
+        The items to apply func to, such as file paths.
+
+    kwargs : dict
+        Additional keyword arguments for func.
+
+    workers : int
+        The number of processes to use. 1 applies func serially in this
+        process.
+
+    desc : string
+        A description for the progress bar.
+
+    Yields
+    ------
+    result
+        The result of func for each item, in the order of items (regardless of
+        the order in which they were computed), as soon as it is available.
+    """
+    func = partial(func, **kwargs)
+    if workers <= 1 or len(items) <= 1:
+        yield from tqdm(map(func, items), total=len(items), desc=desc)
+        return
+
+    # Send items in chunks to limit overhead, but keep several chunks per
+    # worker so that slow items do not leave the others idle
+    chunksize = max(1, len(items) // (workers * 8))
+    with Pool(workers) as pool:
+        results = pool.imap(func, items, chunksize=chunksize)
+        yield from tqdm(results, total=len(items), desc=desc)
+
+
+def priority_order(goal_dist, counts, choices):
+    """
+    Order the given choices (degradations or splits) by how far below their
+    goal proportion their current count is.
+
+    Parameters
+    ----------
+    goal_dist : np.ndarray
+        The goal proportion of each choice.
+
+    counts : np.ndarray
+        The current count of each choice. If these are all 0, the current
+        distribution is taken to be uniform.
+
+    choices : np.ndarray
+        The name of each choice.
+
+    Returns
+    -------
+    order : list(tuple(string, int))
+        The name and index of each choice, most needed first.
+    """
+    if np.sum(counts) == 0:  # First iteration, set to uniform
+        current_dist = np.ones(len(counts)) / len(counts)
+    else:
+        current_dist = counts / np.sum(counts)
+    diffs = goal_dist - current_dist
+    order = sorted(zip(diffs, choices, list(range(len(choices)))))[::-1]
+    return [(name, index) for _, name, index in order]
+
+
+def balanced_schedule(num_excerpts, goal_dist, choices, feasible=None):
+    """
+    Plan the priority orders of the given choices for a number of excerpts up
+    front, assuming that each excerpt gets the first choice in its order.
+
+    Parameters
+    ----------
+    num_excerpts : int
+        The number of excerpts to plan for.
+
+    goal_dist : np.ndarray
+        The goal proportion of each choice.
+
+    choices : np.ndarray
+        The name of each choice.
+
+    feasible : np.ndarray
+        A boolean array of shape (num_excerpts, len(choices)), which is False
+        where a choice is certain to fail on an excerpt (see
+        degradations.check_feasible). Each excerpt's infeasible choices are
+        moved to the end of its order, so it is planned to get the most needed
+        choice which can succeed on it, and failures do not skew the counts.
+        None if every choice can succeed on every excerpt.
+
+    Returns
+    -------
+    schedule : list(list(tuple(string, int)))
+        The priority order (see priority_order) for each excerpt.
+    """
+    counts = np.zeros(len(choices))
+    schedule = []
+    for index in range(num_excerpts):
+        order = priority_order(goal_dist, counts, choices)
+        if feasible is not None:
+            order = [choice for choice in order if feasible[index, choice[1]]] + [
+                choice for choice in order if not feasible[index, choice[1]]
+            ]
+        counts[order[0][1]] += 1
+        schedule.append(order)
+    return schedule
+
+
+def degrade_excerpt(excerpt, piece_rng, deg_order, degradation_kwargs):
+    """
+    Try to degrade an excerpt with each of the given degradations in turn,
+    until one succeeds.
+
+    Parameters
+    ----------
+    excerpt : pd.DataFrame
+        The excerpt to degrade.
+
+    piece_rng : np.random.Generator
+        The random number generator of the excerpt's piece.
+
+    deg_order : list(tuple(string, int))
+        The name and id of each degradation to try, in order. Trying stops at
+        a degradation named "none".
+
+    degradation_kwargs : dict
+        The keyword arguments for each degradation, by name.
+
+    Returns
+    -------
+    degraded : NoteArray
+        The degraded excerpt, or None if no degradation succeeded.
+
+    deg_num : int
+        The id of the successful degradation, or of the last one tried.
+    """
+    # Convert once, rather than on every attempted degradation
+    excerpt_notes = NoteArray.from_df(excerpt)
+
+    degraded = None
+    for deg_name, deg_num in deg_order:
+        # Break for no degradation
+        if deg_name == "none":
+            break
+
+        deg_fun = degradations.DEGRADATIONS[deg_name]
+        logging.disable(logging.WARNING)
+        degraded = deg_fun(
+            excerpt_notes, rng=piece_rng, **degradation_kwargs[deg_name]
+        )
+        logging.disable(logging.NOTSET)
+
+        if degraded is not None:
+            break
+    return degraded, deg_num
+
+
+def excerpt_labels(dataset, rel_path, degraded, deg_num):
+    """
+    Get the labels of an excerpt, as stored in metadata.csv and in shards.
+
+    Parameters
+    ----------
+    dataset : string
+        The name of the excerpt's dataset.
+
+    rel_path : string
+        The csv path of the excerpt within its dataset directory.
+
+    degraded : NoteArray
+        The degraded excerpt, or None if it was not degraded.
+
+    deg_num : int
+        The id of the excerpt's degradation.
+
+    Returns
+    -------
+    labels : dict
+        The excerpt's value of each label in fileio.SHARD_LABELS.
+    """
+    clean_path = os.path.join("clean", dataset, rel_path)
+    if degraded is None:
+        altered_path = clean_path
+    else:
+        altered_path = os.path.join("altered", dataset, rel_path)
+    return {
+        "degraded": int(degraded is not None),
+        "degradation_id": int(deg_num),
+        "clean_csv_path": clean_path,
+        "altered_csv_path": altered_path,
+    }
+
+
+def write_excerpt(
+    output_dir, dataset, rel_path, excerpt, degraded, deg_num, split, write_csvs=True
+):
+    """
+    Write the clean and (if given) degraded versions of an excerpt out to csvs.
+
+    Parameters
+    ----------
+    output_dir : string
+        The base directory of the dataset.
+
+    dataset : string
+        The name of the excerpt's dataset.
+
+    rel_path : string
+        The csv path of the excerpt within its dataset directory.
+
+    excerpt : pd.DataFrame
+        The clean excerpt.
+
+    degraded : NoteArray
+        The degraded excerpt, or None if it was not degraded.
+
+    deg_num : int
+        The id of the excerpt's degradation.
+
+    split : string
+        The name of the excerpt's split.
+
+    write_csvs : boolean
+        False to only get the excerpt's metadata line, without writing any
+        csvs (if the excerpt is only written to a shard).
+
+    Returns
+    -------
+    meta_line : string
+        The line of metadata.csv describing the excerpt.
+    """
+    labels = excerpt_labels(dataset, rel_path, degraded, deg_num)
+    clean_path = labels["clean_csv_path"]
+    altered_path = labels["altered_csv_path"]
+    if write_csvs:
+        fileio.df_to_csv(excerpt, os.path.join(output_dir, clean_path))
+        if degraded is not None:
+            fileio.df_to_csv(degraded.to_df(), os.path.join(output_dir, altered_path))
+    return f"{altered_path},{labels['degraded']},{deg_num},{clean_path},{split}\n"
+
+
+def process_excerpt(
+    task, output_dir, degradation_kwargs, clean_prop, record_stats, write_csvs=True
+):
+    """
+    Degrade an excerpt as scheduled, and write it out. This depends only on
+    the given arguments, so excerpts can be processed in any order, and in
+    any process.
+
+    Parameters
+    ----------
+    task : tuple
+        The excerpt's (dataset, rel_path, excerpt, piece_rng, deg_order,
+        split), where rel_path is its csv path within its dataset directory,
+        and deg_order is the order in which to try degradations (see
+        degrade_excerpt).
+
+    output_dir : string
+        The base directory of the dataset.
+
+    degradation_kwargs : dict
+        The keyword arguments for each degradation, by name.
+
+    clean_prop : float
+        The proportion of clean excerpts. If 0, excerpts which could not be
+        degraded are not written.
+
+    record_stats : boolean
+        True to record the degradation calls (see mdtk.instrumentation).
+
+    write_csvs : boolean
+        False to not write the excerpt's csvs (see write_excerpt).
+
+    Returns
+    -------
+    meta_line : string
+        The line of metadata.csv describing the excerpt, or None if it was not
+        written.
+
+    deg_num : int
+        The id of the excerpt's degradation.
+
+    degraded : NoteArray
+        The degraded excerpt, or None if it was not degraded.
+
+    stats : DegradationStats
+        The recorded degradation calls, or None if record_stats is False.
+    """
+    dataset, rel_path, excerpt, piece_rng, deg_order, split = task
+    if record_stats:
+        instrumentation.enable()
+    degraded, deg_num = degrade_excerpt(
+        excerpt, piece_rng, deg_order, degradation_kwargs
+    )
+    stats = instrumentation.disable() if record_stats else None
+
+    if degraded is None and clean_prop == 0:
+        return None, deg_num, degraded, stats
+    meta_line = write_excerpt(
+        output_dir,
+        dataset,
+        rel_path,
+        excerpt,
+        degraded,
+        deg_num,
+        split,
+        write_csvs=write_csvs,
+    )
+    return meta_line, deg_num, degraded, stats
+
+
+class ShardWriter:
+    """A ShardWriter collects the excerpts of one split of a dataset, and
+    writes them out to a new shard (see fileio.write_acme_shard) whenever
+    enough have been collected."""
+
+    def __init__(self, output_dir, split, shard_size):
+        """
+        Create a new ShardWriter.
+
+        Parameters
+        ----------
+        output_dir : string
+            The base directory of the dataset.
+
+        split : string
+            The name of the split. Its shards are named {split}-{number}.npz.
+
+        shard_size : int
+            The number of excerpts in each shard (apart from the last).
+        """
+        assert shard_size >= 1, "shard_size must be at least 1."
+        self.output_dir = output_dir
+        self.split = split
+        self.shard_size = shard_size
+        # Continue the numbering of any existing shards (of a resumed build)
+        existing = fileio.acme_shard_paths(output_dir, split)
+        self.shard_num = len(existing)
+        if existing:
+            name = os.path.basename(existing[-1])
+            self.shard_num = int(name[len(split) + 1 : -4]) + 1
+        self.excerpts = []
+
+    def add(self, excerpt, degraded, labels, info):
+        """
+        Add an excerpt to the next shard, and write it out if it is full.
+
+        Parameters
+        ----------
+        excerpt : pd.DataFrame
+            The clean excerpt.
+
+        degraded : NoteArray
+            The degraded excerpt, or None if it was not degraded.
+
+        labels : dict
+            The excerpt's labels (see excerpt_labels).
+
+        info : tuple
+            Any other information about the excerpt, to be returned once it
+            has been written.
+
+        Returns
+        -------
+        written : list(tuple)
+            The info of each excerpt written out by this call (if the shard was
+            full), followed by its shard's path (relative to output_dir) and
+            its index within the shard.
+        """
+        clean = NoteArray.from_df(excerpt)
+        altered = clean if degraded is None else degraded
+        self.excerpts.append((clean, altered, labels, info))
+        if len(self.excerpts) >= self.shard_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Write the collected excerpts out to a new shard, if there are any.
+
+        Returns
+        -------
+        written : list(tuple)
+            The info of each excerpt written out, followed by its shard's path
+            (relative to output_dir) and its index within the shard.
+        """
+        if not self.excerpts:
+            return []
+        shard_path = os.path.join(
+            fileio.SHARD_DIR, f"{self.split}-{self.shard_num:05d}.npz"
+        )
+        clean, altered, labels, infos = zip(*self.excerpts)
+        fileio.write_acme_shard(
+            os.path.join(self.output_dir, shard_path),
+            NoteBatch.from_excerpts(clean),
+            NoteBatch.from_excerpts(altered),
+            {name: [label[name] for label in labels] for name in fileio.SHARD_LABELS},
+        )
+        self.shard_num += 1
+        self.excerpts = []
+        return [info + (shard_path, index) for index, info in enumerate(infos)]
+
+
+def read_manifest(manifest_path):
+    """
+    Read a build manifest, as written by make_dataset.py.
+
+    The manifest is a json lines file. Its first line is the configuration
+    of the build, and each other line is the record of one input file, added
+    as soon as that file has been processed.
+
+    Parameters
+    ----------
+    manifest_path : string
+        The path of the manifest.
+
+    Returns
+    -------
+    config : dict
+        The configuration of the build.
+
+    records : dict
+        The record of each processed input file, by (dataset, relative_path),
+        in the order they were processed.
+    """
+    with open(manifest_path, "r") as file:
+        lines = file.read().splitlines()
+    config = json.loads(lines[0])
+    records = {}
+    for line in lines[1:]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # The build was interrupted while writing this record
+            break
+        records[(record["dataset"], record["path"])] = record
+    return config, records
+
+
+def start_manifest(manifest_path, config, records):
+    """
+    Write a build manifest with the given configuration and records, and open
+    it to add more records. The manifest is written to a temporary file first,
+    so that an existing manifest is not lost if this is interrupted.
+
+    Parameters
+    ----------
+    manifest_path : string
+        The path of the manifest.
+
+    config : dict
+        The configuration of the build.
+
+    records : dict
+        The records of input files which have already been processed (see
+        read_manifest).
+
+    Returns
+    -------
+    manifest_file : file
+        The manifest, open for appending.
+    """
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(json.dumps(config) + "\n")
+        for record in records.values():
+            file.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, manifest_path)
+    return open(manifest_path, "a")
+
+
+def split_processed(filenames, rel_start, dataset, records, num_excerpts=1):
+    """
+    Separate the input files which were already processed (in a build which
+    is being resumed) from the new ones. A file was processed only if every
+    one of its excerpts was.
+
+    Parameters
+    ----------
+    filenames : list(string)
+        The paths of the input files of a dataset.
+
+    rel_start : int
+        The index in each path at which the path relative to its dataset
+        begins.
+
+    dataset : string
+        The name of the dataset.
+
+    records : dict
+        The records of processed input files (see read_manifest).
+
+    num_excerpts : int
+        The number of excerpts taken from each file.
+
+    Returns
+    -------
+    new_filenames : list(string)
+        The paths of the files which have not been processed.
+
+    processed_data : list(tuple)
+        Entries for input_data for the excerpts of the files which were
+        processed (apart from those which failed to load), without the
+        excerpts themselves. These keep the shuffled order of input_data the
+        same as in the original build.
+    """
+    new_filenames = []
+    processed_data = []
+    for filename in filenames:
+        rel_path = filename[rel_start:]
+        keys = [
+            (dataset, excerpt_rel_path(rel_path, index, num_excerpts))
+            for index in range(num_excerpts)
+        ]
+        if not all(key in records for key in keys):
+            new_filenames.append(filename)
+            continue
+        for key in keys:
+            if records[key]["status"] != "load_failed":
+                processed_data.append((dataset, key[1], filename, None, None))
+    return new_filenames, processed_data
+
+
+def write_record(manifest_file, records, dataset, rel_path, file_path, status, **kw):
+    """
+    Record that an input file (or one of its excerpts) has been processed in
+    a build manifest.
+
+    Parameters
+    ----------
+    manifest_file : file
+        The open manifest file.
+
+    records : dict
+        The records read from the manifest (see read_manifest), to which the
+        new record is also added.
+
+    dataset : string
+        The name of the file's dataset.
+
+    rel_path : string
+        The path of the file within its dataset directory, or of the excerpt
+        (see excerpt_rel_path).
+
+    file_path : string
+        The full path of the file.
+
+    status : string
+        What happened to the file: "done" (it was written out), "skipped" (it
+        could not be degraded, and clean excerpts were not requested),
+        "no_excerpt" (no valid excerpt was found), or "load_failed".
+
+    kw
+        Additional fields of the record: meta (the line of metadata.csv
+        describing a written excerpt), degradation_id, split_id, and
+        planned_degradation_id (with --balanced-schedule).
+    """
+    record = {
+        "dataset": dataset,
+        "path": rel_path,
+        "file": file_path,
+        "key": [dataset, f"{rel_path[:-3]}csv"],
+        "status": status,
+        **kw,
+    }
+    records[(dataset, rel_path)] = record
+    manifest_file.write(json.dumps(record) + "\n")
+    manifest_file.flush()
+
+
+def add_input_data(
+    input_data,
+    manifest_file,
+    records,
+    dataset,
+    file_path,
+    rel_start,
+    excerpts,
+    num_excerpts,
+):
+    """
+    Add the excerpts loaded from an input file to input_data, or record that
+    it could not be loaded.
+
+    Parameters
+    ----------
+    input_data : list(tuple)
+        The (dataset, relative_path, full_path, excerpt, excerpt_rng) of every
+        excerpt, to which the file's excerpts are added.
+
+    manifest_file : file
+        The open manifest file.
+
+    records : dict
+        The records of processed input files (see read_manifest).
+
+    dataset : string
+        The name of the file's dataset.
+
+    file_path : string
+        The full path of the file.
+
+    rel_start : int
+        The index in file_path at which its path relative to its dataset
+        begins.
+
+    excerpts : list(tuple)
+        The file's excerpts, as returned by load_excerpt, or None if the file
+        could not be loaded.
+
+    num_excerpts : int
+        The number of excerpts taken from each file.
+    """
+    rel_path = file_path[rel_start:]
+    for index in range(num_excerpts):
+        excerpt_path = excerpt_rel_path(rel_path, index, num_excerpts)
+        if excerpts is not None:
+            input_data.append((dataset, excerpt_path, file_path) + excerpts[index])
+        elif (dataset, excerpt_path) not in records:
+            write_record(
+                manifest_file, records, dataset, excerpt_path, file_path, "load_failed"
+            )
+
+
+def write_done_record(
+    record_args,
+    meta_line,
+    deg_num,
+    split_num,
+    planned_num=None,
+    shard_path=None,
+    shard_index=None,
+):
+    """
+    Record that an input file's excerpt has been written in a build manifest.
+
+    Parameters
+    ----------
+    record_args : tuple
+        The manifest_file, records, dataset, rel_path, and file_path arguments
+        of write_record.
+
+    meta_line : string
+        The line of metadata.csv describing the excerpt.
+
+    deg_num : int
+        The id of the excerpt's degradation.
+
+    split_num : int
+        The id of the excerpt's split.
+
+    planned_num : int
+        The id of the degradation the excerpt was planned to get, with
+        --balanced-schedule (see balanced_schedule). None otherwise.
+
+    shard_path : string
+        The path of the shard the excerpt was written to, relative to the
+        dataset's base directory. None if it was only written to csvs.
+
+    shard_index : int
+        The index of the excerpt within its shard.
+    """
+    extra_kw = {}
+    if planned_num is not None:
+        extra_kw["planned_degradation_id"] = int(planned_num)
+    if shard_path is not None:
+        extra_kw.update(shard=shard_path, shard_index=int(shard_index))
+    write_record(
+        *record_args,
+        "done",
+        meta=meta_line,
+        degradation_id=int(deg_num),
+        split_id=int(split_num),
+        **extra_kw,
+    )
+
+
+def remove_unrecorded_shards(output_dir, records):
+    """
+    Delete the shards of a dataset which are not referenced by any record of
+    its build manifest. These were written by an interrupted build just before
+    their excerpts were recorded, and their excerpts will be written again.
+
+    Parameters
+    ----------
+    output_dir : string
+        The base directory of the dataset.
+
+    records : dict
+        The records of processed input files (see read_manifest).
+
+    Returns
+    -------
+    num_removed : int
+        The number of shards deleted.
+    """
+    recorded = {
+        os.path.join(output_dir, record["shard"])
+        for record in records.values()
+        if "shard" in record
+    }
+    unrecorded = [
+        path for path in fileio.acme_shard_paths(output_dir) if path not in recorded
+    ]
+    for path in unrecorded:
+        os.remove(path)
+    return len(unrecorded)
+
+
+def select_build_part(filenames, rel_start, dataset, seed, part_index, num_parts):
+    """
+    Get the input files which belong to one part of a multi-node build (see
+    --shard-index and --num-shards). Each file is assigned to a random part,
+    keyed by the seed and its dataset and path, so the parts are disjoint and
+    do not change when files are added.
+
+    Parameters
+    ----------
+    filenames : list(string)
+        The paths of the input files of a dataset.
+
+    rel_start : int
+        The index in each path at which the path relative to its dataset
+        begins.
+
+    dataset : string
+        The name of the dataset.
+
+    seed : int
+        The master random seed.
+
+    part_index : int
+        The index of the part to get the files of.
+
+    num_parts : int
+        The number of parts the build is split into.
+
+    Returns
+    -------
+    part_filenames : list(string)
+        The paths of the files which belong to the given part, in order.
+    """
+    if num_parts == 1:
+        return filenames
+    part_filenames = []
+    for filename in filenames:
+        rng = derive_rng(seed, "part", dataset, f"{filename[rel_start:-3]}csv")
+        if rng.integers(num_parts) == part_index:
+            part_filenames.append(filename)
+    return part_filenames
+
+
+def write_metadata(output_dir, records, sharded):
+    """
+    Write a dataset's metadata.csv, listing every written excerpt in the order
+    they were written (and with shards, where each was written).
+
+    Parameters
+    ----------
+    output_dir : string
+        The base directory of the dataset.
+
+    records : dict
+        The records of the processed input files (see read_manifest).
+
+    sharded : boolean
+        True if the excerpts were written to shards.
+    """
+    with open(os.path.join(output_dir, "metadata.csv"), "w") as meta_file:
+        if sharded:
+            meta_file.write(f"{META_HEADER[:-1]},{META_SHARD_HEADER}\n")
+        else:
+            meta_file.write(META_HEADER)
+        for record in records.values():
+            if record["status"] != "done":
+                continue
+            if sharded:
+                meta_file.write(
+                    f"{record['meta'][:-1]},{record['shard']},"
+                    f"{record['shard_index']}\n"
+                )
+            else:
+                meta_file.write(record["meta"])
+
+
+def copy_tree(src_dir, dst_dir):
+    """
+    Copy every file in a directory tree into another, which may exist already.
+
+    Parameters
+    ----------
+    src_dir : string
+        The directory to copy. Nothing is copied if it does not exist.
+
+    dst_dir : string
+        The directory to copy it to. Any nested directories are created.
+    """
+    for dir_path, _, file_names in os.walk(src_dir):
+        out_dir = os.path.join(dst_dir, os.path.relpath(dir_path, src_dir))
+        os.makedirs(out_dir, exist_ok=True)
+        for file_name in file_names:
+            shutil.copy2(os.path.join(dir_path, file_name), out_dir)
+
+
+def merge_datasets(input_dirs, output_dir):
+    """
+    Merge the outputs of every part of a multi-node build (built with
+    --shard-index and --num-shards) into a single dataset, with a single
+    metadata.csv, degradation_ids.csv, and manifest. Each part balances its
+    own degradations and splits, so the merged dataset is balanced as a
+    single-node build would be.
+
+    Parameters
+    ----------
+    input_dirs : list(string)
+        The output directories of the parts, in any order.
+
+    output_dir : string
+        The directory to write the merged dataset to. The excerpts are copied
+        into it, and the shards of each split renumbered, in order of part.
+
+    Returns
+    -------
+    records : dict
+        The records of every input file processed by the parts (see
+        read_manifest).
+    """
+    parts = []
+    for input_dir in input_dirs:
+        if not os.path.exists(os.path.join(input_dir, "metadata.csv")):
+            raise ValueError(f"The build in {input_dir} has not finished.")
+        config, records = read_manifest(os.path.join(input_dir, MANIFEST_NAME))
+        parts.append((config["shard_index"], input_dir, config, records))
+    parts.sort(key=lambda part: part[0])
+
+    # Every part must have been built with the same arguments
+    base_config = dict(parts[0][2], shard_index=0)
+    for _, input_dir, config, _ in parts:
+        if dict(config, shard_index=0) != base_config:
+            raise ValueError(
+                f"{input_dir} was built with different arguments than {parts[0][1]}."
+            )
+    indices = [part[0] for part in parts]
+    if indices != list(range(base_config["num_shards"])):
+        raise ValueError(
+            f"Expected one output of each of the {base_config['num_shards']} "
+            f"shards, but got shards {indices}."
+        )
+
+    os.makedirs(output_dir, exist_ok=True)
+    shutil.copyfile(
+        os.path.join(parts[0][1], "degradation_ids.csv"),
+        os.path.join(output_dir, "degradation_ids.csv"),
+    )
+    merged = {}
+    shard_counts = {}
+    for _, input_dir, _, records in tqdm(parts, desc="Merging datasets"):
+        for out_subdir in ["clean", "altered"]:
+            copy_tree(
+                os.path.join(input_dir, out_subdir),
+                os.path.join(output_dir, out_subdir),
+            )
+        shard_paths = {}
+        for key, record in records.items():
+            if key in merged:
+                raise ValueError(f"{record['file']} was processed by two shards.")
+            if "shard" in record:
+                if record["shard"] not in shard_paths:
+                    split = os.path.basename(record["shard"]).rsplit("-", 1)[0]
+                    shard_num = shard_counts.get(split, 0)
+                    shard_counts[split] = shard_num + 1
+                    shard_paths[record["shard"]] = os.path.join(
+                        fileio.SHARD_DIR, f"{split}-{shard_num:05d}.npz"
+                    )
+                    os.makedirs(
+                        os.path.join(output_dir, fileio.SHARD_DIR), exist_ok=True
+                    )
+                    shutil.copyfile(
+                        os.path.join(input_dir, record["shard"]),
+                        os.path.join(output_dir, shard_paths[record["shard"]]),
+                    )
+                record = dict(record, shard=shard_paths[record["shard"]])
+            merged[key] = record
+
+    # The merged dataset can be resumed as a single-node build
+    config = dict(base_config, num_shards=1)
+    start_manifest(os.path.join(output_dir, MANIFEST_NAME), config, merged).close()
+    write_metadata(output_dir, merged, config["output_format"] != "csv")
+    return merged
+
+
+def clear_output_dir(output_dir, prompt=True, verbose=False):
+    """
+    Delete an output directory, if it exists, before a dataset is written to
+    it.
+
+    Parameters
+    ----------
+    output_dir : string
+        The directory to delete.
+
+    prompt : bool
+        Prompt the user before deleting.
+
+    verbose : bool
+        Verbose printing.
+
+    Returns
+    -------
+    clear_ok : bool
+        True if the directory does not exist (or no longer does). False if it
+        could not be deleted, or the user chose not to delete it.
+    """
+    if not os.path.exists(output_dir):
+        return True
+    if verbose:
+        print(f"Clearing stale data from {output_dir}.")
+
+    response = None
+    if prompt:
+        response = input(f"Delete output_dir ({output_dir})? [y/N]: ")
+
+    if (not prompt) or response in ["y", "ye", "yes"]:
+        try:
+            shutil.rmtree(output_dir)
+        except Exception:
+            print("Could not delete output dir. Please do so manually.")
+            return False
+    else:
+        print(
+            "You must specify an empty directory as --output-dir, or specify a "
+            "path which doesn't yet exist"
+        )
+        return False
+    return True
+
+
+def parse_formats(format_names):
+    """
+    Check the names of the formats to create corpora of.
+
+    Parameters
+    ----------
+    format_names : list(string)
+        The names given to --formats, or ["none"] for no formats.
+
+    Returns
+    -------
+    formats : list(string)
+        The names of the formats to create.
+    """
+    if len(format_names) == 1 and format_names[0].lower() == "none":
+        return []
+    assert all([name in FORMATTERS.keys() for name in format_names]), (
+        f"all provided formats {format_names} must be in the "
+        "list of available formats {list(FORMATTERS.keys())}"
+    )
+    return format_names
+
+
+def parse_merge_args(args_input=None):
+    """Convenience function for parsing the command line args of merge"""
+    parser = argparse.ArgumentParser(
+        prog="make_dataset.py merge",
+        description="Merge the outputs of every part of a multi-node build "
+        "(made with --shard-index and --num-shards) into a single dataset.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "input_dirs",
+        metavar="input_dir",
+        nargs="+",
+        help="the output directories of the parts of the build.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=str,
+        default=os.path.join(os.getcwd(), "acme"),
+        help="the directory to write the merged dataset to.",
+    )
+    parser.add_argument(
+        "--formats",
+        metavar="format",
+        help="Create custom versions of the merged acme data, as in "
+        f"make_dataset.py. Choices are {list(FORMATTERS.keys())}. Specify none "
+        "to avoid creation",
+        nargs="*",
+        default=list(FORMATTERS.keys()),
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Verbose printing."
+    )
+    parser.add_argument(
+        "--no-prompt", action="store_true", help="Dont prompt user for response."
+    )
+    return parser.parse_args(args=args_input)
+
+
 def parse_args(args_input=None):
     """Convenience function for parsing user supplied command line args"""
     parser = argparse.ArgumentParser(
@@ -195,6 +1334,21 @@ def parse_args(args_input=None):
         default=10,
         help="The minimum number of notes required for an excerpt to be valid.",
     )
+    parser.add_argument(
+        "--excerpts-per-piece",
+        metavar="K",
+        type=int,
+        default=1,
+        help="The number of excerpts to take from each piece. With more than "
+        "1, each excerpt is written as its piece's path with _{index} added "
+        "(e.g. piece_0.csv), and pieces with fewer valid excerpts give fewer.",
+    )
+    parser.add_argument(
+        "--overlapping-excerpts",
+        action="store_true",
+        help="Allow the excerpts of a piece to share notes, with "
+        "--excerpts-per-piece. By default, they do not overlap.",
+    )
     parser.add_argument(
         "--degradation-kwargs",
         metavar="json_file_or_string",
@@ -233,11 +1387,105 @@ def parse_args(args_input=None):
         "train, validation, and test sets respectively.",
         default=[0.8, 0.1, 0.1],
     )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="How to write the excerpts: csv writes one csv file per clean "
+        "and altered excerpt; shards packs the excerpts of each split into a "
+        "few npz files in the shards directory, which are much faster to "
+        "write, read, and copy for large datasets (and can be exported to the "
+        "csv layout with mdtk.fileio.acme_shards_to_csvs); both writes both.",
+    )
+    parser.add_argument(
+        "--shard-size",
+        metavar="N",
+        type=int,
+        default=10000,
+        help="The number of excerpts in each shard with --output-format "
+        "shards or both.",
+    )
     parser.add_argument(
         "--seed",
         type=int,
         default=None,
-        help="The numpy seed to use when creating the dataset.",
+        help="The random seed to use when creating the dataset. Each piece's "
+        "excerpt and degradation depend only on this seed and the piece's "
+        "dataset and path.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The number of processes to load (and parse) the input files "
+        "with, and also to degrade and write the excerpts with if "
+        "--balanced-schedule is given. The created dataset is identical for "
+        "any number of workers.",
+    )
+    parser.add_argument(
+        "--balanced-schedule",
+        action="store_true",
+        help="Plan every excerpt's degradation and split up front to match "
+        "the goal distributions, rather than adapting them to which "
+        "degradations have succeeded so far. The distributions may be "
+        "slightly less exact, but degradation and writing can then be run "
+        "with --workers processes, and the created dataset is identical for "
+        "any number of workers.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the build in --output-dir (as recorded in its "
+        "manifest.jsonl), rather than clearing it and starting again. Input "
+        "files which were already processed are skipped, and their excerpts "
+        "and metadata are kept as they are, so this can also be used to add "
+        "new input files to an existing dataset. The arguments which affect "
+        "the generated data must be the same as those of the original build.",
+    )
+    parser.add_argument(
+        "--num-shards",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Split the build into N parts, to be run on different machines "
+        "with the same arguments (and input files) apart from --shard-index "
+        "and --output-dir. Each part processes a disjoint, random subset of "
+        "the input files, and the parts' outputs are then combined with "
+        "`make_dataset.py merge -o output_dir part_dir [part_dir ...]`.",
+    )
+    parser.add_argument(
+        "--shard-index",
+        metavar="i",
+        type=int,
+        default=0,
+        help="The part of the build to run (from 0 to N-1) with --num-shards.",
+    )
+    parser.add_argument(
+        "--parse-cache-dir",
+        default=DEFAULT_PARSE_CACHE_PATH,
+        help="The directory of the cache of parsed input files. Each input "
+        "file is parsed only once, unless its contents change.",
+    )
+    parser.add_argument(
+        "--parse-cache-size",
+        type=float,
+        default=2048,
+        help="The maximum size of the parse cache, in MB. The least recently "
+        "used files are removed from it after loading once it is larger.",
+    )
+    parser.add_argument(
+        "--no-parse-cache",
+        action="store_true",
+        help="Parse every input file, without reading or writing the parse "
+        "cache.",
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="json_file",
+        default=None,
+        help="Record the wall time, tries, input size, and failure causes of "
+        "every degradation call, and write them to this json file. By "
+        "default, nothing is recorded.",
     )
     parser.add_argument(
         "--clean",
@@ -257,6 +1505,30 @@ def parse_args(args_input=None):
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "merge":
+        ARGS = parse_merge_args(sys.argv[2:])
+        formats = parse_formats(ARGS.formats)
+        if not clear_output_dir(
+            ARGS.output_dir, prompt=not ARGS.no_prompt, verbose=ARGS.verbose
+        ):
+            sys.exit(1)
+        records = merge_datasets(ARGS.input_dirs, ARGS.output_dir)
+        for f in formats:
+            create_corpus_csvs(ARGS.output_dir, FORMATTERS[f])
+
+        with open(os.path.join(ARGS.output_dir, "degradation_ids.csv"), "r") as file:
+            deg_choices = [line.strip().split(",", 1)[1] for line in file][1:]
+        deg_counts = np.zeros(len(deg_choices))
+        for record in records.values():
+            if record["status"] == "done":
+                deg_counts[record["degradation_id"]] += 1
+        print(f'\n{10*"="} Finished! {10*"="}\n')
+        print("Count of degradations:")
+        for deg_name, count in zip(deg_choices, deg_counts):
+            print(f"\t* {deg_name}: {int(count)}")
+        print(f"\nYou will find the merged data at {ARGS.output_dir}")
+        sys.exit(0)
+
     ARGS = parse_args()
 
     if ARGS.clean:
@@ -265,13 +1537,23 @@ if __name__ == "__main__":
         )
         sys.exit(0 if clean_ok else 1)
 
-    if ARGS.seed is None:
-        seed = np.random.randint(0, 2 ** 32)
+    # Read the manifest of the build being resumed
+    manifest_path = os.path.join(ARGS.output_dir, MANIFEST_NAME)
+    resuming = ARGS.resume and os.path.exists(manifest_path)
+    records = {}
+    if resuming:
+        manifest_config, records = read_manifest(manifest_path)
+        print(f"Resuming build in {ARGS.output_dir} ({len(records)} files done).")
+
+    if ARGS.seed is None and resuming:
+        seed = manifest_config["seed"]
+        print(f"Setting random seed to {seed}, as in the resumed build.")
+    elif ARGS.seed is None:
+        seed = int(np.random.default_rng().integers(0, 2 ** 32))
         print(f"No random seed supplied. Setting to {seed}.")
     else:
         seed = ARGS.seed
         print(f"Setting random seed to {seed}.")
-    np.random.seed(seed)
 
     # Load given degradation_kwargs
     degradation_kwargs = {}
@@ -323,34 +1605,91 @@ if __name__ == "__main__":
     assert (
         0 <= ARGS.clean_prop <= 1
     ), "--clean-prop must be between 0 and 1 (inclusive)."
+    assert ARGS.workers >= 1, "--workers must be at least 1."
+    assert ARGS.excerpts_per_piece >= 1, "--excerpts-per-piece must be at least 1."
+    assert ARGS.shard_size >= 1, "--shard-size must be at least 1."
+    assert ARGS.num_shards >= 1, "--num-shards must be at least 1."
+    assert (
+        0 <= ARGS.shard_index < ARGS.num_shards
+    ), "--shard-index must be between 0 and --num-shards - 1."
     assert min(ARGS.splits) >= 0, "--splits values must not be negative."
     assert sum(ARGS.splits) > 0, "Some --splits value must be positive."
 
     # Parse formats
-    if len(ARGS.formats) == 1 and ARGS.formats[0].lower() == "none":
-        formats = []
-    else:
-        assert all([name in FORMATTERS.keys() for name in ARGS.formats]), (
-            f"all provided formats {ARGS.formats} must be in the "
-            "list of available formats {list(FORMATTERS.keys())}"
+    formats = parse_formats(ARGS.formats)
+
+    # The arguments which affect the generated data. These must not change
+    # when a build is resumed.
+    build_config = json.loads(
+        json.dumps(
+            {
+                "seed": seed,
+                "degradations": list(ARGS.degradations),
+                "degradation_dist": [float(p) for p in ARGS.degradation_dist],
+                "clean_prop": ARGS.clean_prop,
+                "splits": [float(p) for p in ARGS.splits],
+                "excerpt_length": ARGS.excerpt_length,
+                "min_notes": ARGS.min_notes,
+                "excerpts_per_piece": ARGS.excerpts_per_piece,
+                "overlapping_excerpts": ARGS.overlapping_excerpts,
+                "degradation_kwargs": degradation_kwargs,
+                "balanced_schedule": ARGS.balanced_schedule,
+                "output_format": ARGS.output_format,
+                "num_shards": ARGS.num_shards,
+                "shard_index": ARGS.shard_index,
+            }
+        )
+    )
+    if resuming and build_config != manifest_config:
+        changed = [
+            key
+            for key in build_config
+            if build_config[key] != manifest_config.get(key)
+        ]
+        print(
+            f"Cannot resume the build in {ARGS.output_dir} with different "
+            f"arguments: {changed}. Use the original arguments, or a new "
+            "--output-dir.",
+            file=sys.stderr,
         )
-        formats = ARGS.formats
+        sys.exit(1)
 
-    # These will be tuples of (dataset, relative_path, full_path, note_df).
+    # These will be tuples of
+    # (dataset, relative_path, full_path, excerpt, piece_rng).
     # dataset: The name of the dataset the note_df is drawn from. This will be
     #          the excerpt's base directory within output/clean or
     #          output/altered in the generated ACME dataset.
     # relative_path: The relative path of the corresponding file, including
     #                basename, representing the excerpts path within its
-    #                dataset base directory.
+    #                dataset base directory. With --excerpts-per-piece, this
+    #                has the excerpt's index added (see excerpt_rel_path).
     # full_path: The full path to the input file. Used for printing errors.
-    # note_df: The cleaned note_df read from the input file with the given
-    #          input_kwargs.
+    # excerpt: The random excerpt taken from the cleaned note_df read from the
+    #          input file with the given input_kwargs (None if no valid
+    #          excerpt was found).
+    # piece_rng: The piece's random number generator, after taking the excerpt
+    #            (or with --excerpts-per-piece, the excerpt's own generator).
+    # Files which were already processed in a resumed build are included
+    # without their excerpt and piece_rng.
+    # Each excerpt is taken as soon as its piece is loaded, so that only the
+    # excerpts (not the full pieces) are held in memory. Each piece has its own
+    # generator, so this gives the same excerpts as taking them after shuffling.
     # This list will be sorted before shuffling, and the tuples are structured
     # in such a way that the sorting is identical to previous versions of this
     # script to ensure backwards compatability.
     input_data = []
     input_kwargs = {"single_track": True, "non_overlapping": True}
+    excerpt_kwargs = {
+        "min_notes": ARGS.min_notes,
+        "excerpt_length": ARGS.excerpt_length,
+        "first_onset_range": (0, 200),
+        "iterations": 10,
+    }
+    parse_cache = None
+    if not ARGS.no_parse_cache:
+        parse_cache = ParseCache(
+            ARGS.parse_cache_dir, max_bytes=int(ARGS.parse_cache_size * 1024 ** 2)
+        )
 
     # Instantiate downloaders =================================================
     OVERWRITE = None
@@ -377,35 +1716,23 @@ if __name__ == "__main__":
     }
 
     # Clear and set up output dir =============================================
-    if os.path.exists(ARGS.output_dir):
-        if ARGS.verbose:
-            print(f"Clearing stale data from {ARGS.output_dir}.")
-
-        response = None
-        if not ARGS.no_prompt:
-            response = input(f"Delete output_dir ({ARGS.output_dir})? [y/N]: ")
-
-        if (ARGS.no_prompt) or response in ["y", "ye", "yes"]:
-            try:
-                shutil.rmtree(ARGS.output_dir)
-            except Exception:
-                print("Could not delete output dir. Please do so manually.")
-                sys.exit(1)
-        else:
-            print(
-                "You must specify an empty directory as --output-dir, or specify a "
-                "path which doesn't yet exist"
-            )
-            sys.exit(1)
+    if not resuming and not clear_output_dir(
+        ARGS.output_dir, prompt=not ARGS.no_prompt, verbose=ARGS.verbose
+    ):
+        sys.exit(1)
 
+    write_csvs = ARGS.output_format in ["csv", "both"]
     os.makedirs(ARGS.output_dir, exist_ok=True)
-    for out_subdir in ["clean", "altered"]:
+    for out_subdir in ["clean", "altered"] if write_csvs else []:
         output_dirs = [
             os.path.join(ARGS.output_dir, out_subdir, name) for name in ds_names
         ]
         for path in output_dirs:
             os.makedirs(path, exist_ok=True)
 
+    # Each input file is recorded in the manifest as soon as it is processed
+    manifest_file = start_manifest(manifest_path, build_config, records)
+
     # Load data from downloaders ==============================================
     print("Loading data from downloaders, this could take a while...")
     for dataset in downloader_dict:
@@ -436,15 +1763,43 @@ if __name__ == "__main__":
             )
             sys.exit(1)
 
-        for filename in tqdm(
-            glob(os.path.join(output_path, "**", f"*.{ext}"), recursive=True),
+        filenames = glob(os.path.join(output_path, "**", f"*.{ext}"), recursive=True)
+        rel_start = dataset_base_len + 5
+        filenames = select_build_part(
+            filenames, rel_start, dataset, seed, ARGS.shard_index, ARGS.num_shards
+        )
+        filenames, processed_data = split_processed(
+            filenames, rel_start, dataset, records, ARGS.excerpts_per_piece
+        )
+        input_data.extend(processed_data)
+        results = parallel_map(
+            load_excerpt,
+            filenames,
+            {
+                "load_func": input_func,
+                "load_kwargs": input_kwargs,
+                "rel_start": rel_start,
+                "dataset": dataset,
+                "seed": seed,
+                "excerpt_kwargs": excerpt_kwargs,
+                "cache": parse_cache,
+                "num_excerpts": ARGS.excerpts_per_piece,
+                "overlapping": ARGS.overlapping_excerpts,
+            },
+            workers=ARGS.workers,
             desc=f"Loading data from {dataset}",
-        ):
-
-            note_df = input_func(filename, **input_kwargs)
-            if note_df is not None:
-                rel_path = filename[(dataset_base_len + 5) :]
-                input_data.append((dataset, rel_path, filename, note_df))
+        )
+        for filename, result in zip(filenames, results):
+            add_input_data(
+                input_data,
+                manifest_file,
+                records,
+                dataset,
+                filename,
+                rel_start,
+                result,
+                ARGS.excerpts_per_piece,
+            )
 
     # Load user data ==========================================================
     for data_type in ["midi", "csv"]:
@@ -466,23 +1821,58 @@ if __name__ == "__main__":
 
             if ARGS.recursive:
                 path = os.path.join(path, "**")
-            for filepath in tqdm(
-                glob(os.path.join(path, f"*.{ext}"), recursive=ARGS.recursive),
+            filepaths = glob(os.path.join(path, f"*.{ext}"), recursive=ARGS.recursive)
+            filepaths = select_build_part(
+                filepaths,
+                dataset_base_len,
+                dataset,
+                seed,
+                ARGS.shard_index,
+                ARGS.num_shards,
+            )
+            filepaths, processed_data = split_processed(
+                filepaths, dataset_base_len, dataset, records, ARGS.excerpts_per_piece
+            )
+            input_data.extend(processed_data)
+            results = parallel_map(
+                load_excerpt,
+                filepaths,
+                {
+                    "load_func": df_load_func,
+                    "load_kwargs": input_kwargs,
+                    "rel_start": dataset_base_len,
+                    "dataset": dataset,
+                    "seed": seed,
+                    "excerpt_kwargs": excerpt_kwargs,
+                    "cache": parse_cache,
+                    "num_excerpts": ARGS.excerpts_per_piece,
+                    "overlapping": ARGS.overlapping_excerpts,
+                },
+                workers=ARGS.workers,
                 desc=f"Loading user {data_type} from {path}",
-            ):
+            )
+            for filepath, result in zip(filepaths, results):
+                add_input_data(
+                    input_data,
+                    manifest_file,
+                    records,
+                    dataset,
+                    filepath,
+                    dataset_base_len,
+                    result,
+                    ARGS.excerpts_per_piece,
+                )
 
-                note_df = df_load_func(filepath, **input_kwargs)
-                if note_df is not None:
-                    rel_path = filepath[dataset_base_len:]
-                    input_data.append((dataset, rel_path, filepath, note_df))
+    if parse_cache is not None:
+        num_evicted = parse_cache.evict()
+        if ARGS.verbose and num_evicted > 0:
+            print(f"Removed {num_evicted} files from the parse cache.")
 
     # All data is loaded. Sort and shuffle. ===================================
     # output to output_dir/clean/dataset_name/filename.csv
     # The reason for this is we know there will be no filename duplicates
     input_data.sort()
-    np.random.shuffle(input_data)  # This is important for join_notes
-
-    meta_file = open(os.path.join(ARGS.output_dir, "metadata.csv"), "w")
+    derive_rng(seed, "shuffle").shuffle(input_data)  # Important for join_notes
 
     # Perform degradations and write degraded data to output ==================
     # output to output_dir/degraded/dataset_name/filename.csv
@@ -528,103 +1918,208 @@ if __name__ == "__main__":
     # the goal distribution. We do the same for splits.
     deg_counts = np.zeros(nr_degs)
     split_counts = np.zeros(nr_splits)
+    for record in records.values():
+        if record["status"] == "done":
+            deg_counts[record["degradation_id"]] += 1
+            split_counts[record["split_id"]] += 1
+
+    stats = None
+    if ARGS.stats is not None:
+        stats = instrumentation.DegradationStats()
+
+    # With shards, each excerpt is recorded in the manifest only once its shard
+    # has been written. Otherwise, it is recorded as soon as it is written.
+    shard_writers = None
+    if ARGS.output_format != "csv":
+        remove_unrecorded_shards(ARGS.output_dir, records)
+        shard_writers = {
+            split: ShardWriter(ARGS.output_dir, split, ARGS.shard_size)
+            for split in split_names
+        }
 
-    meta_file.write("altered_csv_path,degraded,degradation_id,clean_csv_path,split\n")
-    for i, data in enumerate(tqdm(input_data, desc="Degrading data")):
-        dataset, rel_path, file_path, note_df = data
-        rel_path = f"{rel_path[:-3]}csv"
-        # First, get the degradation order for this iteration.
-        # Get the current distribution of degradations
-        if np.sum(deg_counts) == 0:  # First iteration, set to uniform
-            current_deg_dist = np.ones(nr_degs) / nr_degs
-            current_split_dist = np.ones(nr_splits) / nr_splits
-        else:
-            current_deg_dist = deg_counts / np.sum(deg_counts)
-            current_split_dist = split_counts / np.sum(split_counts)
-
-        # Grab an excerpt from this df
-        excerpt = get_random_excerpt(
-            note_df,
-            min_notes=ARGS.min_notes,
-            excerpt_length=ARGS.excerpt_length,
-            first_onset_range=(0, 200),
-            iterations=10,
-        )
-
-        # If no valid excerpt was found, skip this piece
-        if excerpt is None:
-            logging.warning(
-                "Unable to find valid excerpt from file "
-                f"{file_path}. Lengthen --excerpt-length or "
-                "lower --min-notes. Skipping.",
+    if not ARGS.balanced_schedule:
+        if stats is not None:
+            instrumentation.enable(stats)
+
+        for data in tqdm(input_data, desc="Degrading data"):
+            dataset, rel_path, file_path, excerpt, piece_rng = data
+            if (dataset, rel_path) in records:
+                continue
+            record_args = (manifest_file, records, dataset, rel_path, file_path)
+            rel_path = f"{rel_path[:-3]}csv"
+
+            # If no valid excerpt was found, skip this piece
+            if excerpt is None:
+                logging.warning(
+                    "Unable to find valid excerpt from file "
+                    f"{file_path}. Lengthen --excerpt-length or "
+                    "lower --min-notes. Skipping.",
+                )
+                write_record(*record_args, "no_excerpt")
+                continue
+
+            # Try degradations in reverse order of the difference between
+            # their current distribution and their desired distribution.
+            # Calculate split in the same way (but only save the first).
+            deg_order = priority_order(goal_deg_dist, deg_counts, deg_choices)
+            split_name, split_num = priority_order(
+                split_props, split_counts, split_names
+            )[0]
+            degraded, deg_num = degrade_excerpt(
+                excerpt, piece_rng, deg_order, degradation_kwargs
             )
-            continue
 
-        # Try degradations in reverse order of the difference between
-        # their current distribution and their desired distribution.
-        diffs = goal_deg_dist - current_deg_dist
-        degs_sorted = sorted(zip(diffs, deg_choices, list(range(len(deg_choices)))))[
-            ::-1
-        ]
+            # Write data
+            if not (degraded is None and ARGS.clean_prop == 0):
+                # Update counts
+                deg_counts[deg_num] += 1
+                split_counts[split_num] += 1
+                meta_line = write_excerpt(
+                    ARGS.output_dir,
+                    dataset,
+                    rel_path,
+                    excerpt,
+                    degraded,
+                    deg_num,
+                    split_name,
+                    write_csvs=write_csvs,
+                )
+                info = (record_args, meta_line, deg_num, split_num, None)
+                if shard_writers is None:
+                    write_done_record(*info)
+                else:
+                    labels = excerpt_labels(dataset, rel_path, degraded, deg_num)
+                    for written in shard_writers[split_name].add(
+                        excerpt, degraded, labels, info
+                    ):
+                        write_done_record(*written)
+            else:
+                logging.warning(
+                    "Unable to degrade chosen excerpt from "
+                    f"{file_path} and no clean excerpts requested."
+                    " Skipping.",
+                )
+                write_record(*record_args, "skipped")
 
-        # Calculate split in the same way (but only save the first)
-        split_diffs = split_props - current_split_dist
-        _, split_name, split_num = sorted(
-            zip(split_diffs, split_names, list(range(nr_splits)))
-        )[-1]
+        instrumentation.disable()
 
-        # Make default labels for no degradation
-        clean_path = os.path.join("clean", dataset, rel_path)
-        altered_path = clean_path
-        deg_binary = 0
-
-        # Try to perform a degradation
-        degraded = None
-        for diff, deg_name, deg_num in degs_sorted:
-            # Break for no degradation
-            if deg_name == "none":
-                break
-
-            # Try the degradation
-            deg_fun = degradations.DEGRADATIONS[deg_name]
-            deg_fun_kwargs = degradation_kwargs[deg_name]  # degradation_kwargs
-            # at top of main call
-            logging.disable(logging.WARNING)
-            degraded = deg_fun(excerpt, **deg_fun_kwargs)
-            logging.disable(logging.NOTSET)
-
-            if degraded is not None:
-                # Update labels
-                deg_binary = 1
-                altered_path = os.path.join("altered", dataset, rel_path)
-
-                # Write degraded csv
-                altered_outpath = os.path.join(ARGS.output_dir, altered_path)
-                fileio.df_to_csv(degraded, altered_outpath)
-                break
-
-        # Write data
-        if not (degraded is None and ARGS.clean_prop == 0):
-            # Update counts
-            deg_counts[deg_num] += 1
-            split_counts[split_num] += 1
-
-            # Write clean csv
-            clean_outpath = os.path.join(ARGS.output_dir, clean_path)
-            fileio.df_to_csv(excerpt, clean_outpath)
-
-            # Write metadata
-            meta_file.write(
-                f"{altered_path},{deg_binary},{deg_num}," f"{clean_path},{split_name}\n"
+    else:
+        # Already processed excerpts keep their place in the schedule, but are
+        # not processed again
+        scheduled = []
+        for dataset, rel_path, file_path, excerpt, piece_rng in input_data:
+            record = records.get((dataset, rel_path))
+            if record is None and excerpt is None:
+                logging.warning(
+                    "Unable to find valid excerpt from file "
+                    f"{file_path}. Lengthen --excerpt-length or "
+                    "lower --min-notes. Skipping.",
+                )
+                write_record(
+                    manifest_file, records, dataset, rel_path, file_path, "no_excerpt"
+                )
+            elif record is None or record["status"] != "no_excerpt":
+                scheduled.append((dataset, rel_path, file_path, excerpt, piece_rng))
+
+        # Only plan degradations which can succeed on each excerpt. Excerpts
+        # which were already processed keep the degradation they were planned.
+        deg_feasible = degradations.check_feasible(
+            NoteBatch.from_excerpts(
+                [NoteArray() if data[3] is None else data[3] for data in scheduled]
+            ),
+            list(deg_choices),
+            degradation_kwargs,
+        )
+        for index, data in enumerate(scheduled):
+            record = records.get((data[0], data[1]))
+            if record is not None and "planned_degradation_id" in record:
+                deg_feasible[index] = False
+                deg_feasible[index, record["planned_degradation_id"]] = True
+
+        deg_schedule = balanced_schedule(
+            len(scheduled), goal_deg_dist, deg_choices, deg_feasible
+        )
+        split_schedule = balanced_schedule(len(scheduled), split_props, split_names)
+        pending = []
+        tasks = []
+        for data, deg_order, split_order in zip(
+            scheduled, deg_schedule, split_schedule
+        ):
+            dataset, rel_path, file_path, excerpt, piece_rng = data
+            if (dataset, rel_path) in records:
+                continue
+            split_name, split_num = split_order[0]
+            pending.append(
+                (dataset, rel_path, file_path, excerpt, split_order[0], deg_order[0][1])
             )
-        else:
-            logging.warning(
-                "Unable to degrade chosen excerpt from "
-                f"{file_path} and no clean excerpts requested."
-                " Skipping.",
+            tasks.append(
+                (
+                    dataset,
+                    f"{rel_path[:-3]}csv",
+                    excerpt,
+                    piece_rng,
+                    deg_order,
+                    split_name,
+                )
             )
 
-    meta_file.close()
+        # Each excerpt's result depends only on its task, so they can be
+        # processed in parallel
+        results = parallel_map(
+            process_excerpt,
+            tasks,
+            {
+                "output_dir": ARGS.output_dir,
+                "degradation_kwargs": degradation_kwargs,
+                "clean_prop": ARGS.clean_prop,
+                "record_stats": stats is not None,
+                "write_csvs": write_csvs,
+            },
+            workers=ARGS.workers,
+            desc="Degrading data",
+        )
+
+        for data, result in zip(pending, results):
+            dataset, rel_path, file_path, excerpt, split, planned_num = data
+            split_name, split_num = split
+            meta_line, deg_num, degraded, task_stats = result
+            record_args = (manifest_file, records, dataset, rel_path, file_path)
+            if task_stats is not None:
+                stats.merge(task_stats)
+            if meta_line is not None:
+                deg_counts[deg_num] += 1
+                split_counts[split_num] += 1
+                info = (record_args, meta_line, deg_num, split_num, planned_num)
+                if shard_writers is None:
+                    write_done_record(*info)
+                else:
+                    labels = excerpt_labels(
+                        dataset, f"{rel_path[:-3]}csv", degraded, deg_num
+                    )
+                    for written in shard_writers[split_name].add(
+                        excerpt, degraded, labels, info
+                    ):
+                        write_done_record(*written)
+            else:
+                logging.warning(
+                    "Unable to degrade chosen excerpt from "
+                    f"{file_path} and no clean excerpts requested."
+                    " Skipping.",
+                )
+                write_record(
+                    *record_args, "skipped", planned_degradation_id=int(planned_num)
+                )
+
+    # Write out the last (partial) shard of each split
+    for shard_writer in (shard_writers or {}).values():
+        for written in shard_writer.flush():
+            write_done_record(*written)
+    manifest_file.close()
+
+    write_metadata(ARGS.output_dir, records, shard_writers is not None)
+
+    if stats is not None:
+        stats.to_json(ARGS.stats, indent=4)
 
     for f in formats:
         create_corpus_csvs(ARGS.output_dir, FORMATTERS[f])
@@ -638,17 +2133,26 @@ if __name__ == "__main__":
         f"\nYou will find the generated data at {ARGS.output_dir} "
         "with subdirectories"
     )
-    print("\t* clean - contains the extracted clean excerpts")
-    print(
-        "\t* altered - contains the excerpts altered by the degradations "
-        "described in metadata.csv"
-    )
+    if write_csvs:
+        print("\t* clean - contains the extracted clean excerpts")
+        print(
+            "\t* altered - contains the excerpts altered by the degradations "
+            "described in metadata.csv"
+        )
+    if shard_writers is not None:
+        print(
+            "\t* shards - contains the clean and altered excerpts of each "
+            "split, packed into npz files (see mdtk.fileio.read_acme_shard)"
+        )
     print("\nmetadata.csv describes:")
     print("\t* (the id number for) the type of degradation used for the alteration")
     print("\t* the path for the altered and clean files")
     print("\t* which split (train, valid, test) the file should be used in")
     print("\t* in which corpus and on what line the file is located")
 
+    if ARGS.stats is not None:
+        print(f"\nDegradation statistics were written to {ARGS.stats}")
+
     print(
         "\ndegradation_ids.csv is a mapping of degradation name to the id "
         "number used in metadata.csv"
@@ -661,4 +2165,10 @@ if __name__ == "__main__":
         "\nTo reproduce this dataset again, run the script with argument "
         f"--seed {seed}"
     )
+    if ARGS.num_shards > 1:
+        print(
+            f"\nThis is part {ARGS.shard_index} of {ARGS.num_shards} of the "
+            "dataset. Once every part is built, combine them with "
+            "`make_dataset.py merge -o output_dir part_dir [part_dir ...]`."
+        )
     print(LOGO)
@@ -1,13 +1,28 @@
-"""Code to perform the degradations i.e. edits to the midi data"""
+"""Code to perform the degradations i.e. edits to the midi data. Each degradation
+accepts either a note_df or a NoteArray, and returns its result as the same type."""
 import logging
-import sys
-from functools import wraps
+from bisect import bisect_right
+from functools import lru_cache, wraps
+from itertools import accumulate
 
 import numpy as np
 import pandas as pd
-from numpy.random import choice, randint
 
-from mdtk.df_utils import NOTE_DF_SORT_ORDER
+from mdtk.df_utils import NOTE_DF_SORT_ORDER, is_sorted
+from mdtk.edits import NoteEdit
+from mdtk.instrumentation import (
+    EMPTY_DISTRIBUTION,
+    NO_FREE_EDIT,
+    NO_VALID_ALIGNMENT,
+    NO_VALID_NOTES,
+    TRIES_EXHAUSTED,
+    count_try,
+    instrumented,
+    record_failure,
+)
+from mdtk.interval_index import batch_overlaps
+from mdtk.note_array import MAX_NOTE_VALUE, NoteArray, NoteBatch
+from mdtk.rng import get_rng
 
 MIN_PITCH_DEFAULT = 21
 MAX_PITCH_DEFAULT = 108
@@ -31,6 +46,18 @@ TRIES_WARN_MSG = (
     "Returning None."
 )
 
+NO_FREE_EDIT_WARN_MSG = (
+    "No valid degradation exists which does not overlap another note. "
+    "Returning None."
+)
+
+# Used to represent unbounded ranges of int64 values
+_MIN_INT = np.iinfo(np.int64).min
+_MAX_INT = np.iinfo(np.int64).max
+
+# The maximum number of pitch distribution tables to cache
+DISTRIBUTION_CACHE_SIZE = 4096
+
 
 def set_random_seed(func, seed=None):
     """This is a function decorator which just adds the keyword argument `seed`
@@ -61,6 +88,26 @@ def set_random_seed(func, seed=None):
     return seeded_func
 
 
+def _fail(cause, msg, *args):
+    """
+    Log a warning that a degradation failed, and record the cause of the
+    failure if instrumentation is enabled (see mdtk.instrumentation).
+
+    Parameters
+    ----------
+    cause : string
+        The cause of the failure, one of those in mdtk.instrumentation.
+
+    msg : string
+        The warning message.
+
+    args
+        Arguments to format into the message.
+    """
+    record_failure(cause)
+    logging.warning(msg, *args)
+
+
 def overlaps(df, idx):
     """
     Check if the note at the given index in the given dataframe overlaps any
@@ -68,7 +115,7 @@ def overlaps(df, idx):
 
     Parameters
     ----------
-    df : pd.DataFrame
+    df : pd.DataFrame or NoteArray
         The DataFrame to check for overlaps.
 
     idx : int
@@ -79,6 +126,12 @@ def overlaps(df, idx):
     overlap : boolean
         True if the note overlaps some other note. False otherwise.
     """
+    if isinstance(df, NoteArray):
+        note = df[idx]
+        return df.interval_index().overlaps(
+            int(note["onset"]), int(note["dur"]), note["track"], note["pitch"], idx
+        )
+
     note = df.loc[idx]
     df = df.loc[
         (df["pitch"] == note.pitch) & (df["track"] == note.track) & (df.index != idx)
@@ -89,13 +142,45 @@ def overlaps(df, idx):
     return overlap
 
 
+def _unique(values):
+    """
+    Get the unique values of the given array, in order of first appearance
+    (like pd.Series.unique, rather than sorted like np.unique).
+    """
+    _, first_index = np.unique(values, return_index=True)
+    return values[np.sort(first_index)]
+
+
+def _between(values, low, high):
+    """Get a mask of which values lie within [low, high] (inclusive)."""
+    return (values >= low) & (values <= high)
+
+
+def _is_canonical(df):
+    """
+    Check if the given df is already in the form returned by pre_process:
+    exactly the columns NOTE_DF_SORT_ORDER, of the default int type, indexed
+    by consecutive ints from 0.
+    """
+    index = df.index
+    return (
+        isinstance(index, pd.RangeIndex)
+        and index.start == 0
+        and index.step == 1
+        and list(df.columns) == NOTE_DF_SORT_ORDER
+        and all(dtype == np.dtype(int) for dtype in df.dtypes)
+    )
+
+
 def pre_process(df, sort=False):
     """
     Function which will pre-process a dataframe to be degraded.
 
     Currently, that means resetting the indices to consecutive ints from 0.
     Optionally, this will sort the df (depending on the degradation).
-    This function is called automatically by each degradation.
+    Each degradation performs the equivalent of this function when converting
+    its input into a NoteArray. A df which is already pre-processed (and sorted,
+    if sort is True) is only copied.
 
     Parameters
     ----------
@@ -115,6 +200,9 @@ def pre_process(df, sort=False):
     ValueError
         If the given df does not have all of the necessary columns.
     """
+    if _is_canonical(df) and (not sort or is_sorted(df)):
+        return df.copy()
+
     try:
         df = df.loc[:, NOTE_DF_SORT_ORDER]
     except KeyError:  # df has incorrect columns
@@ -133,8 +221,9 @@ def post_process(df, sort=True):
     Function which will post-process a degraded dataframe.
 
     That means optionally sorting it, resetting the indices to be
-    consecutive ints starting from 0. All degradations call this
-    function after their execution.
+    consecutive ints starting from 0. Each degradation performs the
+    equivalent of this function on its output. A df which is already sorted
+    is not sorted again.
 
     Parameters
     ----------
@@ -149,13 +238,66 @@ def post_process(df, sort=True):
     df : pd.DataFrame
         The postprocessed dataframe.
     """
-    if sort:
+    if sort and not is_sorted(df):
         df = df.sort_values(NOTE_DF_SORT_ORDER)
     df = df.reset_index(drop=True)
     return df
 
 
-def split_range_sample(split_range, p=None):
+def _pre_process_notes(excerpt, sort=False):
+    """
+    Get a NoteArray to degrade from the given excerpt. This is the NoteArray
+    equivalent of pre_process, and is called by each degradation.
+
+    Parameters
+    ----------
+    excerpt : pd.DataFrame or NoteArray
+        The excerpt to be degraded. A NoteArray is used as is (without
+        copying), and a DataFrame is converted as in pre_process.
+
+    sort : boolean
+        True to sort the notes. False to leave the ordering as given.
+
+    Returns
+    -------
+    notes : NoteArray
+        The notes of the given excerpt.
+    """
+    if isinstance(excerpt, NoteArray):
+        return excerpt.sort() if sort else excerpt
+    return NoteArray.from_df(excerpt, sort=sort)
+
+
+def _post_process_notes(degraded, excerpt, sort=True):
+    """
+    Post-process a degraded NoteArray and convert it to the type of the
+    original excerpt. This is the NoteArray equivalent of post_process, and is
+    called by each degradation.
+
+    Parameters
+    ----------
+    degraded : NoteArray
+        The degraded notes.
+
+    excerpt : pd.DataFrame or NoteArray
+        The excerpt which was passed to the degradation.
+
+    sort : boolean
+        True to sort the degraded notes. False to leave the ordering as given.
+
+    Returns
+    -------
+    degraded : pd.DataFrame or NoteArray
+        The degraded notes, as the same type as excerpt.
+    """
+    if sort:
+        degraded = degraded.sort()
+    if isinstance(excerpt, NoteArray):
+        return degraded
+    return degraded.to_df().astype(int)
+
+
+def split_range_sample(split_range, p=None, rng=None):
     """
     Return a value sampled randomly from the given list of ranges. It is
     implemented to first sample a range from the list of ranges `split_range`,
@@ -174,378 +316,1404 @@ def split_range_sample(split_range, p=None):
         contains the probability of sampling from each range. p will be
         normalized before use.
 
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state.
+
     Returns
     -------
     samp : int
         An integer sampled from the given split range.
     """
     if p is not None:
-        p = p / np.sum(p)
+        p = (p / np.sum(p)).tolist()
     else:
         range_sizes = [rr[1] - rr[0] for rr in split_range]
         total_range = sum(range_sizes)
         p = [range_size / total_range for range_size in range_sizes]
-    index = choice(range(len(split_range)), p=p)
-    samp = randint(split_range[index][0], split_range[index][1])
-    return samp
 
+    # Inverse-CDF sampling of a range, drawing as rng.choice would. For a few
+    # ranges, this is much faster in pure Python than with numpy.
+    cdf = list(accumulate(p))
+    cdf = [value / cdf[-1] for value in cdf]
+    rng = get_rng(rng)
+    index = bisect_right(cdf, rng.random())
+    return rng.integers(split_range[index][0], split_range[index][1])
 
-@set_random_seed
-def pitch_shift(
-    excerpt,
-    min_pitch=MIN_PITCH_DEFAULT,
-    max_pitch=MAX_PITCH_DEFAULT,
-    align_pitch=False,
-    distribution=None,
-    abs_distribution=None,
-    tries=TRIES_DEFAULT,
-):
+
+def split_range_sample_batch(lows, highs, p=None, rng=None):
     """
-    Shift the pitch of one note from the given excerpt.
+    Sample one value from each of many split ranges at once, as in
+    split_range_sample. Each split range is given by a row of lows and highs,
+    and rows with fewer ranges can be padded with empty ranges (where
+    low >= high), which are never sampled.
 
     Parameters
     ----------
-    excerpt : pd.DataFrame
-        An excerpt from a piece of music.
+    lows, highs : np.ndarray
+        Arrays of shape (num_samples, num_ranges), where each row contains the
+        [min, max) bounds of the ranges of one split range. Each row must
+        contain at least one non-empty range.
 
-    min_pitch : int
-        The minimum pitch to which a note may be shifted.
+    p : np.ndarray
+        If given, an array of the same shape, containing the probability of
+        sampling from each range. Each row will be normalized before use.
+        None samples each range proportionally to its size.
 
-    max_pitch : int
-        The maximum pitch to which a note may be shifted.
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state.
 
-    align_pitch : bool
-        Align the note's new pitch to an existing pitch of another note.
-        If the given excerpt has only 1 note, align_pitch is set to False.
+    Returns
+    -------
+    samples : np.ndarray
+        An integer sampled from each split range. For a single split range,
+        this is the same value as split_range_sample draws from the same
+        random state.
+    """
+    lows = np.asarray(lows, dtype=np.int64)
+    highs = np.asarray(highs, dtype=np.int64)
+    if p is None:
+        sizes = np.maximum(highs - lows, 0)
+        p = sizes / np.sum(sizes, axis=1, keepdims=True)
+    else:
+        p = p / np.sum(p, axis=1, keepdims=True)
 
-    distribution : list(float)
-        If given, a list describing the distribution of pitch shifts.
-        Element (len(distribution) // 2) refers to the note's original
-        pitch, and will be set to 0. Additionally, pitches outside of the
-        range [min_pitch, max_pitch] will also be set to 0. The distribution
-        will then be normalized to sum to 1, and used to generate a new
-        pitch. None implies a uniform distribution.
+    # Inverse-CDF sampling of a range from each row, as in rng.choice
+    cdf = np.cumsum(p, axis=1)
+    cdf /= cdf[:, -1:]
+    rng = get_rng(rng)
+    ranges = np.sum(cdf <= rng.random(len(lows))[:, None], axis=1)
 
-    abs_distribution : list(float)
-        If given, a list describing the distribution of pitch shifts in terms
-        of absolute pitch. Generally, abs_distribution[i] is the probability of
-        a pitch shift to pitch i. Pitches outside of the range [min_pitch,
-        max_pitch] will be set to 0, as well as the pitch of the note's
-        original pitch. The distribution will be normalized to sum to 1.
-        If distribution is also given, the two normalized distributions will be
-        multiplied by each other and then re-normalized. None implies a uniform
-        distribution.
+    rows = np.arange(len(lows))
+    return rng.integers(lows[rows, ranges], highs[rows, ranges])
 
-    seed : int
-        A seed to be supplied to np.random.seed(). None leaves numpy's
-        random state unchanged.
 
-    tries : int
-        The number of times to try the degradation before giving up, in the case
-        that the degraded excerpt overlaps.
+def _free_ranges(split_range, blocked_starts, blocked_ends):
+    """
+    Remove the given blocked ranges from the given split range.
 
+    Parameters
+    ----------
+    split_range : list(tuple)
+        A list of [min, max) tuples defining ranges of allowed values.
+
+    blocked_starts : np.ndarray
+        The minimum value of each range of values which are not allowed.
+
+    blocked_ends : np.ndarray
+        The (exclusive) maximum value of each range of values which are not
+        allowed.
 
     Returns
     -------
-    degraded : pd.DataFrame
-        A degradation of the excerpt, with the pitch of one note changed,
-        or None if the degradation cannot be performed.
+    free_range : list(tuple)
+        A list of non-empty [min, max) tuples, containing every value of
+        split_range which does not lie in any blocked range, in a form which
+        can be passed to split_range_sample.
     """
-    if len(excerpt) == 0:
-        logging.warning("No notes to pitch shift. Returning None.")
-        return None
-
-    if len(excerpt) == 1:
-        align_pitch = False
+    nonempty = blocked_starts < blocked_ends
+    order = np.argsort(blocked_starts[nonempty], kind="stable")
+    starts = blocked_starts[nonempty][order]
+    ends = np.maximum.accumulate(blocked_ends[nonempty][order])
+
+    # Free gaps lie between the end of all earlier blocked ranges and the
+    # start of the next one
+    gap_starts = np.concatenate(([_MIN_INT], ends)).astype(np.int64)
+    gap_ends = np.concatenate((starts, [_MAX_INT])).astype(np.int64)
+
+    free_range = []
+    for range_min, range_max in split_range:
+        mins = np.maximum(gap_starts, range_min)
+        maxes = np.minimum(gap_ends, range_max)
+        nonempty = mins < maxes
+        free_range.extend(zip(mins[nonempty].tolist(), maxes[nonempty].tolist()))
+    return free_range
+
+
+def _in_ranges(values, split_range):
+    """
+    Get a mask of which values lie within any of the given ranges.
 
-    excerpt = pre_process(excerpt)
+    Parameters
+    ----------
+    values : np.ndarray
+        The values to check.
 
-    if distribution is None:
-        orig_dist = distribution
-    else:
-        orig_dist = np.copy(distribution)
-        distribution = np.copy(distribution)
-    if abs_distribution is None:
-        orig_abs_dist = abs_distribution
-    else:
-        orig_abs_dist = np.copy(abs_distribution)
-        abs_distribution = np.copy(abs_distribution)
+    split_range : list(tuple)
+        A list of [min, max) tuples defining ranges of values.
 
-    # Enforce min and max bounds
-    if abs_distribution is not None:
-        orig_abs_dist = np.copy(abs_distribution)
-        abs_distribution[:min_pitch] = 0
-        abs_distribution[max_pitch + 1 :] = 0
-        nonzero = np.nonzero(abs_distribution)[0]
-        if len(nonzero) == 0:
-            logging.warning(
-                "No valid pitches to shift to given min_pitch %s, max_pitch %s, and "
-                "abs_distribution %s. Returning None.",
-                min_pitch,
-                max_pitch,
-                abs_distribution,
-            )
-            return None
-        min_pitch = nonzero[0]
-        max_pitch = nonzero[-1]
+    Returns
+    -------
+    mask : np.ndarray
+        A boolean array which is True for each value in some range.
+    """
+    mask = np.zeros(len(values), dtype=bool)
+    for range_min, range_max in split_range:
+        mask |= (values >= range_min) & (values < range_max)
+    return mask
 
-    # Assume all notes can be shifted initially
-    valid_notes = list(excerpt.index)
 
-    # If distribution is being used, some notes may not be possible to pitch
-    # shift. This is because the distribution supplied would only allow them
-    # to be shifted outside of the supplied (min, max) pitch range. For example
-    # A distribution [0, 0, 1] always shifts up one semitone; a note with
-    # pitch equal to max_pitch can't be shifted with this distribution.
-    if distribution is not None:
-        assert all(
-            [dd >= 0 for dd in distribution]
-        ), "A value in supplied distribution is negative."
-        zero_idx = len(distribution) // 2
-        distribution[zero_idx] = 0
+def _any_in_range(sorted_values, low, high):
+    """
+    Check, for each of the given ranges, whether any of the given values lies
+    within it.
 
-        if np.sum(distribution) == 0:
-            logging.warning(
-                "distribution contains only 0s after "
-                "setting distribution[zero_idx] value to 0. "
-                "Returning None."
-            )
-            return None
+    Parameters
+    ----------
+    sorted_values : np.ndarray
+        The values, sorted in increasing order.
 
-        nonzero_indices = np.nonzero(distribution)[0]
+    low : np.ndarray
+        The minimum of each range.
 
-        lowest_idx = nonzero_indices[0]
-        highest_idx = nonzero_indices[-1]
+    high : np.ndarray
+        The (exclusive) maximum of each range.
 
-        min_pitch_shift = zero_idx - lowest_idx
-        max_pitch_shift = highest_idx - zero_idx
+    Returns
+    -------
+    any_in_range : np.ndarray
+        A boolean array which is True for each range containing any value.
+    """
+    return np.searchsorted(sorted_values, high, side="left") > np.searchsorted(
+        sorted_values, low, side="left"
+    )
 
-        max_to_sample = max_pitch + min_pitch_shift
-        min_to_sample = min_pitch - max_pitch_shift
 
-        valid_notes = excerpt.index[
-            excerpt["pitch"].between(min_to_sample, max_to_sample)
-        ].tolist()
+def _any_difference_in(targets, scan_values, starts, ends, member_values):
+    """
+    Check, for each target x, whether x - v is one of member_values for any v in
+    its slice of scan_values. The slices are scanned in vectorised rounds over
+    the targets not yet decided, so memory use is linear, and each target costs
+    only the number of values tried before its first match.
 
-        if not valid_notes:
-            logging.warning(
-                "No valid pitches to shift given "
-                f"min_pitch {min_pitch}, max_pitch {max_pitch}, "
-                f"and distribution {distribution} (after setting "
-                "distribution[zero_idx] to 0). Returning None."
-            )
-            return None
+    Parameters
+    ----------
+    targets : np.ndarray
+        The target of each check, as int64.
 
-    degraded = excerpt.copy()
+    scan_values : np.ndarray
+        The values to scan, sorted.
 
-    # Sample a random note
-    note_index = valid_notes[randint(len(valid_notes))]
-    pitch = degraded.loc[note_index, "pitch"]
+    starts, ends : np.ndarray
+        The slice of scan_values to scan for each target (ends exclusive).
 
-    # Shift its pitch
-    if distribution is None and abs_distribution is None:
-        # Uniform distribution
-        if align_pitch:
-            valid_pitches = excerpt.loc[
-                excerpt["pitch"].between(min_pitch, max_pitch)
-                & (excerpt["pitch"] != pitch),
-                "pitch",
-            ].unique()
-            if len(valid_pitches) > 0:
-                degraded.loc[note_index, "pitch"] = choice(valid_pitches)
-        else:
-            if min_pitch != max_pitch or min_pitch != pitch:
-                while degraded.loc[note_index, "pitch"] == pitch:
-                    degraded.loc[note_index, "pitch"] = randint(
-                        min_pitch, max_pitch + 1
-                    )
-    else:
-        if distribution is None:
-            max_range = max(abs(pitch - min_pitch), abs(pitch - max_pitch))
-            distribution = np.ones(max_range * 2 + 1)
+    member_values : np.ndarray
+        The values to find differences in, sorted.
 
-        zero_idx = len(distribution) // 2
-        pitches = np.array(
-            range(pitch - zero_idx, pitch - zero_idx + len(distribution))
-        )
-        distribution[zero_idx] = 0
-        distribution = np.where(pitches < min_pitch, 0, distribution)
-        distribution = np.where(pitches > max_pitch, 0, distribution)
-        if align_pitch:
-            distribution = np.where(
-                np.isin(pitches, excerpt["pitch"].unique()), distribution, 0
-            )
+    Returns
+    -------
+    any_in : np.ndarray
+        A boolean array which is True for each target with a match.
+    """
+    result = np.zeros(len(targets), dtype=bool)
+    active = np.flatnonzero(starts < ends)
+    if len(member_values) == 0:
+        return result
+    pos = starts[active]
+    ends = ends[active]
+    while len(active) > 0:
+        differences = targets[active] - scan_values[pos]
+        found_pos = np.searchsorted(member_values, differences)
+        found_pos = np.minimum(found_pos, len(member_values) - 1)
+        found = member_values[found_pos] == differences
+        result[active[found]] = True
+        pos += 1
+        keep = ~found & (pos < ends)
+        active, pos, ends = active[keep], pos[keep], ends[keep]
+    return result
+
+
+def _any_aligned_onset(sorted_onsets, sorted_durs, offset, low, high):
+    """
+    Check, for each note, whether any existing onset in the range [low, high)
+    would also give it an existing duration (with its offset unchanged).
 
-        # Degrade only if any allowed pitches are in range [min_pitch, max_pitch)
-        sum_dist = np.sum(distribution)
-        if sum_dist > 0:
-            distribution = distribution / np.sum(distribution)
+    Each note scans whichever of the onsets or durations in its range are
+    fewer, so no (note, duration) matrix is built.
 
-            if abs_distribution is not None:
-                dist_mask = np.isin(pitches, np.arange(len(abs_distribution)))
-                abs_dist_mask = np.isin(np.arange(len(abs_distribution)), pitches)
+    Parameters
+    ----------
+    sorted_onsets : np.ndarray
+        The unique onsets of the excerpt, sorted.
 
-                abs_dist_relative = np.zeros(len(distribution))
-                if np.any(dist_mask):
-                    abs_dist_relative[dist_mask] = abs_distribution[abs_dist_mask]
+    sorted_durs : np.ndarray
+        The unique durations of the excerpt, sorted.
 
-                distribution *= abs_dist_relative
-                sum_dist = np.sum(distribution)
-                if sum_dist > 0:
-                    distribution = distribution / np.sum(distribution)
-                    degraded.loc[note_index, "pitch"] = choice(pitches, p=distribution)
+    offset : np.ndarray
+        The offset of each note, as int64.
 
-            else:
-                degraded.loc[note_index, "pitch"] = choice(pitches, p=distribution)
+    low : np.ndarray
+        The minimum onset of each note's range.
 
-    # Check if overlaps
-    if overlaps(degraded, note_index) or degraded.loc[note_index, "pitch"] == pitch:
-        if tries == 1:
-            logging.warning(TRIES_WARN_MSG)
-            return None
-        return pitch_shift(
-            excerpt,
-            min_pitch=min_pitch,
-            max_pitch=max_pitch,
-            align_pitch=align_pitch,
-            distribution=orig_dist,
-            abs_distribution=orig_abs_dist,
-            tries=tries - 1,
-        )
+    high : np.ndarray
+        The (exclusive) maximum onset of each note's range.
 
-    degraded = post_process(degraded)
-    return degraded
+    Returns
+    -------
+    any_aligned : np.ndarray
+        A boolean array which is True for each note with an aligned onset in
+        its range.
+    """
+    # Onsets in [low, high) give durations in (offset - high, offset - low]
+    onset_starts = np.searchsorted(sorted_onsets, low, side="left")
+    onset_ends = np.searchsorted(sorted_onsets, high, side="left")
+    dur_starts = np.searchsorted(sorted_durs, offset - high, side="right")
+    dur_ends = np.searchsorted(sorted_durs, offset - low, side="right")
+
+    by_onset = onset_ends - onset_starts <= dur_ends - dur_starts
+    from_onsets = _any_difference_in(
+        offset,
+        sorted_onsets,
+        np.where(by_onset, onset_starts, 0),
+        np.where(by_onset, onset_ends, 0),
+        sorted_durs,
+    )
+    from_durs = _any_difference_in(
+        offset,
+        sorted_durs,
+        np.where(by_onset, 0, dur_starts),
+        np.where(by_onset, 0, dur_ends),
+        sorted_onsets,
+    )
+    return from_onsets | from_durs
 
 
-@set_random_seed
-def time_shift(
-    excerpt,
-    min_shift=MIN_SHIFT_DEFAULT,
-    max_shift=MAX_SHIFT_DEFAULT,
-    align_onset=False,
-    tries=TRIES_DEFAULT,
-):
+def _time_shift_bounds(onset, offset, end_time, min_shift, max_shift):
     """
-    Shift the onset and offset times of one note from the given excerpt,
-    leaving its duration unchanged.
+    Get the ranges of onset times each note could be shifted to by time_shift.
 
     Parameters
     ----------
-    excerpt : pd.DataFrame
-        An excerpt from a piece of music.
-
-    min_shift : int
-        The minimum amount by which the note will be shifted.
+    onset, offset : np.ndarray
+        The onset and offset time of each note, as int64.
 
-    max_shift : int
-        The maximum amount by which the note will be shifted.
-
-    align_onset : boolean
-        Align the shifted note to the onset time of an existing note
-        (within the given shift range).
-
-    seed : int
-        A seed to be supplied to np.random.seed(). None leaves numpy's
-        random state unchanged.
-
-    tries : int
-        The number of times to try the degradation before giving up, in the case
-        that the degraded excerpt overlaps.
+    end_time : int or np.ndarray
+        The latest offset time of the excerpt (or of each note's excerpt).
 
+    min_shift, max_shift : int
+        The minimum and maximum shift, as in time_shift.
 
     Returns
     -------
-    degraded : pd.DataFrame
-        A degradation of the excerpt, with the timing of one note changed,
-        or None if there are no notes that can be changed.
-    """
-    excerpt = pre_process(excerpt)
+    earliest_earlier_onset, latest_earlier_onset : np.ndarray
+        The [min, max) range of earlier onsets of each note.
 
+    earliest_later_onset, latest_later_onset : np.ndarray
+        The [min, max) range of later onsets of each note.
+    """
     min_shift = max(min_shift, 1)
 
-    onset = excerpt["onset"]
-    offset = onset + excerpt["dur"]
-    end_time = offset.max()
-
     # Shift earlier
-    earliest_earlier_onset = (onset - (max_shift - 1)).clip(lower=0)
-    latest_earlier_onset = onset - (min_shift - 1)
+    earliest_earlier_onset = np.maximum(onset - (max_shift - 1), 0).astype(np.int64)
+    latest_earlier_onset = (onset - (min_shift - 1)).astype(np.int64)
 
     # Shift later
-    latest_later_onset = onset + (((end_time + 1) - offset).clip(upper=max_shift + 1))
-    earliest_later_onset = onset + min_shift
+    latest_later_onset = (
+        onset + np.minimum((end_time + 1) - offset, max_shift + 1)
+    ).astype(np.int64)
+    earliest_later_onset = (onset + min_shift).astype(np.int64)
+
+    return (
+        earliest_earlier_onset,
+        latest_earlier_onset,
+        earliest_later_onset,
+        latest_later_onset,
+    )
 
-    if align_onset:
-        # Find ranges which contain a note to align to
-        # I couldn't think of a better solution than iterating here.
-        # This code checks, for every range, whether at least 1 onset
-        # lies within that range.
-        onset = pd.Series(onset.unique())
-        for i, (eeo, leo, elo, llo) in enumerate(
-            zip(
-                earliest_earlier_onset,
-                latest_earlier_onset,
-                earliest_later_onset,
-                latest_later_onset,
-            )
-        ):
-            # Go through each range to check there is a valid onset
-            earlier_valid = onset.between(eeo, leo - 1).any()
-            later_valid = onset.between(elo, llo - 1).any()
 
-            # Close invalid ranges
-            if not earlier_valid:
-                earliest_earlier_onset.iloc[i] = leo
-            if not later_valid:
-                earliest_later_onset.iloc[i] = llo
+def _onset_shift_bounds(
+    onset, offset, min_shift, max_shift, min_duration, max_duration
+):
+    """
+    Get the ranges of onset times each note could be shifted to by onset_shift.
 
-    # Find valid notes
-    valid = (earliest_earlier_onset < latest_earlier_onset) | (
-        earliest_later_onset < latest_later_onset
-    )
-    valid_notes = list(valid.index[valid])
+    Parameters
+    ----------
+    onset, offset : np.ndarray
+        The onset and offset time of each note, as int64.
 
-    if not valid_notes:
-        logging.warning("No valid notes to time shift. Returning None.")
-        return None
+    min_shift, max_shift, min_duration, max_duration : int
+        The bounds of the shift and the resulting duration, as in onset_shift.
 
-    # Sample a random note
-    index = choice(valid_notes)
+    Returns
+    -------
+    earliest_lengthened_onset, latest_lengthened_onset : np.ndarray
+        The [min, max) range of earlier (lengthening) onsets of each note.
+
+    earliest_shortened_onset, latest_shortened_onset : np.ndarray
+        The [min, max) range of later (shortening) onsets of each note.
+    """
+    min_shift = max(min_shift, 1)
+    min_duration -= 1  # This makes computation below simpler
+
+    # Lengthen bounds (decrease onset)
+    earliest_lengthened_onset = np.maximum(
+        np.maximum(offset - max_duration, onset - max_shift), 0
+    ).astype(np.int64)
+    latest_lengthened_onset = np.minimum(
+        onset - (min_shift - 1), offset - min_duration
+    ).astype(np.int64)
+
+    # Shorten bounds (increase onset)
+    latest_shortened_onset = np.minimum(
+        offset - min_duration, onset + (max_shift + 1)
+    ).astype(np.int64)
+    earliest_shortened_onset = np.maximum(
+        onset + min_shift, offset - max_duration
+    ).astype(np.int64)
+
+    return (
+        earliest_lengthened_onset,
+        latest_lengthened_onset,
+        earliest_shortened_onset,
+        latest_shortened_onset,
+    )
+
+
+def _offset_shift_bounds(
+    onset, duration, end_time, min_shift, max_shift, min_duration, max_duration
+):
+    """
+    Get the ranges of durations each note could be given by offset_shift.
+
+    Parameters
+    ----------
+    onset, duration : np.ndarray
+        The onset time and duration of each note, as int64.
+
+    end_time : int or np.ndarray
+        The latest offset time of the excerpt (or of each note's excerpt).
+
+    min_shift, max_shift, min_duration, max_duration : int
+        The bounds of the shift and the resulting duration, as in offset_shift.
+
+    Returns
+    -------
+    shortest_lengthened_dur, longest_lengthened_dur : np.ndarray
+        The [min, max) range of longer durations of each note.
+
+    shortest_shortened_dur, longest_shortened_dur : np.ndarray
+        The [min, max) range of shorter durations of each note.
+    """
+    min_shift = max(min_shift, 1)
+    max_duration += 1
+
+    # Lengthen bounds (increase duration)
+    shortest_lengthened_dur = np.maximum(duration + min_shift, min_duration).astype(
+        np.int64
+    )
+    longest_lengthened_dur = np.minimum(
+        np.minimum(duration + (max_shift + 1), (end_time + 1) - onset), max_duration
+    ).astype(np.int64)
+
+    # Shorten bounds (decrease duration)
+    shortest_shortened_dur = np.maximum(duration - max_shift, min_duration).astype(
+        np.int64
+    )
+    longest_shortened_dur = np.minimum(
+        duration - (min_shift - 1), max_duration
+    ).astype(np.int64)
+
+    return (
+        shortest_lengthened_dur,
+        longest_lengthened_dur,
+        shortest_shortened_dur,
+        longest_shortened_dur,
+    )
+
+
+def _distribution_key(distribution):
+    """
+    Get a hashable key of the values of the given distribution, from which it
+    can be recovered with _from_distribution_key.
+
+    Parameters
+    ----------
+    distribution : array-like or None
+        A distribution.
+
+    Returns
+    -------
+    key : bytes or None
+        The distribution's values as float64 bytes, or None if it is None.
+    """
+    if distribution is None:
+        return None
+    return np.asarray(distribution, dtype=float).tobytes()
+
+
+def _from_distribution_key(key):
+    """
+    Get the (read-only) distribution with the given key.
+
+    Parameters
+    ----------
+    key : bytes or None
+        A key returned by _distribution_key.
+
+    Returns
+    -------
+    distribution : np.ndarray or None
+        The distribution, as a float array.
+    """
+    return None if key is None else np.frombuffer(key)
+
+
+def _cdf(p):
+    """
+    Get the cumulative distribution of the given probabilities, exactly as
+    calculated by rng.choice.
+
+    Parameters
+    ----------
+    p : np.ndarray or None
+        The probability of each value, or None for a uniform distribution.
+
+    Returns
+    -------
+    cdf : np.ndarray or None
+        The cumulative distribution, or None if p is None or empty.
+    """
+    if p is None or len(p) == 0:
+        return None
+    cdf = np.cumsum(p)
+    cdf /= cdf[-1]
+    return cdf
+
+
+def _sample_table(values, cdf, rng):
+    """
+    Sample a value by inverse-CDF sampling. This draws the same value as
+    rng.choice(values, p=p) would from the same random state.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The values from which to sample.
+
+    cdf : np.ndarray or None
+        The cumulative distribution of the values (see _cdf). None samples
+        uniformly.
+
+    rng : np.random.Generator
+        The random number generator to use.
+
+    Returns
+    -------
+    value : int
+        The sampled value.
+    """
+    if cdf is None:
+        return rng.choice(values)
+    return values[cdf.searchsorted(rng.random(), side="right")]
+
+
+def _read_only_table(values, p):
+    """
+    Make an inverse-CDF sampling table of the given values, to be cached.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The values of the table.
+
+    p : np.ndarray or None
+        The probability of each value, or None for a uniform distribution.
+
+    Returns
+    -------
+    values, p, cdf : np.ndarray
+        Read-only copies of the values and probabilities, and their cumulative
+        distribution (see _cdf).
+    """
+    table = (values, p, _cdf(p))
+    for array in table:
+        if array is not None:
+            array.flags.writeable = False
+    return table
+
+
+@lru_cache(maxsize=DISTRIBUTION_CACHE_SIZE)
+def _pitch_shift_table(pitch, min_pitch, max_pitch, distribution, abs_distribution):
+    """
+    Get a table of the pitches to which a note may be shifted by pitch_shift,
+    for a non-uniform distribution without align_pitch. These depend only on
+    the arguments, so the tables are cached.
+
+    Parameters
+    ----------
+    pitch : int
+        The current pitch of the note.
+
+    min_pitch, max_pitch
+        The (pre-processed) arguments of pitch_shift.
+
+    distribution, abs_distribution : bytes or None
+        Keys of the (pre-processed) arguments of pitch_shift, from
+        _distribution_key.
+
+    Returns
+    -------
+    targets, p, cdf : np.ndarray
+        The pitches to which the note may be shifted, the probability of each,
+        and their cumulative distribution (see _cdf). These must not be edited.
+    """
+    targets, p = _pitch_shift_targets(
+        pitch,
+        None,
+        min_pitch,
+        max_pitch,
+        False,
+        _from_distribution_key(distribution),
+        _from_distribution_key(abs_distribution),
+    )
+    return _read_only_table(targets, p)
+
+
+def _pitch_shift_choices(
+    pitch, pitches, min_pitch, max_pitch, align_pitch, distribution, abs_distribution
+):
+    """
+    Get the pitches to which a note may be shifted by pitch_shift, for every
+    case except a uniform distribution without alignment. Those which do not
+    depend on the excerpt (without align_pitch) are cached.
+
+    Parameters
+    ----------
+    pitch : int
+        The current pitch of the note.
+
+    pitches : np.ndarray
+        The pitch of every note in the excerpt.
+
+    min_pitch, max_pitch, align_pitch, distribution, abs_distribution
+        The (pre-processed) arguments of pitch_shift.
+
+    Returns
+    -------
+    targets : np.ndarray
+        The pitches to which the note may be shifted.
+
+    p : np.ndarray or None
+        The probability of shifting the note to each target, or None for a
+        uniform distribution.
+
+    cdf : np.ndarray or None
+        The cumulative distribution of p, for _sample_table.
+    """
+    has_distribution = distribution is not None or abs_distribution is not None
+    if has_distribution and not align_pitch:
+        return _pitch_shift_table(
+            pitch,
+            min_pitch,
+            max_pitch,
+            _distribution_key(distribution),
+            _distribution_key(abs_distribution),
+        )
+    targets, p = _pitch_shift_targets(
+        pitch,
+        pitches,
+        min_pitch,
+        max_pitch,
+        align_pitch,
+        distribution,
+        abs_distribution,
+    )
+    return targets, p, _cdf(p)
+
+
+def _pitch_shift_targets(
+    pitch, pitches, min_pitch, max_pitch, align_pitch, distribution, abs_distribution
+):
+    """
+    Get the pitches to which a note may be shifted by pitch_shift, for every
+    case except a uniform distribution without alignment.
+
+    Parameters
+    ----------
+    pitch : int
+        The current pitch of the note.
+
+    pitches : np.ndarray
+        The pitch of every note in the excerpt.
+
+    min_pitch, max_pitch, align_pitch, distribution, abs_distribution
+        The (pre-processed) arguments of pitch_shift.
+
+    Returns
+    -------
+    targets : np.ndarray
+        The pitches to which the note may be shifted.
+
+    p : np.ndarray or None
+        The probability of shifting the note to each target, or None for a
+        uniform distribution.
+    """
+    if distribution is None and abs_distribution is None:
+        if align_pitch:
+            valid = _between(pitches, min_pitch, max_pitch) & (pitches != pitch)
+            return _unique(pitches[valid]), None
+        targets = np.arange(min_pitch, max_pitch + 1)
+        return targets[targets != pitch], None
+
+    if distribution is None:
+        max_range = max(abs(pitch - min_pitch), abs(pitch - max_pitch))
+        dist = np.ones(max_range * 2 + 1)
+    else:
+        dist = distribution
+
+    zero_idx = len(dist) // 2
+    candidates = np.arange(pitch - zero_idx, pitch - zero_idx + len(dist))
+    dist = np.where(candidates == pitch, 0, dist)
+    dist = np.where(candidates < min_pitch, 0, dist)
+    dist = np.where(candidates > max_pitch, 0, dist)
+    if align_pitch:
+        dist = np.where(np.isin(candidates, pitches), dist, 0)
+
+    # Degrade only if any allowed pitches are in range [min_pitch, max_pitch)
+    sum_dist = np.sum(dist)
+    if sum_dist == 0:
+        return candidates[:0], dist[:0]
+    dist = dist / sum_dist
+
+    if abs_distribution is not None:
+        dist_mask = np.isin(candidates, np.arange(len(abs_distribution)))
+        abs_dist_mask = np.isin(np.arange(len(abs_distribution)), candidates)
+
+        abs_dist_relative = np.zeros(len(dist))
+        if np.any(dist_mask):
+            abs_dist_relative[dist_mask] = abs_distribution[abs_dist_mask]
+
+        dist = dist * abs_dist_relative
+        sum_dist = np.sum(dist)
+        if sum_dist == 0:
+            return candidates[:0], dist[:0]
+        dist = dist / sum_dist
+
+    # Zero-probability pitches do not change which pitch choice draws
+    nonzero = dist > 0
+    return candidates[nonzero], dist[nonzero]
+
+
+def degrade_each(deg_fun, batch, rng=None, **kwargs):
+    """
+    Perform a degradation on each excerpt of the given batch in turn. This is
+    how degradations without a vectorized version are applied to a batch.
+
+    Parameters
+    ----------
+    deg_fun : function
+        The degradation to perform (for example, pitch_shift).
+
+    batch : NoteBatch
+        A batch of excerpts.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state.
+
+    kwargs
+        Keyword arguments for the degradation.
+
+    Returns
+    -------
+    degraded : NoteBatch
+        A batch containing each degraded excerpt. Excerpts which could not be
+        degraded are left empty.
+
+    success : np.ndarray
+        A boolean array which is True for each excerpt that was degraded.
+    """
+    results = [deg_fun(excerpt, rng=rng, **kwargs) for excerpt in batch.to_excerpts()]
+    success = np.array([result is not None for result in results], dtype=bool)
+    degraded = NoteBatch.from_excerpts(
+        [NoteArray() if result is None else result for result in results]
+    )
+    return degraded, success
+
+
+def _edit_notes_batch(batch, valid, propose, tries, rng):
+    """
+    Change one note of each excerpt of the given batch, as the rejection
+    sampling loop of each single-note degradation does. On each try, a random
+    valid note is chosen from every excerpt not yet degraded, and new values
+    are proposed for all of them at once. Each proposal is kept if it changes
+    its note and does not overlap any other note of its excerpt.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        A batch of excerpts.
+
+    valid : np.ndarray
+        A boolean array which is True for each note of batch.notes which may
+        be changed.
+
+    propose : function
+        Called as propose(indices, new) on each try, with the indices of the
+        chosen notes in batch.notes and a structured array of their current
+        values. It should write their new values into new.
+
+    tries : int
+        The number of times to try to degrade each excerpt before giving up.
+
+    rng : np.random.Generator
+        The random number generator to use.
+
+    Returns
+    -------
+    degraded : NoteBatch
+        A batch containing each excerpt (sorted), with one note changed in
+        those which were degraded.
+
+    success : np.ndarray
+        A boolean array which is True for each excerpt that was degraded.
+    """
+    excerpt_index = batch.excerpt_index()
+    valid_notes = np.flatnonzero(valid)
+    counts = np.bincount(excerpt_index[valid_notes], minlength=len(batch))
+    starts = np.cumsum(counts) - counts
+
+    data = batch.notes.data.copy()
+    success = np.zeros(len(batch), dtype=bool)
+    pending = np.flatnonzero(counts > 0)
+    for _ in range(tries):
+        if len(pending) == 0:
+            break
+
+        # Sample a random valid note from each excerpt
+        indices = valid_notes[starts[pending] + rng.integers(counts[pending])]
+        old = batch.notes.data[indices]
+        new = old.copy()
+        propose(indices, new)
+
+        accept = (new != old) & ~batch_overlaps(
+            batch.notes, excerpt_index, NoteArray(new), pending, indices
+        )
+        data[indices[accept]] = new[accept]
+        success[pending[accept]] = True
+        pending = pending[~accept]
+
+    return NoteBatch(NoteArray(data), batch.offsets).sort(), success
+
+
+def _excerpt_end_times(batch, excerpt_index, offset):
+    """
+    Get the latest offset time of each note's excerpt in the given batch.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        A batch of excerpts.
+
+    excerpt_index : np.ndarray
+        The excerpt of each note, as returned by batch.excerpt_index().
+
+    offset : np.ndarray
+        The offset time of each note.
+
+    Returns
+    -------
+    end_time : np.ndarray
+        The end time of the excerpt of each note.
+    """
+    end_time = np.zeros(len(batch), dtype=np.int64)
+    np.maximum.at(end_time, excerpt_index, offset)
+    return end_time[excerpt_index]
+
+
+@set_random_seed
+@instrumented
+def pitch_shift(
+    excerpt,
+    min_pitch=MIN_PITCH_DEFAULT,
+    max_pitch=MAX_PITCH_DEFAULT,
+    align_pitch=False,
+    distribution=None,
+    abs_distribution=None,
+    tries=TRIES_DEFAULT,
+    rejection_free=False,
+    sort=True,
+    return_edit=False,
+    rng=None,
+):
+    """
+    Shift the pitch of one note from the given excerpt.
+
+    Parameters
+    ----------
+    excerpt : pd.DataFrame or NoteArray
+        An excerpt from a piece of music.
+
+    min_pitch : int
+        The minimum pitch to which a note may be shifted.
+
+    max_pitch : int
+        The maximum pitch to which a note may be shifted.
+
+    align_pitch : bool
+        Align the note's new pitch to an existing pitch of another note.
+        If the given excerpt has only 1 note, align_pitch is set to False.
+
+    distribution : list(float)
+        If given, a list describing the distribution of pitch shifts.
+        Element (len(distribution) // 2) refers to the note's original
+        pitch, and will be set to 0. Additionally, pitches outside of the
+        range [min_pitch, max_pitch] will also be set to 0. The distribution
+        will then be normalized to sum to 1, and used to generate a new
+        pitch. None implies a uniform distribution.
+
+    abs_distribution : list(float)
+        If given, a list describing the distribution of pitch shifts in terms
+        of absolute pitch. Generally, abs_distribution[i] is the probability of
+        a pitch shift to pitch i. Pitches outside of the range [min_pitch,
+        max_pitch] will be set to 0, as well as the pitch of the note's
+        original pitch. The distribution will be normalized to sum to 1.
+        If distribution is also given, the two normalized distributions will be
+        multiplied by each other and then re-normalized. None implies a uniform
+        distribution.
+
+    seed : int
+        A seed to be supplied to np.random.seed(). None leaves numpy's
+        random state unchanged.
+
+    sort : boolean
+        True to sort the degraded notes. False to leave them in an arbitrary
+        order, for example when more degradations will be applied to them
+        before sorting.
+
+    return_edit : boolean
+        True to return a NoteEdit recording the changes made to the excerpt,
+        rather than the degraded excerpt itself. Its note indices refer to the
+        excerpt as given, and sort is not used.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
+    tries : int
+        The number of times to try the degradation before giving up, in the case
+        that the degraded excerpt overlaps. Not used if rejection_free is True.
+
+    rejection_free : boolean
+        True to sample only from the pitch shifts which do not cause an overlap,
+        rather than rejecting overlapping ones. The shifted note is chosen
+        uniformly from those with any such pitch shift, and the degradation
+        fails only if there is none.
+
+
+    Returns
+    -------
+    degraded : pd.DataFrame or NoteArray or NoteEdit
+        A degradation of the excerpt, with the pitch of one note changed,
+        or None if the degradation cannot be performed.
+    """
+    if len(excerpt) == 0:
+        _fail(NO_VALID_NOTES, "No notes to pitch shift. Returning None.")
+        return None
+
+    if len(excerpt) == 1:
+        align_pitch = False
+
+    notes = _pre_process_notes(excerpt)
+    rng = get_rng(rng)
+    pitches = notes.pitch
+
+    if distribution is not None:
+        distribution = np.array(distribution, dtype=float)
+    if abs_distribution is not None:
+        abs_distribution = np.array(abs_distribution, dtype=float)
+
+    # Enforce min and max bounds
+    if abs_distribution is not None:
+        abs_distribution[:min_pitch] = 0
+        abs_distribution[max_pitch + 1 :] = 0
+        nonzero = np.nonzero(abs_distribution)[0]
+        if len(nonzero) == 0:
+            _fail(
+                EMPTY_DISTRIBUTION,
+                "No valid pitches to shift to given min_pitch %s, max_pitch %s, and "
+                "abs_distribution %s. Returning None.",
+                min_pitch,
+                max_pitch,
+                abs_distribution,
+            )
+            return None
+        min_pitch = nonzero[0]
+        max_pitch = nonzero[-1]
+
+    # Assume all notes can be shifted initially
+    valid_notes = np.arange(len(notes))
+
+    # If distribution is being used, some notes may not be possible to pitch
+    # shift. This is because the distribution supplied would only allow them
+    # to be shifted outside of the supplied (min, max) pitch range. For example
+    # A distribution [0, 0, 1] always shifts up one semitone; a note with
+    # pitch equal to max_pitch can't be shifted with this distribution.
+    if distribution is not None:
+        assert all(
+            [dd >= 0 for dd in distribution]
+        ), "A value in supplied distribution is negative."
+        zero_idx = len(distribution) // 2
+        distribution[zero_idx] = 0
+
+        if np.sum(distribution) == 0:
+            _fail(
+                EMPTY_DISTRIBUTION,
+                "distribution contains only 0s after "
+                "setting distribution[zero_idx] value to 0. "
+                "Returning None.",
+            )
+            return None
+
+        nonzero_indices = np.nonzero(distribution)[0]
+
+        lowest_idx = nonzero_indices[0]
+        highest_idx = nonzero_indices[-1]
+
+        min_pitch_shift = zero_idx - lowest_idx
+        max_pitch_shift = highest_idx - zero_idx
+
+        max_to_sample = max_pitch + min_pitch_shift
+        min_to_sample = min_pitch - max_pitch_shift
+
+        valid_notes = np.nonzero(_between(pitches, min_to_sample, max_to_sample))[0]
+
+        if len(valid_notes) == 0:
+            _fail(
+                NO_VALID_NOTES,
+                "No valid pitches to shift given "
+                f"min_pitch {min_pitch}, max_pitch {max_pitch}, "
+                f"and distribution {distribution} (after setting "
+                "distribution[zero_idx] to 0). Returning None.",
+            )
+            return None
+
+    if rejection_free:
+        onsets = notes.onset.astype(np.int64)
+        offsets = notes.offset
+        for note_index in rng.permutation(valid_notes):
+            pitch = int(pitches[note_index])
+            if distribution is None and abs_distribution is None and not align_pitch:
+                targets, p = np.arange(min_pitch, max_pitch + 1), None
+                targets = targets[targets != pitch]
+            else:
+                targets, p, _ = _pitch_shift_choices(
+                    pitch,
+                    pitches,
+                    min_pitch,
+                    max_pitch,
+                    align_pitch,
+                    distribution,
+                    abs_distribution,
+                )
+
+            # Remove pitches of notes which overlap this one in time
+            overlapping = (
+                (notes.track == notes.track[note_index])
+                & (onsets < offsets[note_index])
+                & (offsets > onsets[note_index])
+            )
+            overlapping[note_index] = False
+            free = ~np.isin(targets, pitches[overlapping])
+
+            if np.any(free):
+                if p is not None:
+                    p = p[free] / np.sum(p[free])
+                new_pitch = rng.choice(targets[free], p=p)
+                break
+        else:
+            _fail(NO_FREE_EDIT, NO_FREE_EDIT_WARN_MSG)
+            return None
+
+        if return_edit:
+            return NoteEdit.change(notes, note_index, pitch=new_pitch)
+        degraded = notes.copy()
+        degraded.pitch[note_index] = new_pitch
+
+        return _post_process_notes(degraded, excerpt, sort=sort)
+
+    interval_index = notes.interval_index()
+    while True:
+        count_try()
+
+        # Sample a random note
+        note_index = valid_notes[rng.integers(len(valid_notes))]
+        pitch = int(pitches[note_index])
+        new_pitch = pitch
+
+        # Shift its pitch
+        if distribution is None and abs_distribution is None and not align_pitch:
+            # Uniform distribution
+            if min_pitch != max_pitch or min_pitch != pitch:
+                while new_pitch == pitch:
+                    new_pitch = rng.integers(min_pitch, max_pitch + 1)
+        else:
+            targets, _, cdf = _pitch_shift_choices(
+                pitch,
+                pitches,
+                min_pitch,
+                max_pitch,
+                align_pitch,
+                distribution,
+                abs_distribution,
+            )
+            if len(targets) > 0:
+                new_pitch = _sample_table(targets, cdf, rng)
+
+        # Check if overlaps
+        if new_pitch != pitch and not interval_index.overlaps(
+            int(notes.onset[note_index]),
+            int(notes.dur[note_index]),
+            notes.track[note_index],
+            new_pitch,
+            exclude=note_index,
+        ):
+            break
+
+        if tries == 1:
+            _fail(TRIES_EXHAUSTED, TRIES_WARN_MSG)
+            return None
+        tries -= 1
+
+    if return_edit:
+        return NoteEdit.change(notes, note_index, pitch=new_pitch)
+    degraded = notes.copy()
+    degraded.pitch[note_index] = new_pitch
+
+    return _post_process_notes(degraded, excerpt, sort=sort)
+
+
+@set_random_seed
+def pitch_shift_batch(
+    batch,
+    min_pitch=MIN_PITCH_DEFAULT,
+    max_pitch=MAX_PITCH_DEFAULT,
+    align_pitch=False,
+    distribution=None,
+    abs_distribution=None,
+    tries=TRIES_DEFAULT,
+    rejection_free=False,
+    rng=None,
+):
+    """
+    Shift the pitch of one note in each excerpt of the given batch. This is a
+    vectorized version of pitch_shift, with the same arguments. Only uniform
+    sampling is vectorized: with align_pitch, a distribution, or
+    rejection_free, pitch_shift is performed on each excerpt in turn.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        A batch of excerpts.
+
+    seed : int
+        A seed to be supplied to np.random.seed(). None leaves numpy's
+        random state unchanged.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
+    Returns
+    -------
+    degraded : NoteBatch
+        A batch containing each excerpt (sorted), with the pitch of one note
+        changed in those which could be degraded.
+
+    success : np.ndarray
+        A boolean array which is True for each excerpt that was degraded.
+    """
+    if (
+        align_pitch
+        or distribution is not None
+        or abs_distribution is not None
+        or rejection_free
+    ):
+        return degrade_each(
+            pitch_shift,
+            batch,
+            rng=rng,
+            min_pitch=min_pitch,
+            max_pitch=max_pitch,
+            align_pitch=align_pitch,
+            distribution=distribution,
+            abs_distribution=abs_distribution,
+            tries=tries,
+            rejection_free=rejection_free,
+        )
+    rng = get_rng(rng)
+
+    def propose(indices, new):
+        # Sample uniformly from the pitches in range, skipping the current one
+        pitch = new["pitch"].astype(np.int64)
+        in_range = _between(pitch, min_pitch, max_pitch)
+        num_choices = (max_pitch - min_pitch + 1) - in_range
+        new_pitch = min_pitch + rng.integers(np.maximum(num_choices, 1))
+        new_pitch += in_range & (new_pitch >= pitch)
+        new["pitch"] = np.where(num_choices > 0, new_pitch, pitch)
+
+    valid = np.ones(len(batch.notes), dtype=bool)
+    return _edit_notes_batch(batch, valid, propose, tries, rng)
+
+
+@set_random_seed
+@instrumented
+def time_shift(
+    excerpt,
+    min_shift=MIN_SHIFT_DEFAULT,
+    max_shift=MAX_SHIFT_DEFAULT,
+    align_onset=False,
+    tries=TRIES_DEFAULT,
+    rejection_free=False,
+    sort=True,
+    return_edit=False,
+    rng=None,
+):
+    """
+    Shift the onset and offset times of one note from the given excerpt,
+    leaving its duration unchanged.
+
+    Parameters
+    ----------
+    excerpt : pd.DataFrame or NoteArray
+        An excerpt from a piece of music.
+
+    min_shift : int
+        The minimum amount by which the note will be shifted.
+
+    max_shift : int
+        The maximum amount by which the note will be shifted.
+
+    align_onset : boolean
+        Align the shifted note to the onset time of an existing note
+        (within the given shift range).
+
+    seed : int
+        A seed to be supplied to np.random.seed(). None leaves numpy's
+        random state unchanged.
+
+    sort : boolean
+        True to sort the degraded notes. False to leave them in an arbitrary
+        order, for example when more degradations will be applied to them
+        before sorting.
+
+    return_edit : boolean
+        True to return a NoteEdit recording the changes made to the excerpt,
+        rather than the degraded excerpt itself. Its note indices refer to the
+        excerpt as given, and sort is not used.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
+    tries : int
+        The number of times to try the degradation before giving up, in the case
+        that the degraded excerpt overlaps. Not used if rejection_free is True.
+
+    rejection_free : boolean
+        True to sample only from the shifts which do not cause an overlap,
+        rather than rejecting overlapping ones. The shifted note is chosen
+        uniformly from those with any such shift, and the degradation fails
+        only if there is none.
+
+
+    Returns
+    -------
+    degraded : pd.DataFrame or NoteArray or NoteEdit
+        A degradation of the excerpt, with the timing of one note changed,
+        or None if there are no notes that can be changed.
+    """
+    notes = _pre_process_notes(excerpt)
+    rng = get_rng(rng)
+
+    onset = notes.onset.astype(np.int64)
+    offset = notes.offset
+    end_time = offset.max() if len(notes) > 0 else 0
+
+    (
+        earliest_earlier_onset,
+        latest_earlier_onset,
+        earliest_later_onset,
+        latest_later_onset,
+    ) = _time_shift_bounds(onset, offset, end_time, min_shift, max_shift)
+
+    if align_onset:
+        # Close ranges which do not contain a note to align to
+        unique_onsets = _unique(onset)
+        sorted_onsets = np.sort(unique_onsets)
+        earliest_earlier_onset = np.where(
+            _any_in_range(sorted_onsets, earliest_earlier_onset, latest_earlier_onset),
+            earliest_earlier_onset,
+            latest_earlier_onset,
+        )
+        earliest_later_onset = np.where(
+            _any_in_range(sorted_onsets, earliest_later_onset, latest_later_onset),
+            earliest_later_onset,
+            latest_later_onset,
+        )
 
-    eeo = earliest_earlier_onset[index]
-    leo = max(latest_earlier_onset[index], eeo)
-    elo = earliest_later_onset[index]
-    llo = max(latest_later_onset[index], elo)
+    # Find valid notes
+    valid = (earliest_earlier_onset < latest_earlier_onset) | (
+        earliest_later_onset < latest_later_onset
+    )
+    valid_notes = np.nonzero(valid)[0]
 
-    if align_onset:
-        valid_onsets = onset.between(eeo, leo - 1) | onset.between(elo, llo - 1)
-        valid_onsets = list(onset[valid_onsets])
-        onset = choice(valid_onsets)
-    else:
-        onset = split_range_sample([(eeo, leo), (elo, llo)])
+    if len(valid_notes) == 0:
+        _fail(NO_VALID_NOTES, "No valid notes to time shift. Returning None.")
+        return None
+
+    interval_index = notes.interval_index()
+
+    if rejection_free:
+        for index in rng.permutation(valid_notes):
+            eeo = earliest_earlier_onset[index]
+            leo = max(latest_earlier_onset[index], eeo)
+            elo = earliest_later_onset[index]
+            llo = max(latest_later_onset[index], elo)
+
+            # Onsets in [on - dur + 1, off) overlap each other note
+            dur = int(notes.dur[index])
+            other_onsets, other_offsets = interval_index.group(
+                notes.track[index], notes.pitch[index], exclude=index
+            )
+            free_range = _free_ranges(
+                [(eeo, leo), (elo, llo)], other_onsets - (dur - 1), other_offsets
+            )
+
+            if align_onset:
+                valid_onsets = _in_ranges(unique_onsets, free_range)
+                if np.any(valid_onsets):
+                    new_onset = rng.choice(unique_onsets[valid_onsets])
+                    break
+            elif len(free_range) > 0:
+                new_onset = split_range_sample(free_range, rng=rng)
+                break
+        else:
+            _fail(NO_FREE_EDIT, NO_FREE_EDIT_WARN_MSG)
+            return None
 
-    degraded = excerpt.copy()
+        if return_edit:
+            return NoteEdit.change(notes, index, onset=new_onset)
+        degraded = notes.copy()
+        degraded.onset[index] = new_onset
 
-    degraded.loc[index, "onset"] = onset
+        return _post_process_notes(degraded, excerpt, sort=sort)
+
+    while True:
+        count_try()
+
+        # Sample a random note
+        index = rng.choice(valid_notes)
+
+        eeo = earliest_earlier_onset[index]
+        leo = max(latest_earlier_onset[index], eeo)
+        elo = earliest_later_onset[index]
+        llo = max(latest_later_onset[index], elo)
+
+        if align_onset:
+            valid_onsets = _between(unique_onsets, eeo, leo - 1) | _between(
+                unique_onsets, elo, llo - 1
+            )
+            new_onset = rng.choice(unique_onsets[valid_onsets])
+        else:
+            new_onset = split_range_sample([(eeo, leo), (elo, llo)], rng=rng)
+
+        # Check if overlaps
+        if not interval_index.overlaps(
+            new_onset,
+            int(notes.dur[index]),
+            notes.track[index],
+            notes.pitch[index],
+            exclude=index,
+        ):
+            break
 
-    # Check if overlaps
-    if overlaps(degraded, index):
         if tries == 1:
-            logging.warning(TRIES_WARN_MSG)
+            _fail(TRIES_EXHAUSTED, TRIES_WARN_MSG)
             return None
-        return time_shift(
-            excerpt,
+        tries -= 1
+
+    if return_edit:
+        return NoteEdit.change(notes, index, onset=new_onset)
+    degraded = notes.copy()
+    degraded.onset[index] = new_onset
+
+    return _post_process_notes(degraded, excerpt, sort=sort)
+
+
+@set_random_seed
+def time_shift_batch(
+    batch,
+    min_shift=MIN_SHIFT_DEFAULT,
+    max_shift=MAX_SHIFT_DEFAULT,
+    align_onset=False,
+    tries=TRIES_DEFAULT,
+    rejection_free=False,
+    rng=None,
+):
+    """
+    Shift the onset and offset times of one note in each excerpt of the given
+    batch. This is a vectorized version of time_shift, with the same
+    arguments. With align_onset or rejection_free, time_shift is performed on
+    each excerpt in turn.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        A batch of excerpts.
+
+    seed : int
+        A seed to be supplied to np.random.seed(). None leaves numpy's
+        random state unchanged.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
+    Returns
+    -------
+    degraded : NoteBatch
+        A batch containing each excerpt (sorted), with the timing of one note
+        changed in those which could be degraded.
+
+    success : np.ndarray
+        A boolean array which is True for each excerpt that was degraded.
+    """
+    if align_onset or rejection_free:
+        return degrade_each(
+            time_shift,
+            batch,
+            rng=rng,
             min_shift=min_shift,
             max_shift=max_shift,
             align_onset=align_onset,
-            tries=tries - 1,
+            tries=tries,
+            rejection_free=rejection_free,
         )
+    rng = get_rng(rng)
+
+    notes = batch.notes
+    excerpt_index = batch.excerpt_index()
+    onset = notes.onset.astype(np.int64)
+    offset = notes.offset
+    end_time = _excerpt_end_times(batch, excerpt_index, offset)
+    eeo, leo, elo, llo = _time_shift_bounds(
+        onset, offset, end_time, min_shift, max_shift
+    )
+    valid = (eeo < leo) | (elo < llo)
+    lows = np.stack((eeo, elo), axis=1)
+    highs = np.stack((np.maximum(leo, eeo), np.maximum(llo, elo)), axis=1)
+
+    def propose(indices, new):
+        new["onset"] = split_range_sample_batch(lows[indices], highs[indices], rng=rng)
 
-    degraded = post_process(degraded)
-    return degraded
+    return _edit_notes_batch(batch, valid, propose, tries, rng)
 
 
 @set_random_seed
+@instrumented
 def onset_shift(
     excerpt,
     min_shift=MIN_SHIFT_DEFAULT,
@@ -555,13 +1723,17 @@ def onset_shift(
     align_onset=False,
     align_dur=False,
     tries=TRIES_DEFAULT,
+    rejection_free=False,
+    sort=True,
+    return_edit=False,
+    rng=None,
 ):
     """
     Shift the onset time of one note from the given excerpt.
 
     Parameters
     ----------
-    excerpt : df.DataFrame
+    excerpt : pd.DataFrame or NoteArray
         An excerpt from a piece of music.
 
     min_shift : int
@@ -589,352 +1761,876 @@ def onset_shift(
         A seed to be supplied to np.random.seed(). None leaves numpy's
         random state unchanged.
 
+    sort : boolean
+        True to sort the degraded notes. False to leave them in an arbitrary
+        order, for example when more degradations will be applied to them
+        before sorting.
+
+    return_edit : boolean
+        True to return a NoteEdit recording the changes made to the excerpt,
+        rather than the degraded excerpt itself. Its note indices refer to the
+        excerpt as given, and sort is not used.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
     tries : int
         The number of times to try the degradation before giving up, in the case
-        that the degraded excerpt overlaps.
+        that the degraded excerpt overlaps. Not used if rejection_free is True.
+
+    rejection_free : boolean
+        True to sample only from the onset shifts which do not cause an overlap,
+        rather than rejecting overlapping ones. The shifted note is chosen
+        uniformly from those with any such onset shift, and the degradation fails
+        only if there is none.
 
     Returns
     -------
-    degraded : df.DataFrame
+    degraded : pd.DataFrame or NoteArray or NoteEdit
         A degradation of the excerpt, with the onset time of one note
         changed, or None if the degradation cannot be performed.
     """
-    excerpt = pre_process(excerpt)
-
-    min_shift = max(min_shift, 1)
-    min_duration -= 1  # This makes computation below simpler
-
-    onset = excerpt["onset"]
-    offset = onset + excerpt["dur"]
-    unique_durs = excerpt["dur"].unique()
-
-    # Lengthen bounds (decrease onset)
-    earliest_lengthened_onset = (
-        (offset - max_duration).clip(lower=onset - max_shift).clip(lower=0)
-    )
-    latest_lengthened_onset = (onset - (min_shift - 1)).clip(
-        upper=offset - min_duration
+    notes = _pre_process_notes(excerpt)
+    rng = get_rng(rng)
+
+    onset = notes.onset.astype(np.int64)
+    offset = notes.offset
+    unique_durs = _unique(notes.dur.astype(np.int64))
+
+    (
+        earliest_lengthened_onset,
+        latest_lengthened_onset,
+        earliest_shortened_onset,
+        latest_shortened_onset,
+    ) = _onset_shift_bounds(
+        onset, offset, min_shift, max_shift, min_duration, max_duration
     )
 
-    # Shorten bounds (increase onset)
-    latest_shortened_onset = (offset - min_duration).clip(upper=onset + (max_shift + 1))
-    earliest_shortened_onset = (onset + min_shift).clip(lower=offset - max_duration)
-
     if align_onset:
         # Find ranges which contain a note to align to
-        # I couldn't think of a better solution than iterating here.
-        # This code checks, for every range, whether at least 1 onset
-        # lies within that range.
-        onset = pd.Series(onset.unique())
-        for i, (elo, llo, eso, lso) in enumerate(
-            zip(
+        unique_onsets = _unique(onset)
+        sorted_onsets = np.sort(unique_onsets)
+        if align_dur:
+            # Here, align both onset and dur. The onsets giving each note an
+            # existing duration must also be existing onsets.
+            sorted_durs = np.sort(unique_durs)
+            lengthened_valid = _any_aligned_onset(
+                sorted_onsets,
+                sorted_durs,
+                offset,
                 earliest_lengthened_onset,
                 latest_lengthened_onset,
+            )
+            shortened_valid = _any_aligned_onset(
+                sorted_onsets,
+                sorted_durs,
+                offset,
                 earliest_shortened_onset,
                 latest_shortened_onset,
             )
-        ):
-            # Go through each range to check there is a valid onset
-            earlier_valid = onset.between(elo, llo - 1)
-            later_valid = onset.between(eso, lso - 1)
-
-            if align_dur:
-                # Here, align both onset and dur
-                resulting_dur = offset.iloc[i] - onset
-                dur_valid = resulting_dur.isin(unique_durs)
-                earlier_valid = earlier_valid & dur_valid
-                later_valid = later_valid & dur_valid
-
-            # Collapse down
-            earlier_valid = earlier_valid.any()
-            later_valid = later_valid.any()
-
-            # Close invalid ranges
-            if not earlier_valid:
-                earliest_lengthened_onset.iloc[i] = llo
-            if not later_valid:
-                earliest_shortened_onset.iloc[i] = lso
+        else:
+            lengthened_valid = _any_in_range(
+                sorted_onsets, earliest_lengthened_onset, latest_lengthened_onset
+            )
+            shortened_valid = _any_in_range(
+                sorted_onsets, earliest_shortened_onset, latest_shortened_onset
+            )
 
     elif align_dur:
-        # Here, align_onset is False.
-        # Find ranges which contain a duration to align to
-        # I couldn't think of a better solution than iterating here.
-        # This code checks, for every range, whether at least 1 dur
-        # lies within that range.
-        durs = pd.Series(unique_durs)
-        for i, (elo, llo, lso, eso) in enumerate(
-            zip(
-                earliest_lengthened_onset,
-                latest_lengthened_onset,
-                latest_shortened_onset,
-                earliest_shortened_onset,
-            )
-        ):
-            # Go through each range to check there is a valid dur
-            result = offset[i] - durs
-            lengthened_valid = result.between(elo, llo - 1).any()
-            shortened_valid = result.between(eso, lso - 1).any()
+        # Here, align_onset is False. Find ranges which contain a duration
+        # to align to: onsets in [low, high) give durations in
+        # (offset - high, offset - low].
+        sorted_durs = np.sort(unique_durs)
+        lengthened_valid = _any_in_range(
+            sorted_durs,
+            offset - latest_lengthened_onset + 1,
+            offset - earliest_lengthened_onset + 1,
+        )
+        shortened_valid = _any_in_range(
+            sorted_durs,
+            offset - latest_shortened_onset + 1,
+            offset - earliest_shortened_onset + 1,
+        )
 
-            # Close invalid ranges
-            if not lengthened_valid:
-                earliest_lengthened_onset.iloc[i] = llo
-            if not shortened_valid:
-                earliest_shortened_onset.iloc[i] = lso
+    if align_onset or align_dur:
+        # Close invalid ranges
+        earliest_lengthened_onset = np.where(
+            lengthened_valid, earliest_lengthened_onset, latest_lengthened_onset
+        )
+        earliest_shortened_onset = np.where(
+            shortened_valid, earliest_shortened_onset, latest_shortened_onset
+        )
 
     # Find valid notes
     valid = (earliest_lengthened_onset < latest_lengthened_onset) | (
         earliest_shortened_onset < latest_shortened_onset
     )
-    valid_notes = list(valid.index[valid])
+    valid_notes = np.nonzero(valid)[0]
 
-    if not valid_notes:
-        logging.warning("No valid notes to onset shift. Returning None.")
+    if len(valid_notes) == 0:
+        _fail(NO_VALID_NOTES, "No valid notes to onset shift. Returning None.")
         return None
 
-    # Sample a random note
-    index = choice(valid_notes)
+    interval_index = notes.interval_index()
 
-    elo = earliest_lengthened_onset[index]
-    llo = max(latest_lengthened_onset[index], elo)
-    eso = earliest_shortened_onset[index]
-    lso = max(latest_shortened_onset[index], eso)
+    if rejection_free:
+        for index in rng.permutation(valid_notes):
+            elo = earliest_lengthened_onset[index]
+            llo = max(latest_lengthened_onset[index], elo)
+            eso = earliest_shortened_onset[index]
+            lso = max(latest_shortened_onset[index], eso)
 
-    # Sample onset
-    if align_onset:
-        valid_onsets = onset.between(elo, llo - 1) | onset.between(eso, lso - 1)
+            # Onsets before the offset of any note which begins before this
+            # note's offset would overlap it
+            other_onsets, other_offsets = interval_index.group(
+                notes.track[index], notes.pitch[index], exclude=index
+            )
+            blocked_ends = other_offsets[other_onsets < offset[index]]
+            free_range = _free_ranges(
+                [(elo, llo), (eso, lso)],
+                np.full(len(blocked_ends), _MIN_INT),
+                blocked_ends,
+            )
 
-        if align_dur:
-            # Here, align both
-            valid_durs = (offset[index] - onset).isin(unique_durs)
-            valid_onsets = valid_onsets & valid_durs
+            if align_onset:
+                valid_onsets = _in_ranges(unique_onsets, free_range)
+                if align_dur:
+                    valid_durs = np.isin(offset[index] - unique_onsets, unique_durs)
+                    valid_onsets = valid_onsets & valid_durs
+                if np.any(valid_onsets):
+                    new_onset = rng.choice(unique_onsets[valid_onsets])
+                    break
+            elif align_dur:
+                valid_durs = _in_ranges(offset[index] - unique_durs, free_range)
+                if np.any(valid_durs):
+                    new_onset = offset[index] - rng.choice(unique_durs[valid_durs])
+                    break
+            elif len(free_range) > 0:
+                new_onset = split_range_sample(free_range, rng=rng)
+                break
+        else:
+            _fail(NO_FREE_EDIT, NO_FREE_EDIT_WARN_MSG)
+            return None
 
-        valid_onsets = list(onset[valid_onsets])
-        onset = choice(valid_onsets)
+        new_dur = offset[index] - new_onset
+        if return_edit:
+            return NoteEdit.change(notes, index, onset=new_onset, dur=new_dur)
+        degraded = notes.copy()
+        degraded.onset[index] = new_onset
+        degraded.dur[index] = new_dur
 
-    elif align_dur:
-        # Align dur but not onset
-        onsets = offset[index] - durs
-        valid_durs = onsets.between(elo, llo - 1) | onsets.between(eso, lso - 1)
-        valid_durs = list(durs[valid_durs])
-        onset = offset[index] - choice(valid_durs)
+        return _post_process_notes(degraded, excerpt, sort=sort)
 
-    else:
-        # No alignment
-        onset = split_range_sample([(elo, llo), (eso, lso)])
+    while True:
+        count_try()
+
+        # Sample a random note
+        index = rng.choice(valid_notes)
+
+        elo = earliest_lengthened_onset[index]
+        llo = max(latest_lengthened_onset[index], elo)
+        eso = earliest_shortened_onset[index]
+        lso = max(latest_shortened_onset[index], eso)
+
+        # Sample onset
+        if align_onset:
+            valid_onsets = _between(unique_onsets, elo, llo - 1) | _between(
+                unique_onsets, eso, lso - 1
+            )
+
+            if align_dur:
+                # Here, align both
+                valid_durs = np.isin(offset[index] - unique_onsets, unique_durs)
+                valid_onsets = valid_onsets & valid_durs
+
+            new_onset = rng.choice(unique_onsets[valid_onsets])
+
+        elif align_dur:
+            # Align dur but not onset
+            onsets = offset[index] - unique_durs
+            valid_durs = _between(onsets, elo, llo - 1) | _between(
+                onsets, eso, lso - 1
+            )
+            new_onset = offset[index] - rng.choice(unique_durs[valid_durs])
 
-    degraded = excerpt.copy()
+        else:
+            # No alignment
+            new_onset = split_range_sample([(elo, llo), (eso, lso)], rng=rng)
+
+        new_dur = offset[index] - new_onset
 
-    degraded.loc[index, "onset"] = onset
-    degraded.loc[index, "dur"] = offset[index] - onset
+        # Check if overlaps
+        if not interval_index.overlaps(
+            new_onset, new_dur, notes.track[index], notes.pitch[index], exclude=index
+        ):
+            break
 
-    # Check if overlaps
-    if overlaps(degraded, index):
         if tries == 1:
-            logging.warning(TRIES_WARN_MSG)
+            _fail(TRIES_EXHAUSTED, TRIES_WARN_MSG)
             return None
-        return onset_shift(
-            excerpt,
+        tries -= 1
+
+    if return_edit:
+        return NoteEdit.change(notes, index, onset=new_onset, dur=new_dur)
+    degraded = notes.copy()
+    degraded.onset[index] = new_onset
+    degraded.dur[index] = new_dur
+
+    return _post_process_notes(degraded, excerpt, sort=sort)
+
+
+@set_random_seed
+def onset_shift_batch(
+    batch,
+    min_shift=MIN_SHIFT_DEFAULT,
+    max_shift=MAX_SHIFT_DEFAULT,
+    min_duration=MIN_DURATION_DEFAULT,
+    max_duration=MAX_DURATION_DEFAULT,
+    align_onset=False,
+    align_dur=False,
+    tries=TRIES_DEFAULT,
+    rejection_free=False,
+    rng=None,
+):
+    """
+    Shift the onset time of one note in each excerpt of the given batch. This
+    is a vectorized version of onset_shift, with the same arguments. With
+    align_onset, align_dur, or rejection_free, onset_shift is performed on
+    each excerpt in turn.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        A batch of excerpts.
+
+    seed : int
+        A seed to be supplied to np.random.seed(). None leaves numpy's
+        random state unchanged.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
+    Returns
+    -------
+    degraded : NoteBatch
+        A batch containing each excerpt (sorted), with the onset time of one
+        note changed in those which could be degraded.
+
+    success : np.ndarray
+        A boolean array which is True for each excerpt that was degraded.
+    """
+    if align_onset or align_dur or rejection_free:
+        return degrade_each(
+            onset_shift,
+            batch,
+            rng=rng,
             min_shift=min_shift,
             max_shift=max_shift,
-            min_duration=min_duration + 1,  # Changed above
+            min_duration=min_duration,
             max_duration=max_duration,
             align_onset=align_onset,
             align_dur=align_dur,
-            tries=tries - 1,
+            tries=tries,
+            rejection_free=rejection_free,
+        )
+    rng = get_rng(rng)
+
+    notes = batch.notes
+    onset = notes.onset.astype(np.int64)
+    offset = notes.offset
+    elo, llo, eso, lso = _onset_shift_bounds(
+        onset, offset, min_shift, max_shift, min_duration, max_duration
+    )
+    valid = (elo < llo) | (eso < lso)
+    lows = np.stack((elo, eso), axis=1)
+    highs = np.stack((np.maximum(llo, elo), np.maximum(lso, eso)), axis=1)
+
+    def propose(indices, new):
+        new_onset = split_range_sample_batch(lows[indices], highs[indices], rng=rng)
+        new["onset"] = new_onset
+        new["dur"] = offset[indices] - new_onset
+
+    return _edit_notes_batch(batch, valid, propose, tries, rng)
+
+
+@set_random_seed
+@instrumented
+def offset_shift(
+    excerpt,
+    min_shift=MIN_SHIFT_DEFAULT,
+    max_shift=MAX_SHIFT_DEFAULT,
+    min_duration=MIN_DURATION_DEFAULT,
+    max_duration=MAX_DURATION_DEFAULT,
+    align_dur=False,
+    tries=TRIES_DEFAULT,
+    rejection_free=False,
+    sort=True,
+    return_edit=False,
+    rng=None,
+):
+    """
+    Shift the offset time of one note from the given excerpt.
+
+    Parameters
+    ----------
+    excerpt : pd.DataFrame or NoteArray
+        An excerpt from a piece of music.
+
+    min_shift : int
+        The minimum amount by which the offset time will be changed.
+
+    max_shift : int
+        The maximum amount by which the offset time will be changed.
+
+    min_duration : int
+        The minimum duration for the resulting note.
+
+    max_duration : int
+        The maximum duration for the resulting note.
+        (The offset time will never go beyond the current last offset
+        in the excerpt.)
+
+    align_dur : boolean
+        True to force the resulting duration to be the same as some
+        other duration in the given excerpt.
+
+    seed : int
+        A seed to be supplied to np.random.seed(). None leaves numpy's
+        random state unchanged.
+
+    sort : boolean
+        True to sort the degraded notes. False to leave them in an arbitrary
+        order, for example when more degradations will be applied to them
+        before sorting.
+
+    return_edit : boolean
+        True to return a NoteEdit recording the changes made to the excerpt,
+        rather than the degraded excerpt itself. Its note indices refer to the
+        excerpt as given, and sort is not used.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
+    tries : int
+        The number of times to try the degradation before giving up, in the case
+        that the degraded excerpt overlaps. Not used if rejection_free is True.
+
+    rejection_free : boolean
+        True to sample only from the offset shifts which do not cause an overlap,
+        rather than rejecting overlapping ones. The shifted note is chosen
+        uniformly from those with any such offset shift, and the degradation fails
+        only if there is none.
+
+
+    Returns
+    -------
+    degraded : pd.DataFrame or NoteArray or NoteEdit
+        A degradation of the excerpt, with the offset time of one note
+        changed, or None if the degradation cannot be performed.
+    """
+    notes = _pre_process_notes(excerpt)
+    rng = get_rng(rng)
+
+    onset = notes.onset.astype(np.int64)
+    duration = notes.dur.astype(np.int64)
+    end_time = (onset + duration).max() if len(notes) > 0 else 0
+
+    (
+        shortest_lengthened_dur,
+        longest_lengthened_dur,
+        shortest_shortened_dur,
+        longest_shortened_dur,
+    ) = _offset_shift_bounds(
+        onset, duration, end_time, min_shift, max_shift, min_duration, max_duration
+    )
+
+    if align_dur:
+        # Close ranges which do not contain a duration to align to
+        durs = _unique(duration)
+        sorted_durs = np.sort(durs)
+        shortest_shortened_dur = np.where(
+            _any_in_range(sorted_durs, shortest_shortened_dur, longest_shortened_dur),
+            shortest_shortened_dur,
+            longest_shortened_dur,
+        )
+        shortest_lengthened_dur = np.where(
+            _any_in_range(
+                sorted_durs, shortest_lengthened_dur, longest_lengthened_dur
+            ),
+            shortest_lengthened_dur,
+            longest_lengthened_dur,
+        )
+
+    # Find valid notes
+    valid = (shortest_lengthened_dur < longest_lengthened_dur) | (
+        shortest_shortened_dur < longest_shortened_dur
+    )
+    valid_notes = np.nonzero(valid)[0]
+
+    if len(valid_notes) == 0:
+        _fail(NO_VALID_NOTES, "No valid notes to offset shift. Returning None.")
+        return None
+
+    interval_index = notes.interval_index()
+
+    if rejection_free:
+        for index in rng.permutation(valid_notes):
+            ssd = shortest_shortened_dur[index]
+            lsd = max(longest_shortened_dur[index], ssd)
+            sld = shortest_lengthened_dur[index]
+            lld = max(longest_lengthened_dur[index], sld)
+
+            # Durations reaching past the onset of any note which ends after
+            # this note's onset would overlap it
+            other_onsets, other_offsets = interval_index.group(
+                notes.track[index], notes.pitch[index], exclude=index
+            )
+            blocked_starts = other_onsets[other_offsets > onset[index]] - onset[index]
+            free_range = _free_ranges(
+                [(ssd, lsd), (sld, lld)],
+                blocked_starts + 1,
+                np.full(len(blocked_starts), _MAX_INT),
+            )
+
+            if align_dur:
+                valid_durs = _in_ranges(durs, free_range)
+                if np.any(valid_durs):
+                    new_dur = rng.choice(durs[valid_durs])
+                    break
+            elif len(free_range) > 0:
+                new_dur = split_range_sample(free_range, rng=rng)
+                break
+        else:
+            _fail(NO_FREE_EDIT, NO_FREE_EDIT_WARN_MSG)
+            return None
+
+        if return_edit:
+            return NoteEdit.change(notes, index, dur=new_dur)
+        degraded = notes.copy()
+        degraded.dur[index] = new_dur
+
+        return _post_process_notes(degraded, excerpt, sort=sort)
+
+    while True:
+        count_try()
+
+        # Sample a random note
+        index = rng.choice(valid_notes)
+
+        ssd = shortest_shortened_dur[index]
+        lsd = max(longest_shortened_dur[index], ssd)
+        sld = shortest_lengthened_dur[index]
+        lld = max(longest_lengthened_dur[index], sld)
+
+        # Sample new duration
+        if align_dur:
+            valid_durs = _between(durs, ssd, lsd - 1) | _between(durs, sld, lld - 1)
+            new_dur = rng.choice(durs[valid_durs])
+        else:
+            new_dur = split_range_sample([(ssd, lsd), (sld, lld)], rng=rng)
+
+        # Check if overlaps
+        if not interval_index.overlaps(
+            int(onset[index]),
+            new_dur,
+            notes.track[index],
+            notes.pitch[index],
+            exclude=index,
+        ):
+            break
+
+        if tries == 1:
+            _fail(TRIES_EXHAUSTED, TRIES_WARN_MSG)
+            return None
+        tries -= 1
+
+    if return_edit:
+        return NoteEdit.change(notes, index, dur=new_dur)
+    degraded = notes.copy()
+    degraded.dur[index] = new_dur
+
+    return _post_process_notes(degraded, excerpt, sort=sort)
+
+
+@set_random_seed
+def offset_shift_batch(
+    batch,
+    min_shift=MIN_SHIFT_DEFAULT,
+    max_shift=MAX_SHIFT_DEFAULT,
+    min_duration=MIN_DURATION_DEFAULT,
+    max_duration=MAX_DURATION_DEFAULT,
+    align_dur=False,
+    tries=TRIES_DEFAULT,
+    rejection_free=False,
+    rng=None,
+):
+    """
+    Shift the offset time of one note in each excerpt of the given batch. This
+    is a vectorized version of offset_shift, with the same arguments. With
+    align_dur or rejection_free, offset_shift is performed on each excerpt in
+    turn.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        A batch of excerpts.
+
+    seed : int
+        A seed to be supplied to np.random.seed(). None leaves numpy's
+        random state unchanged.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
+    Returns
+    -------
+    degraded : NoteBatch
+        A batch containing each excerpt (sorted), with the offset time of one
+        note changed in those which could be degraded.
+
+    success : np.ndarray
+        A boolean array which is True for each excerpt that was degraded.
+    """
+    if align_dur or rejection_free:
+        return degrade_each(
+            offset_shift,
+            batch,
+            rng=rng,
+            min_shift=min_shift,
+            max_shift=max_shift,
+            min_duration=min_duration,
+            max_duration=max_duration,
+            align_dur=align_dur,
+            tries=tries,
+            rejection_free=rejection_free,
         )
+    rng = get_rng(rng)
+
+    notes = batch.notes
+    excerpt_index = batch.excerpt_index()
+    onset = notes.onset.astype(np.int64)
+    duration = notes.dur.astype(np.int64)
+    end_time = _excerpt_end_times(batch, excerpt_index, onset + duration)
+    sld, lld, ssd, lsd = _offset_shift_bounds(
+        onset, duration, end_time, min_shift, max_shift, min_duration, max_duration
+    )
+    valid = (sld < lld) | (ssd < lsd)
+    lows = np.stack((ssd, sld), axis=1)
+    highs = np.stack((np.maximum(lsd, ssd), np.maximum(lld, sld)), axis=1)
+
+    def propose(indices, new):
+        new["dur"] = split_range_sample_batch(lows[indices], highs[indices], rng=rng)
 
-    degraded = post_process(degraded)
-    return degraded
+    return _edit_notes_batch(batch, valid, propose, tries, rng)
 
 
 @set_random_seed
-def offset_shift(
-    excerpt,
-    min_shift=MIN_SHIFT_DEFAULT,
-    max_shift=MAX_SHIFT_DEFAULT,
-    min_duration=MIN_DURATION_DEFAULT,
-    max_duration=MAX_DURATION_DEFAULT,
-    align_dur=False,
-    tries=TRIES_DEFAULT,
+@instrumented
+def remove_note(
+    excerpt, tries=TRIES_DEFAULT, sort=True, return_edit=False, rng=None
 ):
     """
-    Shift the offset time of one note from the given excerpt.
+    Remove one note from the given excerpt.
 
     Parameters
     ----------
-    excerpt : df.DataFrame
+    excerpt : pd.DataFrame or NoteArray
         An excerpt from a piece of music.
 
-    min_shift : int
-        The minimum amount by which the offset time will be changed.
+    seed : int
+        A seed to be supplied to np.random.seed(). None leaves numpy's
+        random state unchanged.
 
-    max_shift : int
-        The maximum amount by which the offset time will be changed.
+    sort : boolean
+        Whether to sort the degraded notes. This is not used, since removing a
+        note does not change the order of the others, but we keep it for
+        consistency.
 
-    min_duration : int
-        The minimum duration for the resulting note.
+    return_edit : boolean
+        True to return a NoteEdit recording the changes made to the excerpt,
+        rather than the degraded excerpt itself. Its note indices refer to the
+        excerpt as given, and sort is not used.
 
-    max_duration : int
-        The maximum duration for the resulting note.
-        (The offset time will never go beyond the current last offset
-        in the excerpt.)
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
 
-    align_dur : boolean
-        True to force the resulting duration to be the same as some
-        other duration in the given excerpt.
+    tries : int
+        The number of times to try the degradation before giving up, in the case
+        that the degraded excerpt overlaps. This is not used, but we keep it for
+        consistency.
+
+    Returns
+    -------
+    degraded : pd.DataFrame or NoteArray or NoteEdit
+        A degradation of the excerpt, with one note removed, or None if
+        the degradations cannot be performed.
+    """
+    if len(excerpt) == 0:
+        _fail(NO_VALID_NOTES, "No notes to remove. Returning None.")
+        return None
+
+    notes = _pre_process_notes(excerpt)
+    rng = get_rng(rng)
+
+    # Sample a random note
+    note_index = rng.choice(len(notes))
+
+    # Remove that note
+    if return_edit:
+        return NoteEdit.remove(notes, note_index)
+    degraded = NoteArray(np.delete(notes.data, note_index))
+
+    # No need to check for overlap
+    return _post_process_notes(degraded, excerpt, sort=False)
+
+
+@set_random_seed
+def remove_note_batch(batch, rng=None):
+    """
+    Remove one note from each excerpt of the given batch. This is a vectorized
+    version of remove_note, and it does not loop over the excerpts.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        A batch of excerpts.
 
     seed : int
         A seed to be supplied to np.random.seed(). None leaves numpy's
         random state unchanged.
 
-    tries : int
-        The number of times to try the degradation before giving up, in the case
-        that the degraded excerpt overlaps.
-
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
 
     Returns
     -------
-    degraded : df.DataFrame
-        A degradation of the excerpt, with the offset time of one note
-        changed, or None if the degradation cannot be performed.
+    degraded : NoteBatch
+        A batch containing each excerpt with one note removed. Excerpts which
+        could not be degraded (because they are empty) are left unchanged.
+
+    success : np.ndarray
+        A boolean array which is True for each excerpt that was degraded.
     """
-    excerpt = pre_process(excerpt)
+    rng = get_rng(rng)
+    lengths = batch.lengths
+    success = lengths > 0
 
-    min_shift = max(min_shift, 1)
-    max_duration += 1
+    # Sample a random note from each non-empty excerpt
+    note_indices = batch.offsets[:-1][success] + rng.integers(lengths[success])
 
-    onset = excerpt["onset"]
-    duration = excerpt["dur"]
-    end_time = (onset + duration).max()
+    # Remove those notes
+    keep = np.ones(len(batch.notes), dtype=bool)
+    keep[note_indices] = False
+    offsets = np.zeros(len(batch) + 1, dtype=np.int64)
+    np.cumsum(lengths - success, out=offsets[1:])
 
-    # Lengthen bounds (increase duration)
-    shortest_lengthened_dur = (duration + min_shift).clip(lower=min_duration)
-    longest_lengthened_dur = (
-        (duration + (max_shift + 1))
-        .clip(upper=(end_time + 1) - onset)
-        .clip(upper=max_duration)
-    )
+    return NoteBatch(NoteArray(batch.notes.data[keep]), offsets), success
 
-    # Shorten bounds (decrease duration)
-    shortest_shortened_dur = (duration - max_shift).clip(lower=min_duration)
-    longest_shortened_dur = (duration - (min_shift - 1)).clip(upper=max_duration)
 
-    if align_dur:
-        # Find ranges which contain a duration to align to
-        # I couldn't think of a better solution than iterating here.
-        # This code checks, for every range, whether at least 1 duration
-        # lies within that range.
-        durs = pd.Series(duration.unique())
-        for i, (ssd, lsd, sld, lld) in enumerate(
-            zip(
-                shortest_shortened_dur,
-                longest_shortened_dur,
-                shortest_lengthened_dur,
-                longest_lengthened_dur,
-            )
-        ):
-            # Go through each range to check there is a valid duration
-            shortened_valid = durs.between(ssd, lsd - 1).any()
-            lengthened_valid = durs.between(sld, lld - 1).any()
+@lru_cache(maxsize=DISTRIBUTION_CACHE_SIZE)
+def _add_note_table(min_pitch, max_pitch, pitch_distribution):
+    """
+    Get a table of the pitches at which add_note may add a note, for a given
+    pitch_distribution without align_pitch. These depend only on the
+    arguments, so the tables are cached.
 
-            # Close invalid ranges
-            if not shortened_valid:
-                shortest_shortened_dur.iloc[i] = lsd
-            if not lengthened_valid:
-                shortest_lengthened_dur.iloc[i] = lld
+    Parameters
+    ----------
+    min_pitch, max_pitch
+        The arguments of add_note.
 
-    # Find valid notes
-    valid = (shortest_lengthened_dur < longest_lengthened_dur) | (
-        shortest_shortened_dur < longest_shortened_dur
-    )
-    valid_notes = list(valid.index[valid])
+    pitch_distribution : bytes
+        A key of the pitch_distribution argument of add_note, from
+        _distribution_key.
 
-    if not valid_notes:
-        logging.warning("No valid notes to offset shift. Returning None.")
-        return None
+    Returns
+    -------
+    pitches, p, cdf : np.ndarray
+        The pitches at which a note may be added, the probability of each,
+        and their cumulative distribution (see _cdf). These must not be edited.
+    """
+    dist = _from_distribution_key(pitch_distribution)[min_pitch : max_pitch + 1]
+    dist = dist / np.sum(dist)
+    return _read_only_table(np.arange(min_pitch, max_pitch + 1), dist)
 
-    # Sample a random note
-    index = choice(valid_notes)
 
-    ssd = shortest_shortened_dur[index]
-    lsd = max(longest_shortened_dur[index], ssd)
-    sld = shortest_lengthened_dur[index]
-    lld = max(longest_lengthened_dur[index], sld)
+def _add_note_pitches(notes, min_pitch, max_pitch, align_pitch, pitch_distribution):
+    """
+    Get the pitches at which add_note may add a note, for every case except a
+    uniform distribution without alignment. Those which do not depend on the
+    excerpt (without align_pitch) are cached.
 
-    # Sample new duration
-    if align_dur:
-        valid_durs = durs.between(ssd, lsd - 1) | durs.between(sld, lld - 1)
-        valid_durs = list(durs[valid_durs])
-        duration = choice(valid_durs)
-    else:
-        duration = split_range_sample([(ssd, lsd), (sld, lld)])
+    Parameters
+    ----------
+    notes : NoteArray
+        The excerpt to which a note will be added.
 
-    degraded = excerpt.copy()
+    min_pitch, max_pitch, align_pitch, pitch_distribution
+        The (pre-processed) arguments of add_note.
 
-    degraded.loc[index, "dur"] = duration
+    Returns
+    -------
+    pitches : np.ndarray
+        The pitches at which a note may be added, or None if there are none.
 
-    # Check if overlaps
-    if overlaps(degraded, index):
-        if tries == 1:
-            logging.warning(TRIES_WARN_MSG)
-            return None
-        return offset_shift(
-            excerpt,
-            min_shift=min_shift,
-            max_shift=max_shift,
-            min_duration=min_duration,
-            max_duration=max_duration - 1,  # Changed above
-            align_dur=align_dur,
-            tries=tries - 1,
+    p : np.ndarray or None
+        The probability of adding a note at each pitch, or None for a uniform
+        distribution.
+
+    cdf : np.ndarray or None
+        The cumulative distribution of p, for _sample_table.
+    """
+    if not align_pitch:
+        return _add_note_table(
+            min_pitch, max_pitch, _distribution_key(pitch_distribution)
         )
 
-    degraded = post_process(degraded)
-    return degraded
+    pitches = _unique(notes.pitch[_between(notes.pitch, min_pitch, max_pitch)])
+    if len(pitches) == 0:
+        _fail(NO_VALID_ALIGNMENT, "No valid aligned pitch in given range.")
+        return None, None, None
+
+    if pitch_distribution is None:
+        return pitches, None, None
+
+    in_dist = (pitches >= 0) & (pitches < len(pitch_distribution))
+    dist = np.zeros(len(pitches))
+    dist[in_dist] = pitch_distribution[pitches[in_dist]]
+    dist_sum = np.sum(dist)
+    if dist_sum == 0:
+        _fail(
+            NO_VALID_ALIGNMENT,
+            "No valid aligned pitch in the given range with the given "
+            "pitch_distribution.",
+        )
+        return None, None, None
+    dist = dist / dist_sum
+    return pitches, dist, _cdf(dist)
 
 
-@set_random_seed
-def remove_note(excerpt, tries=TRIES_DEFAULT):
+def _sample_aligned_free_time(
+    other_onsets, other_offsets, onsets, durs, end_time, min_duration, max_duration, rng
+):
     """
-    Remove one note from the given excerpt.
+    Sample an aligned onset time and duration for add_note, from only those
+    which do not overlap any of the given notes.
 
     Parameters
     ----------
-    excerpt : df.DataFrame
-        An excerpt from a piece of music.
+    other_onsets, other_offsets : np.ndarray
+        The onset and offset times of the notes with the new note's track and
+        pitch.
 
-    seed : int
-        A seed to be supplied to np.random.seed(). None leaves numpy's
-        random state unchanged.
+    onsets, durs : np.ndarray
+        The onset time and duration of every note in the excerpt.
 
-    tries : int
-        The number of times to try the degradation before giving up, in the case
-        that the degraded excerpt overlaps. This is not used, but we keep it for
-        consistency.
+    end_time : int
+        The latest offset time in the excerpt.
+
+    min_duration, max_duration, rng
+        The arguments of add_note.
 
     Returns
     -------
-    degraded : df.DataFrame
-        A degradation of the excerpt, with one note removed, or None if
-        the degradations cannot be performed.
+    onset : int
+        The sampled onset time, or None if there is no valid onset time.
+
+    duration : int
+        The sampled duration, or None if there is no valid onset time.
     """
-    if excerpt.shape[0] == 0:
-        logging.warning("No notes to remove. Returning None.")
-        return None
+    durations = durs[_between(durs, min_duration, max_duration)]
+    min_dur = durations.min()
+    candidates = _unique(onsets[_between(onsets, 0, end_time - min_dur)])
+
+    # The longest duration which would not overlap, for each onset
+    ends_after = other_offsets[None, :] > candidates[:, None]
+    gaps = np.where(ends_after, other_onsets[None, :] - candidates[:, None], end_time)
+    longest = np.minimum(gaps.min(axis=1, initial=end_time), end_time - candidates)
+
+    valid = longest >= min_dur
+    if not np.any(valid):
+        return None, None
+    onset = rng.choice(candidates[valid])
+    longest = longest[valid][candidates[valid] == onset][0]
+    durations = _unique(durations[_between(durations, min_dur, longest)])
+    return onset, rng.choice(durations)
+
+
+def _sample_free_note(
+    notes, tracks, pitches, weights, min_duration, max_duration, align_time, rng
+):
+    """
+    Sample the values of a note for add_note, from only those which do not
+    overlap any existing note.
+
+    Parameters
+    ----------
+    notes : NoteArray
+        The excerpt to which a note will be added.
 
-    degraded = pre_process(excerpt)
+    tracks, pitches : np.ndarray
+        The track and pitch of each (track, pitch) pair at which the note
+        may be added.
 
-    # Sample a random note
-    note_index = choice(list(degraded.index))
+    weights : np.ndarray
+        The weight of each (track, pitch) pair.
 
-    # Remove that note
-    degraded = degraded.drop(note_index)
+    min_duration, max_duration, align_time, rng
+        The arguments of add_note.
 
-    # No need to check for overlap
-    degraded = post_process(degraded, sort=False)
-    return degraded
+    Returns
+    -------
+    note : tuple(int) or None
+        The onset, duration, track, and pitch of the note, or None if no
+        (track, pitch) pair has room for it.
+    """
+    if not align_time:
+        # Sample in one draw from the free intervals of every pair, weighted
+        # by the number of valid (onset, duration) pairs in each
+        if len(notes) == 0:
+            max_offset = min(max_duration + 1, MAX_NOTE_VALUE)
+            free_index = notes.free_interval_index(min_duration, 0, 1, max_offset)
+        elif min_duration >= notes.offset.max():
+            free_index = notes.free_interval_index(
+                min_duration, 0, 1, min_duration + 1
+            )
+            max_duration = min_duration
+        else:
+            end_time = notes.offset.max()
+            free_index = notes.free_interval_index(
+                min_duration, notes.onset.min(), end_time - min_duration, end_time
+            )
+        return free_index.sample(tracks, pitches, weights, max_duration, rng)
+
+    # Aligned onsets and durations are discrete, so try (track, pitch) pairs
+    # until one has room for the note
+    weights = weights.copy()
+    interval_index = notes.interval_index()
+    while np.any(weights > 0):
+        pair = rng.choice(len(weights), p=weights / np.sum(weights))
+        onset, duration = _sample_aligned_free_time(
+            *interval_index.group(tracks[pair], pitches[pair]),
+            notes.onset.astype(np.int64),
+            notes.dur.astype(np.int64),
+            notes.offset.max(),
+            min_duration,
+            max_duration,
+            rng,
+        )
+        if onset is not None:
+            return onset, duration, tracks[pair], pitches[pair]
+        weights[pair] = 0
+    return None
 
 
 @set_random_seed
+@instrumented
 def add_note(
     excerpt,
     min_pitch=MIN_PITCH_DEFAULT,
@@ -948,6 +2644,10 @@ def add_note(
     align_velocity=False,
     pitch_distribution=None,
     tries=TRIES_DEFAULT,
+    rejection_free=False,
+    sort=True,
+    return_edit=False,
+    rng=None,
 ):
     """
     Add one note to the given excerpt. The added note's track will be randomly
@@ -957,7 +2657,7 @@ def add_note(
 
     Parameters
     ----------
-    excerpt : df.DataFrame
+    excerpt : pd.DataFrame or NoteArray
         An excerpt from a piece of music.
 
     min_pitch : int
@@ -1005,30 +2705,56 @@ def add_note(
         A seed to be supplied to np.random.seed(). None leaves numpy's
         random state unchanged.
 
+    sort : boolean
+        True to sort the degraded notes. False to leave them in an arbitrary
+        order, for example when more degradations will be applied to them
+        before sorting.
+
+    return_edit : boolean
+        True to return a NoteEdit recording the changes made to the excerpt,
+        rather than the degraded excerpt itself. Its note indices refer to the
+        excerpt as given, and sort is not used.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
     tries : int
         The number of times to try the degradation before giving up, in the case
-        that the degraded excerpt overlaps.
+        that the degraded excerpt overlaps. Not used if rejection_free is True.
+
+    rejection_free : boolean
+        True to sample the added note only from those which do not overlap an
+        existing note, rather than rejecting overlapping notes, so that the
+        degradation fails only if no track and pitch has room for the note.
+        Unless align_time is True, the note is sampled in a single draw,
+        uniformly from every valid (track, pitch, onset, duration), weighted
+        by pitch_distribution. The free intervals of a NoteArray excerpt are
+        indexed once, and reused by later calls on the same excerpt.
 
 
     Returns
     -------
-    degraded : df.DataFrame
+    degraded : pd.DataFrame or NoteArray or NoteEdit
         A degradation of the excerpt, with one note added, or None if
         the degradations cannot be performed.
     """
-    excerpt = pre_process(excerpt)
+    notes = _pre_process_notes(excerpt)
+    rng = get_rng(rng)
 
-    if len(excerpt) == 0:
+    if len(notes) == 0:
         align_pitch = False
         align_time = False
         align_velocity = False
 
-    if len(excerpt) == 1 and align_pitch and align_time:
+    if len(notes) == 1 and align_pitch and align_time:
         align_pitch = False
 
     if pitch_distribution is not None:
+        pitch_distribution = np.asarray(pitch_distribution)
         if np.sum(pitch_distribution[min_pitch : max_pitch + 1]) == 0:
-            logging.warning(
+            _fail(
+                EMPTY_DISTRIBUTION,
                 "The pitch distribution lies entirely outside of the requested pitch "
                 "range [%s-%s]. Returning None.",
                 min_pitch,
@@ -1036,127 +2762,147 @@ def add_note(
             )
             return None
 
-    end_time = excerpt[["onset", "dur"]].sum(axis=1).max()
+    onsets = notes.onset.astype(np.int64)
+    durs = notes.dur.astype(np.int64)
+    end_time = notes.offset.max() if len(notes) > 0 else None
 
-    if align_pitch:
-        pitch = excerpt["pitch"].between(min_pitch, max_pitch, inclusive=True)
-        pitch = excerpt["pitch"][pitch].unique()
-        if len(pitch) == 0:
-            logging.warning("No valid aligned pitch in given range.")
+    if align_pitch or pitch_distribution is not None:
+        pitches, pitch_p, pitch_cdf = _add_note_pitches(
+            notes, min_pitch, max_pitch, align_pitch, pitch_distribution
+        )
+        if pitches is None:
+            return None
+
+    if rejection_free:
+        if align_time and (
+            min_duration > durs.max()
+            or max_duration < durs.min()
+            or not np.any(_between(durs, min_duration, max_duration))
+        ):
+            _fail(NO_VALID_ALIGNMENT, "No valid aligned duration in given range.")
+            return None
+
+        if not (align_pitch or pitch_distribution is not None):
+            pitches, pitch_p = np.arange(min_pitch, max_pitch + 1), None
+        tracks = _unique(notes.track) if len(notes) > 0 else np.zeros(1, dtype=int)
+
+        pair_pitches = np.repeat(pitches, len(tracks))
+        pair_tracks = np.tile(tracks, len(pitches))
+        weights = np.ones(len(pitches)) if pitch_p is None else pitch_p
+        note_values = _sample_free_note(
+            notes,
+            pair_tracks,
+            pair_pitches,
+            np.repeat(weights, len(tracks)),
+            min_duration,
+            max_duration,
+            align_time,
+            rng,
+        )
+        if note_values is None:
+            _fail(NO_FREE_EDIT, NO_FREE_EDIT_WARN_MSG)
             return None
+        onset, duration, track, pitch = note_values
 
-        if pitch_distribution is None:
-            pitch = choice(pitch)
+        if align_velocity:
+            velocity = _unique(
+                notes.velocity[_between(notes.velocity, min_velocity, max_velocity)]
+            )
+            if len(velocity) == 0:
+                _fail(NO_VALID_ALIGNMENT, "No valid aligned velocity in given range.")
+                return None
+            velocity = rng.choice(velocity)
         else:
-            dist = [
-                pitch_distribution[i] if 0 <= i < len(pitch_distribution) else 0
-                for i in pitch
-            ]
-            dist_sum = np.sum(dist)
-            if dist_sum == 0:
-                logging.warning(
-                    "No valid aligned pitch in the given range with the given "
-                    "pitch_distribution."
-                )
+            velocity = rng.integers(min_velocity, max_velocity + 1)
+
+        note = NoteArray.from_columns(onset, track, pitch, duration, velocity)
+        if return_edit:
+            return NoteEdit.add(note)
+        degraded = NoteArray(np.concatenate((notes.data, note.data)))
+
+        return _post_process_notes(degraded, excerpt, sort=sort)
+
+    interval_index = notes.interval_index()
+    while True:
+        count_try()
+
+        if align_pitch or pitch_distribution is not None:
+            pitch = _sample_table(pitches, pitch_cdf, rng)
+        else:
+            pitch = rng.integers(min_pitch, max_pitch + 1)
+
+        # Find onset and duration
+        if align_time:
+            if min_duration > durs.max() or max_duration < durs.min():
+                _fail(NO_VALID_ALIGNMENT, "No valid aligned duration in given range.")
                 return None
-            dist = dist / dist_sum
-            pitch = choice(pitch, p=dist)
 
-    elif pitch_distribution is not None:
-        dist = pitch_distribution[min_pitch : max_pitch + 1]
-        dist = dist / np.sum(dist)
-        pitch = choice(np.arange(min_pitch, max_pitch + 1), p=dist)
+            durations = durs[_between(durs, min_duration, max_duration)]
+            if len(durations) == 0:
+                _fail(NO_VALID_ALIGNMENT, "No valid aligned duration in given range.")
+                return None
+            min_dur = durations.min()
+            onset = rng.choice(_unique(onsets[_between(onsets, 0, end_time - min_dur)]))
+            valid = _between(durations, min_dur, end_time - onset)
+            duration = rng.choice(_unique(durations[valid]))
+        elif len(notes) == 0:
+            onset = 0
+            duration = rng.integers(min_duration, min(max_duration + 1, MAX_NOTE_VALUE))
+        elif min_duration >= end_time:
+            onset = 0
+            duration = min_duration
+        else:
+            onset = rng.integers(onsets.min(), end_time - min_duration)
+            duration = rng.integers(
+                min_duration, min(end_time - onset, max_duration + 1)
+            )
 
-    else:
-        pitch = randint(min_pitch, max_pitch + 1)
+        # Track is random one of existing tracks
+        if len(notes) > 0:
+            track = rng.choice(_unique(notes.track))
+        else:
+            track = 0
 
-    # Find onset and duration
-    if align_time:
-        if min_duration > excerpt["dur"].max() or max_duration < excerpt["dur"].min():
-            logging.warning("No valid aligned duration in given range.")
-            return None
+        if align_velocity:
+            # Velocity is random one of existing velocities
+            velocity = _unique(
+                notes.velocity[_between(notes.velocity, min_velocity, max_velocity)]
+            )
+            if len(velocity) == 0:
+                _fail(NO_VALID_ALIGNMENT, "No valid aligned velocity in given range.")
+                return None
+            velocity = rng.choice(velocity)
+        else:
+            velocity = rng.integers(min_velocity, max_velocity + 1)
 
-        durations = excerpt["dur"].between(min_duration, max_duration, inclusive=True)
-        durations = excerpt["dur"][durations]
-        min_dur = durations.min()
-        onset = excerpt["onset"].between(0, end_time - min_dur, inclusive=True)
-        onset = choice(excerpt["onset"][onset].unique())
-        dur_unique = durations[
-            durations.between(min_dur, end_time - onset, inclusive=True)
-        ].unique()
-        duration = choice(dur_unique)
-    elif min_duration >= end_time:
-        onset = 0
-        duration = min_duration
-    elif excerpt.shape[0] == 0:
-        onset = 0
-        duration = randint(min_duration, min(max_duration + 1, sys.maxsize))
-    else:
-        onset = randint(excerpt["onset"].min(), end_time - min_duration)
-        duration = randint(min_duration, min(end_time - onset, max_duration + 1))
+        # Check if overlaps
+        if not interval_index.overlaps(onset, duration, track, pitch):
+            break
 
-    # Track is random one of existing tracks
-    try:
-        track = choice(excerpt["track"].unique())
-    except KeyError:  # No track col in df
-        track = 0
-    except ValueError:  # Empty dataframe
-        track = 0
-
-    if align_velocity:
-        # Velocity is random one of existing velocities
-        velocity = excerpt["velocity"].between(
-            min_velocity,
-            max_velocity,
-            inclusive=True,
-        )
-        velocity = excerpt["velocity"][velocity].unique()
-        if len(velocity) == 0:
-            logging.warning("No valid aligned velocity in given range.")
+        if tries == 1:
+            _fail(TRIES_EXHAUSTED, TRIES_WARN_MSG)
             return None
-        velocity = choice(velocity)
-    else:
-        velocity = randint(min_velocity, max_velocity + 1)
+        tries -= 1
 
     # Create and add note
-    note = {
-        "pitch": pitch,
-        "onset": onset,
-        "dur": duration,
-        "track": track,
-        "velocity": velocity,
-    }
-
-    degraded = excerpt.copy()
-    degraded = degraded.append(note, ignore_index=True)
-
-    # Check if overlaps
-    if overlaps(degraded, degraded.index[-1]):
-        if tries == 1:
-            logging.warning(TRIES_WARN_MSG)
-            return None
-        return add_note(
-            excerpt,
-            min_pitch=min_pitch,
-            max_pitch=max_pitch,
-            min_duration=min_duration,
-            max_duration=max_duration,
-            min_velocity=min_velocity,
-            max_velocity=max_velocity,
-            align_pitch=align_pitch,
-            align_time=align_time,
-            align_velocity=align_velocity,
-            pitch_distribution=pitch_distribution,
-            tries=tries - 1,
-        )
+    note = NoteArray.from_columns(onset, track, pitch, duration, velocity)
+    if return_edit:
+        return NoteEdit.add(note)
+    degraded = NoteArray(np.concatenate((notes.data, note.data)))
 
-    degraded = post_process(degraded)
-    return degraded
+    return _post_process_notes(degraded, excerpt, sort=sort)
 
 
 @set_random_seed
+@instrumented
 def split_note(
-    excerpt, min_duration=MIN_DURATION_DEFAULT, num_splits=1, tries=TRIES_DEFAULT
+    excerpt,
+    min_duration=MIN_DURATION_DEFAULT,
+    num_splits=1,
+    tries=TRIES_DEFAULT,
+    sort=True,
+    return_edit=False,
+    rng=None,
 ):
     """
     Split one note from the excerpt into two or more notes of equal
@@ -1165,7 +2911,7 @@ def split_note(
 
     Parameters
     ----------
-    excerpt : df.DataFrame
+    excerpt : pd.DataFrame or NoteArray
         An excerpt from a piece of music.
 
     min_duration : int
@@ -1179,6 +2925,20 @@ def split_note(
         A seed to be supplied to np.random.seed(). None leaves numpy's
         random state unchanged.
 
+    sort : boolean
+        True to sort the degraded notes. False to leave them in an arbitrary
+        order, for example when more degradations will be applied to them
+        before sorting.
+
+    return_edit : boolean
+        True to return a NoteEdit recording the changes made to the excerpt,
+        rather than the degraded excerpt itself. Its note indices refer to the
+        excerpt as given, and sort is not used.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
     tries : int
         The number of times to try the degradation before giving up, in the case
         that the degraded excerpt overlaps. This is not used, but we keep it for
@@ -1186,39 +2946,34 @@ def split_note(
 
     Returns
     -------
-    degraded : df.DataFrame
+    degraded : pd.DataFrame or NoteArray or NoteEdit
         A degradation of the excerpt, with one note split, or None if
         the degradation cannot be performed.
     """
-    if excerpt.shape[0] == 0:
-        logging.warning("No notes to split. Returning None.")
+    if len(excerpt) == 0:
+        _fail(NO_VALID_NOTES, "No notes to split. Returning None.")
         return None
 
-    excerpt = pre_process(excerpt)
+    notes = _pre_process_notes(excerpt)
+    rng = get_rng(rng)
 
     # Find all splitable notes
-    long_enough = excerpt["dur"] >= min_duration * (num_splits + 1)
-    valid_notes = list(long_enough.index[long_enough])
+    long_enough = notes.dur >= min_duration * (num_splits + 1)
+    valid_notes = np.nonzero(long_enough)[0]
 
-    if not valid_notes:
-        logging.warning("No valid notes to split. Returning None.")
+    if len(valid_notes) == 0:
+        _fail(NO_VALID_NOTES, "No valid notes to split. Returning None.")
         return None
 
-    note_index = choice(valid_notes)
+    note_index = rng.choice(valid_notes)
 
-    short_duration_float = excerpt.loc[note_index, "dur"] / (num_splits + 1)
-    pitch = excerpt.loc[note_index, "pitch"]
-    track = excerpt.loc[note_index, "track"]
-    velocity = excerpt.loc[note_index, "velocity"]
-    this_onset = excerpt.loc[note_index, "onset"]
+    short_duration_float = float(notes.dur[note_index]) / (num_splits + 1)
+    this_onset = int(notes.onset[note_index])
     next_onset = this_onset + short_duration_float
 
     # Add next notes (taking care to round correctly)
-    pitches = [pitch] * num_splits
     onsets = [0] * num_splits
     durs = [0] * num_splits
-    tracks = [track] * num_splits
-    velocities = [velocity] * num_splits
     for i in range(num_splits):
         this_onset = next_onset
         next_onset += short_duration_float
@@ -1226,38 +2981,44 @@ def split_note(
         onsets[i] = int(round(this_onset))
         durs[i] = int(round(next_onset)) - int(round(this_onset))
 
-    degraded = excerpt.copy()
-    degraded.loc[note_index, "dur"] = int(round(short_duration_float))
-    new_df = pd.DataFrame(
-        {
-            "onset": onsets,
-            "track": tracks,
-            "pitch": pitches,
-            "dur": durs,
-            "velocity": velocities,
-        }
+    new_dur = int(round(short_duration_float))
+    new_notes = NoteArray.from_columns(
+        onsets,
+        notes.track[note_index],
+        notes.pitch[note_index],
+        durs,
+        notes.velocity[note_index],
     )
-    degraded = degraded.append(new_df, ignore_index=True)
+    if return_edit:
+        return NoteEdit.concatenate(
+            [NoteEdit.change(notes, note_index, dur=new_dur), NoteEdit.add(new_notes)]
+        )
+    degraded = notes.copy()
+    degraded.dur[note_index] = new_dur
+    degraded = NoteArray(np.concatenate((degraded.data, new_notes.data)))
 
     # No need to check for overlap
-    degraded = post_process(degraded)
-    return degraded
+    return _post_process_notes(degraded, excerpt, sort=sort)
 
 
 @set_random_seed
+@instrumented
 def join_notes(
     excerpt,
     max_gap=MAX_GAP_DEFAULT,
     max_notes=20,
     only_first=False,
     tries=TRIES_DEFAULT,
+    sort=True,
+    return_edit=False,
+    rng=None,
 ):
     """
     Combine two notes of the same pitch and track into one.
 
     Parameters
     ----------
-    excerpt : df.DataFrame
+    excerpt : pd.DataFrame or NoteArray
         An excerpt from a piece of music.
 
     max_gap : int
@@ -1279,6 +3040,20 @@ def join_notes(
         A seed to be supplied to np.random.seed(). None leaves numpy's
         random state unchanged.
 
+    sort : boolean
+        True to sort the degraded notes. False to leave them in an arbitrary
+        order, for example when more degradations will be applied to them
+        before sorting.
+
+    return_edit : boolean
+        True to return a NoteEdit recording the changes made to the excerpt,
+        rather than the degraded excerpt itself. Its note indices refer to the
+        excerpt as given, and sort is not used.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state (which seed applies to).
+
     tries : int
         The number of times to try the degradation before giving up, in the case
         that the degraded excerpt overlaps. This is not used, but we keep it for
@@ -1286,75 +3061,176 @@ def join_notes(
 
     Returns
     -------
-    degraded : df.DataFrame
+    degraded : pd.DataFrame or NoteArray or NoteEdit
         A degradation of the excerpt, with one note split, or None if
         the degradation cannot be performed.
     """
-    if excerpt.shape[0] < 2:
-        logging.warning("No notes to join. Returning None.")
+    if len(excerpt) < 2:
+        _fail(NO_VALID_NOTES, "No notes to join. Returning None.")
         return None
 
-    excerpt = pre_process(excerpt, sort=True)
+    excerpt_notes = _pre_process_notes(excerpt)
+    sort_order = excerpt_notes.sort_order()
+    notes = NoteArray(excerpt_notes.data[sort_order])
+    rng = get_rng(rng)
+
+    # Stable sort by track and pitch, so that each (track, pitch) pair's notes
+    # are consecutive and sorted by onset
+    order = np.lexsort((notes.pitch, notes.track))
+    track = notes.track[order]
+    pitch = notes.pitch[order]
+    onset = notes.onset[order].astype(np.int64)
+    offset = notes.offset[order]
+
+    # Each note can be joined to the next if they share a track and pitch,
+    # and the gap between them is small enough
+    joinable = np.zeros(len(notes), dtype=bool)
+    joinable[:-1] = (
+        (track[1:] == track[:-1])
+        & (pitch[1:] == pitch[:-1])
+        & (onset[1:] - offset[:-1] <= max_gap)
+    )
 
-    valid_starts = []
-    valid_nexts = []
+    # Get valid notes to start joining from
+    if only_first:
+        valid = joinable.copy()
+        valid[1:] &= ~joinable[:-1]
+    else:
+        valid = joinable
+    valid_starts = np.nonzero(valid)[0]
 
-    for _, track_df in excerpt.groupby("track"):
-        for _, pitch_df in track_df.groupby("pitch"):
-            if len(pitch_df) < 2:
-                continue
+    if len(valid_starts) == 0:
+        _fail(NO_VALID_NOTES, "No valid notes to join. Returning None.")
+        return None
 
-            # Get note gaps
-            onset = pitch_df["onset"]
-            offset = onset + pitch_df["dur"]
-            gap_after = onset.shift(-1) - offset
-            gap_after.iloc[-1] = np.inf
-            gap_before = gap_after.shift(1)
-            gap_before.iloc[0] = np.inf
+    index = rng.integers(len(valid_starts))
 
-            # Get valid notes to start joining from
-            if only_first:
-                valid = (gap_after <= max_gap) & (gap_before > max_gap)
-            else:
-                valid = gap_after <= max_gap
-            valid_starts_this = list(valid.index[valid])
-            valid_next_bool = gap_before <= max_gap
-
-            # Get notes to join for each valid start
-            for start in valid_starts_this:
-                iloc = pitch_df.index.get_loc(start)
-                valid_next = []
-                for i, v in enumerate(valid_next_bool[iloc + 1 :]):
-                    if i + 2 > max_notes or not v:
-                        break
-                    valid_next.append(valid_next_bool.index[iloc + 1 + i])
-                valid_nexts.append(valid_next)
-            valid_starts.extend(valid_starts_this)
-
-    if not valid_starts:
-        logging.warning("No valid notes to join. Returning None.")
-        return None
+    # Join notes until the end of this run of joinable notes, up to max_notes
+    run_ends = np.nonzero(~joinable)[0]
+    first = valid_starts[index]
+    last = run_ends[np.searchsorted(run_ends, first)]
+    last = min(last, first + max_notes - 1)
 
-    index = randint(len(valid_starts))
+    start = order[first]
+    nexts = order[first + 1 : last + 1]
 
-    start = valid_starts[index]
-    nexts = valid_nexts[index]
+    new_dur = notes.offset[nexts[-1]] - notes.onset[start]
+    if return_edit:
+        return NoteEdit.concatenate(
+            [
+                NoteEdit.change(excerpt_notes, sort_order[start], dur=new_dur),
+                NoteEdit.remove(excerpt_notes, sort_order[nexts]),
+            ]
+        )
 
-    degraded = excerpt.copy()
+    degraded = notes.copy()
 
     # Extend first note
-    degraded.loc[start]["dur"] = (
-        degraded.loc[nexts[-1]]["onset"]
-        + degraded.loc[nexts[-1]]["dur"]
-        - degraded.loc[start]["onset"]
-    )
+    degraded.dur[start] = new_dur
 
     # Drop all following notes note
-    degraded = degraded.drop(nexts)
+    degraded = NoteArray(np.delete(degraded.data, nexts))
 
     # No need to check for overlap
-    degraded = post_process(degraded)
-    return degraded
+    return _post_process_notes(degraded, excerpt, sort=sort)
+
+
+def _any_notes_feasible(batch, **kwargs):
+    """
+    Check which excerpts of the given batch contain any notes, the only
+    requirement of most degradations.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        The excerpts to check.
+
+    kwargs
+        The degradation's arguments, which are not used.
+
+    Returns
+    -------
+    feasible : np.ndarray
+        A boolean array which is True for each non-empty excerpt.
+    """
+    return batch.lengths > 0
+
+
+def _split_note_feasible(
+    batch, min_duration=MIN_DURATION_DEFAULT, num_splits=1, **kwargs
+):
+    """
+    Check which excerpts of the given batch contain a note which split_note
+    could split.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        The excerpts to check.
+
+    min_duration, num_splits
+        The arguments of split_note.
+
+    kwargs
+        Any other arguments of split_note, which are not used.
+
+    Returns
+    -------
+    feasible : np.ndarray
+        A boolean array which is True for each excerpt with a long enough note.
+    """
+    long_enough = batch.notes.dur >= min_duration * (num_splits + 1)
+    return np.bincount(batch.excerpt_index()[long_enough], minlength=len(batch)) > 0
+
+
+def _join_notes_feasible(batch, max_gap=MAX_GAP_DEFAULT, **kwargs):
+    """
+    Check which excerpts of the given batch contain two notes which join_notes
+    could join.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        The excerpts to check.
+
+    max_gap
+        The argument of join_notes.
+
+    kwargs
+        Any other arguments of join_notes, which are not used.
+
+    Returns
+    -------
+    feasible : np.ndarray
+        A boolean array which is True for each excerpt with joinable notes.
+    """
+    notes = batch.notes
+    excerpt = batch.excerpt_index()
+
+    # Group each excerpt's notes by track and pitch, sorted as in join_notes
+    order = np.lexsort(
+        (
+            notes.velocity,
+            notes.dur,
+            notes.onset,
+            notes.pitch,
+            notes.track,
+            excerpt,
+        )
+    )
+    excerpt = excerpt[order]
+    track = notes.track[order]
+    pitch = notes.pitch[order]
+    onset = notes.onset[order].astype(np.int64)
+    offset = notes.offset[order]
+
+    joinable = (
+        (excerpt[1:] == excerpt[:-1])
+        & (track[1:] == track[:-1])
+        & (pitch[1:] == pitch[:-1])
+        & (onset[1:] - offset[:-1] <= max_gap)
+    )
+    return np.bincount(excerpt[:-1][joinable], minlength=len(batch)) > 0
 
 
 DEGRADATIONS = {
@@ -1368,6 +3244,66 @@ DEGRADATIONS = {
     "join_notes": join_notes,
 }
 
+# Vectorized versions of the degradations, which degrade every excerpt of a
+# NoteBatch at once. Any degradation without one is applied to each excerpt
+# of a batch in turn (see degrade_each).
+BATCH_DEGRADATIONS = {
+    "pitch_shift": pitch_shift_batch,
+    "time_shift": time_shift_batch,
+    "onset_shift": onset_shift_batch,
+    "offset_shift": offset_shift_batch,
+    "remove_note": remove_note_batch,
+}
+
+# Cheap, vectorized checks of which excerpts of a NoteBatch each degradation
+# could possibly succeed on, given its keyword arguments. A False result means
+# the degradation is certain to fail, but True does not guarantee success. Any
+# degradation without a check (such as add_note) may always succeed.
+FEASIBILITY_CHECKS = {
+    "pitch_shift": _any_notes_feasible,
+    "time_shift": _any_notes_feasible,
+    "onset_shift": _any_notes_feasible,
+    "offset_shift": _any_notes_feasible,
+    "remove_note": _any_notes_feasible,
+    "split_note": _split_note_feasible,
+    "join_notes": _join_notes_feasible,
+}
+
+
+def check_feasible(batch, degradation_names, degradation_kwargs=None):
+    """
+    Check which of the given degradations could possibly succeed on each
+    excerpt of the given batch, using FEASIBILITY_CHECKS.
+
+    Parameters
+    ----------
+    batch : NoteBatch
+        The excerpts to check.
+
+    degradation_names : list(string)
+        The names of the degradations to check.
+
+    degradation_kwargs : dict
+        A dict mapping degradation names to the keyword arguments which will
+        be passed to them. None if they will use their defaults.
+
+    Returns
+    -------
+    feasible : np.ndarray
+        A boolean array of shape (len(batch), len(degradation_names)), which
+        is False where a degradation is certain to fail on an excerpt.
+    """
+    if degradation_kwargs is None:
+        degradation_kwargs = {}
+
+    result = np.ones((len(batch), len(degradation_names)), dtype=bool)
+    for index, name in enumerate(degradation_names):
+        if name in FEASIBILITY_CHECKS:
+            result[:, index] = FEASIBILITY_CHECKS[name](
+                batch, **degradation_kwargs.get(name, {})
+            )
+    return result
+
 
 def get_degradations(degradation_list=DEGRADATIONS):
     """
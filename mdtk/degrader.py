@@ -6,6 +6,8 @@ import logging
 import numpy as np
 
 import mdtk.degradations as degs
+import mdtk.instrumentation as instrumentation
+from mdtk.note_array import NoteArray, NoteBatch
 
 
 class Degrader:
@@ -19,14 +21,17 @@ class Degrader:
         degradation_dist=np.ones(len(degs.DEGRADATIONS)),
         clean_prop=1 / (len(degs.DEGRADATIONS) + 1),
         config=None,
+        degradation_kwargs=None,
     ):
         """
         Create a new degrader with the given parameters.
 
         Parameters
         ----------
-        seed : int
-            A random seed for numpy.
+        seed : int or np.random.Generator
+            A random seed for this degrader's random number generator, or a
+            Generator to use directly. numpy's global random state is not
+            changed.
 
         degradations : list(string)
             A list of the names of the degradations to use (and in what order
@@ -43,9 +48,12 @@ class Degrader:
             The path of a json config file (created by measure_errors.py).
             If given, degradations, degradation_dist, and clean_prop will
             all be overwritten by the values in the json file.
+
+        degradation_kwargs : dict
+            A dict mapping degradation names to a dict of keyword arguments
+            to pass to that degradation. None to use the defaults.
         """
-        if seed is not None:
-            np.random.seed(seed)
+        self.rng = np.random.default_rng(seed)
 
         # Load config
         if config is not None:
@@ -75,51 +83,72 @@ class Degrader:
         self.degradation_dist = np.array(degradation_dist)
         self.clean_prop = clean_prop
         self.failed = np.zeros(len(degradations))
+        self.degradation_kwargs = (
+            {} if degradation_kwargs is None else degradation_kwargs
+        )
 
-    def degrade(self, note_df):
+    def degrade(self, note_df, rng=None):
         """
-        Degrade the given note_df.
+        Degrade the given note_df. Degradations which are certain to fail on
+        it (see degs.FEASIBILITY_CHECKS) are never attempted, but are still
+        counted as failures when they are sampled.
 
         Parameters
         ----------
-        note_df : pd.DataFrame
-            A note_df to degrade.
+        note_df : pd.DataFrame or NoteArray
+            A note_df to degrade. A DataFrame is converted into a NoteArray
+            only once, however many degradations are attempted.
+
+        rng : np.random.Generator
+            The random number generator to use for this excerpt only, for
+            example one from mdtk.rng.derive_rng, so that its degradation does
+            not depend on which excerpts were degraded before it. None to use
+            self.rng.
 
         Returns
         -------
-        degraded_df : pd.DataFrame
-            A degraded version of the given note_df. If self.clean_prop > 0,
-            this can be a copy of the given note_df.
+        degraded_df : pd.DataFrame or NoteArray
+            A degraded version of the given note_df, as the same type. If
+            self.clean_prop > 0, this can be a copy of the given note_df.
 
         deg_label : int
             The label of the degradation that was performed. 0 means none,
             and larger numbers mean the degradation
             "self.degradations[deg_label-1]" was performed.
         """
-        if self.clean_prop > 0 and np.random.rand() <= self.clean_prop:
+        if rng is None:
+            rng = self.rng
+
+        if self.clean_prop > 0 and rng.random() <= self.clean_prop:
             return note_df.copy(), 0
 
+        if isinstance(note_df, NoteArray):
+            notes = note_df
+        else:
+            notes = NoteArray.from_df(note_df)
+
+        feasible = degs.check_feasible(
+            NoteBatch(notes, [0, len(notes)]),
+            self.degradations,
+            self.degradation_kwargs,
+        )[0]
+
         degraded_df = None
         this_deg_dist = self.degradation_dist.copy()
-        this_failed = self.failed.copy()
+        this_failed = np.where(feasible, self.failed, 0)
 
         # First, sample from failed degradations
         while np.any(this_failed > 0):
             # Select a degradation proportional to how many have failed
-            deg_index = np.random.choice(
+            deg_index = rng.choice(
                 len(self.degradations), p=this_failed / np.sum(this_failed)
             )
-            deg_fun = degs.DEGRADATIONS[self.degradations[deg_index]]
-
-            # Try to degrade
-            logging.disable(logging.WARNING)
-            degraded_df = deg_fun(note_df)
-            logging.disable(logging.NOTSET)
+            degraded_df = self._try_degradation(deg_index, notes, rng)
 
             # Check for success!
             if degraded_df is not None:
                 self.failed[deg_index] -= 1
-                return degraded_df, deg_index + 1
+                return self._as_input_type(degraded_df, note_df), deg_index + 1
 
             # Degradation failed -- 0 out this deg and continue
             this_failed[deg_index] = 0
@@ -127,27 +156,393 @@ class Degrader:
         # No degradations have remaining failures. Draw from standard dist
         while np.any(this_deg_dist > 0):
             # Select a degradation proportional to the distribution
-            deg_index = np.random.choice(
+            deg_index = rng.choice(
                 len(self.degradations), p=this_deg_dist / np.sum(this_deg_dist)
             )
-            # This deg would have already failed in the above loop.
-            # But we want to sample it and count it as another failure.
-            if self.failed[deg_index] > 0:
+            # This deg would have already failed in the above loop (or is
+            # certain to fail). But we want to sample it and count it as
+            # another failure.
+            if self.failed[deg_index] > 0 or not feasible[deg_index]:
+                if not feasible[deg_index]:
+                    instrumentation.record_skip(self.degradations[deg_index])
                 self.failed[deg_index] += 1
+                this_deg_dist[deg_index] = 0
                 continue
-            deg_fun = degs.DEGRADATIONS[self.degradations[deg_index]]
 
-            # Try to degrade
-            logging.disable(logging.WARNING)
-            degraded_df = deg_fun(note_df)
-            logging.disable(logging.NOTSET)
+            degraded_df = self._try_degradation(deg_index, notes, rng)
 
             # Check for success!
             if degraded_df is not None:
-                return degraded_df, deg_index + 1
+                return self._as_input_type(degraded_df, note_df), deg_index + 1
 
             # Degradation failed -- add 1 to failure and continue
             self.failed[deg_index] += 1
+            this_deg_dist[deg_index] = 0
 
         # Here, all degradations (with dist > 0) failed
         return note_df.copy(), 0
+
+    def _try_degradation(self, deg_index, notes, rng):
+        """
+        Perform the given degradation on the given notes, with warnings
+        disabled.
+
+        Parameters
+        ----------
+        deg_index : int
+            The index of the degradation to perform, in self.degradations.
+
+        notes : NoteArray
+            The excerpt to degrade.
+
+        rng : np.random.Generator
+            The random number generator to use.
+
+        Returns
+        -------
+        degraded : NoteArray
+            The degraded excerpt, or None if the degradation failed.
+        """
+        name = self.degradations[deg_index]
+        logging.disable(logging.WARNING)
+        degraded = degs.DEGRADATIONS[name](
+            notes, rng=rng, **self.degradation_kwargs.get(name, {})
+        )
+        logging.disable(logging.NOTSET)
+        return degraded
+
+    def degrade_batch(self, batch, rng=None):
+        """
+        Degrade every excerpt in the given batch. This is like calling degrade
+        on each excerpt, except that whether each excerpt is clean and which
+        degradation it gets are sampled for the whole batch at once. Also,
+        degradations with a vectorized version (in degs.BATCH_DEGRADATIONS)
+        are performed on all of their excerpts in a single call.
+
+        An excerpt whose degradation fails is retried with a degradation it has
+        not yet failed, until one succeeds or none remain (in which case it is
+        returned clean). Failures are counted in self.failed as in degrade, and
+        the degradations owed from past failures are performed first. As in
+        degrade, degradations which are certain to fail are not attempted.
+
+        Parameters
+        ----------
+        batch : NoteBatch or list(pd.DataFrame or NoteArray)
+            The excerpts to degrade. A list is first converted into a
+            NoteBatch.
+
+        rng : np.random.Generator
+            The random number generator to use for this batch only. None to
+            use self.rng.
+
+        Returns
+        -------
+        degraded_batch : NoteBatch
+            A new NoteBatch containing a degraded version of each excerpt,
+            in order. If self.clean_prop > 0, some of these can be clean.
+
+        deg_labels : np.ndarray
+            The label of the degradation that was performed on each excerpt.
+            0 means none, and larger numbers mean the degradation
+            "self.degradations[deg_label-1]" was performed.
+        """
+        if not isinstance(batch, NoteBatch):
+            batch = NoteBatch.from_excerpts(batch)
+        if rng is None:
+            rng = self.rng
+
+        num_degs = len(self.degradations)
+        labels = np.zeros(len(batch), dtype=int)
+
+        # Each output excerpt is read from sources[source_id][source_index].
+        # To begin with, they are all clean.
+        sources = [batch]
+        source_id = np.zeros(len(batch), dtype=int)
+        source_index = np.arange(len(batch))
+
+        if self.clean_prop > 0:
+            pending = np.flatnonzero(rng.random(len(batch)) > self.clean_prop)
+        else:
+            pending = np.arange(len(batch))
+        allowed = np.tile(self.degradation_dist > 0, (len(pending), 1))
+        feasible = degs.check_feasible(
+            batch, self.degradations, self.degradation_kwargs
+        )
+
+        # First, assign degradations owed from previous failures
+        deg_index = np.full(len(pending), -1)
+        owed = rng.permutation(
+            np.repeat(np.arange(num_degs), self.failed.astype(int))
+        )[: len(pending)]
+        deg_index[: len(owed)] = owed
+        from_failed = deg_index >= 0
+
+        while len(pending) > 0:
+            # Sample a degradation for each remaining excerpt
+            to_sample = deg_index < 0
+            deg_index[to_sample] = self._sample_degradations(allowed[to_sample], rng)
+
+            # Those with no valid degradations remain clean
+            has_deg = deg_index >= 0
+            pending = pending[has_deg]
+            allowed = allowed[has_deg]
+            deg_index = deg_index[has_deg]
+            from_failed = from_failed[has_deg]
+
+            # Those certain to fail are not attempted
+            success = np.zeros(len(pending), dtype=bool)
+            attempt = feasible[pending, deg_index]
+            if instrumentation.get_stats() is not None:
+                for index in deg_index[~attempt]:
+                    instrumentation.record_skip(self.degradations[index])
+            for index in np.unique(deg_index[attempt]):
+                members = attempt & (deg_index == index)
+                degraded, success[members] = self._degrade_all(
+                    index, batch.take(pending[members]), rng
+                )
+
+                excerpts = pending[members][success[members]]
+                sources.append(degraded)
+                source_id[excerpts] = len(sources) - 1
+                source_index[excerpts] = np.flatnonzero(success[members])
+                labels[excerpts] = index + 1
+
+            self.failed -= np.bincount(
+                deg_index[success & from_failed], minlength=num_degs
+            )
+            self.failed += np.bincount(
+                deg_index[~success & ~from_failed], minlength=num_degs
+            )
+
+            # Failed excerpts try again, with a degradation not yet tried
+            allowed[np.arange(len(pending)), deg_index] = False
+            pending = pending[~success]
+            allowed = allowed[~success]
+            deg_index = np.full(len(pending), -1)
+            from_failed = np.zeros(len(pending), dtype=bool)
+
+        # Gather the output excerpts from their sources
+        source_starts = np.cumsum([0] + [len(source) for source in sources[:-1]])
+        degraded_batch = NoteBatch.concatenate(sources).take(
+            source_starts[source_id] + source_index
+        )
+        return degraded_batch, labels
+
+    def _sample_degradations(self, allowed, rng):
+        """
+        Sample one degradation index for each row of the given mask, in
+        proportion to self.degradation_dist.
+
+        Parameters
+        ----------
+        allowed : np.ndarray
+            A boolean array, of shape (num_excerpts, len(self.degradations)),
+            which is True where each degradation may be sampled.
+
+        rng : np.random.Generator
+            The random number generator to use.
+
+        Returns
+        -------
+        deg_index : np.ndarray
+            The index of the sampled degradation for each row, or -1 for
+            rows where no degradation is allowed.
+        """
+        cdf = np.cumsum(np.where(allowed, self.degradation_dist, 0), axis=1)
+        totals = cdf[:, -1]
+        samples = rng.random(len(cdf)) * totals
+        deg_index = np.sum(cdf <= samples[:, None], axis=1)
+        deg_index[totals <= 0] = -1
+        return deg_index
+
+    def _degrade_all(self, deg_index, batch, rng):
+        """
+        Perform the given degradation on every excerpt of the given batch.
+
+        Parameters
+        ----------
+        deg_index : int
+            The index of the degradation to perform, in self.degradations.
+
+        batch : NoteBatch
+            The excerpts to degrade.
+
+        rng : np.random.Generator
+            The random number generator to use.
+
+        Returns
+        -------
+        degraded : NoteBatch
+            The degraded excerpts. Those that failed are included, but their
+            contents are unspecified.
+
+        success : np.ndarray
+            A boolean array which is True for each excerpt that was degraded.
+        """
+        name = self.degradations[deg_index]
+        kwargs = self.degradation_kwargs.get(name, {})
+
+        logging.disable(logging.WARNING)
+        if name in degs.BATCH_DEGRADATIONS:
+            degraded, success = degs.BATCH_DEGRADATIONS[name](
+                batch, rng=rng, **kwargs
+            )
+        else:
+            degraded, success = degs.degrade_each(
+                degs.DEGRADATIONS[name], batch, rng=rng, **kwargs
+            )
+        logging.disable(logging.NOTSET)
+
+        return degraded, success
+
+    @staticmethod
+    def _as_input_type(degraded, note_df):
+        """Convert a degraded NoteArray back to the type of the given note_df."""
+        if isinstance(note_df, NoteArray):
+            return degraded
+        return degraded.to_df().astype(int)
+
+
+class DegradationPipeline:
+    """A DegradationPipeline can be used to apply several degradations in
+    sequence to musical excerpts on the fly. The excerpt is converted into a
+    NoteArray once, each degradation is applied to the previous one's unsorted
+    output, and the result is sorted once at the end. This is faster than
+    chaining the degradation functions by hand."""
+
+    def __init__(
+        self,
+        seed=None,
+        degradations=tuple(degs.DEGRADATIONS.keys()),
+        degradation_dist=np.ones(len(degs.DEGRADATIONS)),
+        min_degradations=1,
+        max_degradations=3,
+        degradation_kwargs=None,
+    ):
+        """
+        Create a new degradation pipeline with the given parameters.
+
+        Parameters
+        ----------
+        seed : int or np.random.Generator
+            A random seed for this pipeline's random number generator, or a
+            Generator to use directly.
+
+        degradations : list(string)
+            A list of the names of the degradations to use (and in what order
+            to label them).
+
+        degradation_dist : list(float)
+            A list of the probability of each degradation given in
+            degradations, at each step. This list will be normalized to sum
+            to 1.
+
+        min_degradations : int
+            The minimum number of degradations to apply to each excerpt.
+
+        max_degradations : int
+            The maximum number of degradations to apply to each excerpt. The
+            number for each excerpt is drawn uniformly from
+            [min_degradations, max_degradations].
+
+        degradation_kwargs : dict
+            A dict mapping degradation names to a dict of keyword arguments
+            to pass to that degradation. None to use the defaults.
+        """
+        self.rng = np.random.default_rng(seed)
+
+        # Check arg validity
+        assert len(degradation_dist) == len(degradations), (
+            "Given degradation_dist is not the same length as degradations:"
+            f"\nlen({degradation_dist}) != len({degradations})"
+        )
+        assert (
+            min(degradation_dist) >= 0
+        ), "degradation_dist values must not be negative."
+        assert (
+            sum(degradation_dist) > 0
+        ), "Some degradation_dist value must be positive."
+        assert (
+            0 <= min_degradations <= max_degradations
+        ), "Must have 0 <= min_degradations <= max_degradations."
+
+        self.degradations = degradations
+        self.degradation_dist = np.array(degradation_dist)
+        self.min_degradations = min_degradations
+        self.max_degradations = max_degradations
+        self.degradation_kwargs = (
+            {} if degradation_kwargs is None else degradation_kwargs
+        )
+
+    def degrade(self, note_df, rng=None):
+        """
+        Degrade the given note_df with a random sequence of degradations.
+
+        Parameters
+        ----------
+        note_df : pd.DataFrame or NoteArray
+            A note_df to degrade.
+
+        rng : np.random.Generator
+            The random number generator to use for this excerpt only. None to
+            use self.rng.
+
+        Returns
+        -------
+        degraded_df : pd.DataFrame or NoteArray
+            A degraded version of the given note_df, as the same type. This is
+            a copy of the given note_df if no degradation was performed.
+
+        deg_labels : list(int)
+            The edit log: the label of each degradation that was performed, in
+            the order they were applied. Larger numbers mean the degradation
+            "self.degradations[deg_label-1]" was performed. Fewer than the
+            sampled number of degradations are performed if, at some step,
+            every degradation fails.
+        """
+        if rng is None:
+            rng = self.rng
+
+        # A single working copy is edited in place by each step's NoteEdit
+        if isinstance(note_df, NoteArray):
+            notes = note_df.copy()
+        else:
+            notes = NoteArray.from_df(note_df).copy()
+
+        num_steps = rng.integers(self.min_degradations, self.max_degradations + 1)
+        deg_labels = []
+
+        logging.disable(logging.WARNING)
+        try:
+            for _ in range(num_steps):
+                edit = None
+                this_deg_dist = self.degradation_dist.copy()
+                while edit is None and np.any(this_deg_dist > 0):
+                    deg_index = rng.choice(
+                        len(self.degradations),
+                        p=this_deg_dist / np.sum(this_deg_dist),
+                    )
+                    name = self.degradations[deg_index]
+                    edit = degs.DEGRADATIONS[name](
+                        notes,
+                        sort=False,
+                        return_edit=True,
+                        rng=rng,
+                        **self.degradation_kwargs.get(name, {}),
+                    )
+
+                    # Degradation failed -- 0 out this deg and try another
+                    this_deg_dist[deg_index] = 0
+
+                # Here, all degradations (with dist > 0) failed
+                if edit is None:
+                    break
+
+                notes = edit.apply_in_place(notes)
+                deg_labels.append(deg_index + 1)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        if len(deg_labels) == 0:
+            return note_df.copy(), deg_labels
+        return Degrader._as_input_type(notes.sort(), note_df), deg_labels
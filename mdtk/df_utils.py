@@ -1,7 +1,11 @@
 """Utility functions and fields for dealing with note_dfs in mdtk format."""
+import bisect
+
 import numpy as np
 import pandas as pd
 
+from mdtk.rng import get_rng
+
 NOTE_DF_SORT_ORDER = ["onset", "track", "pitch", "dur", "velocity"]
 
 
@@ -46,6 +50,37 @@ def clean_df(df, single_track=False, non_overlapping=False):
     return df.loc[:, NOTE_DF_SORT_ORDER]
 
 
+def is_sorted(note_df):
+    """
+    Check if the given note_df is sorted by onset, track, pitch, dur, and then
+    velocity. This is much faster than sorting it and comparing.
+
+    Parameters
+    ----------
+    note_df : pd.DataFrame or np.ndarray
+        A note_df, or a structured array with the same fields.
+
+    Returns
+    -------
+    sorted : boolean
+        True if no note is greater than the next one. False otherwise.
+    """
+    # Pairs of consecutive notes which are equal in all columns so far
+    tied = None
+    for name in NOTE_DF_SORT_ORDER:
+        column = np.asarray(note_df[name])
+        earlier, later = column[:-1], column[1:]
+        out_of_order = earlier > later
+        if tied is not None:
+            out_of_order &= tied
+        if np.any(out_of_order):
+            return False
+        tied = earlier == later if tied is None else tied & (earlier == later)
+        if not np.any(tied):
+            break
+    return True
+
+
 def remove_pitch_overlaps(df):
     """
     Returns a version of the given df with all same-pitch overlaps removed.
@@ -100,9 +135,10 @@ def get_random_excerpt(
     excerpt_length=5000,
     first_onset_range=(0, 200),
     iterations=10,
+    rng=None,
 ):
     """
-    Take a random excerpt from the given note_df, using np.random. The excerpt
+    Take a random excerpt from the given note_df, using the given rng. The excerpt
     is created as follows:
 
     1. Pick a note at random from the input df, excluding the last `min_notes`
@@ -137,6 +173,10 @@ def get_random_excerpt(
         How many times to try to obtain a valid excerpt before giving up and
         returning None.
 
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state.
+
     Returns
     -------
     excerpt : pd.DataFrame
@@ -146,8 +186,9 @@ def get_random_excerpt(
     if len(note_df) < min_notes or iterations == 0:
         return None
 
+    rng = get_rng(rng)
     for _ in range(iterations):
-        note_index = np.random.choice(list(note_df.index.values)[:-min_notes])
+        note_index = rng.choice(list(note_df.index.values)[:-min_notes])
         first_onset = note_df.loc[note_index]["onset"]
         excerpt = pd.DataFrame(
             note_df.loc[
@@ -164,7 +205,141 @@ def get_random_excerpt(
     if excerpt is None:
         return None
 
-    onset_shift = np.random.randint(first_onset_range[0], first_onset_range[1])
+    onset_shift = rng.integers(first_onset_range[0], first_onset_range[1])
     excerpt["onset"] += onset_shift - first_onset
     excerpt = excerpt.reset_index(drop=True)
     return excerpt
+
+
+def get_excerpt_starts(onsets, min_notes=10, excerpt_length=5000):
+    """
+    Build a table of the valid excerpts of a piece, using a binary search for
+    the end of each excerpt, rather than a scan of the whole piece.
+
+    Parameters
+    ----------
+    onsets : np.ndarray
+        The onset time of each note of the piece, sorted.
+
+    min_notes : int
+        The minimum number of notes that must be contained in a valid excerpt.
+
+    excerpt_length : int
+        The length of each excerpt, in ms. An excerpt contains every note
+        which onsets within this amount of time after its first note.
+
+    Returns
+    -------
+    starts : np.ndarray
+        The index in onsets of the first note of each valid excerpt. Only the
+        first of any notes with the same onset is used, so each excerpt is
+        listed once.
+
+    ends : np.ndarray
+        The index in onsets after the last note of each valid excerpt.
+    """
+    onsets = np.asarray(onsets)
+    first = np.ones(len(onsets), dtype=bool)
+    first[1:] = onsets[1:] != onsets[:-1]
+    starts = np.flatnonzero(first)
+    ends = np.searchsorted(onsets, onsets[starts] + excerpt_length, side="right")
+    valid = ends - starts >= min_notes
+    return starts[valid], ends[valid]
+
+
+def get_random_excerpts(
+    note_df,
+    num_excerpts=1,
+    min_notes=10,
+    excerpt_length=5000,
+    first_onset_range=(0, 200),
+    overlapping=False,
+    rng=None,
+):
+    """
+    Take several random excerpts from the given note_df at once, using the given
+    rng. Unlike get_random_excerpt, every valid excerpt is found up front (see
+    get_excerpt_starts), so no attempts are wasted on invalid excerpts, and
+    each additional excerpt costs only O(log n) to find.
+
+    Each excerpt begins at a different onset time, chosen uniformly from those
+    with a valid excerpt, and contains all notes which onset within
+    `excerpt_length` ms of that time. Its notes are then shifted so that the
+    first note's onset is a random number within `first_onset_range`.
+
+    Parameters
+    ----------
+    note_df : pd.DataFrame
+        The input note_df, from which we want random excerpts.
+
+    num_excerpts : int
+        The number of excerpts to take.
+
+    min_notes : int
+        The minimum number of notes that must be contained in a valid excerpt.
+
+    excerpt_length : int
+        The length of each excerpt, in ms.
+
+    first_onset_range : tuple(int, int)
+        The range from which to draw a random number for the first note's onset
+        of each excerpt (in ms), rather than having it begin at time 0.
+
+    overlapping : boolean
+        True to allow excerpts to share notes. Otherwise, each excerpt begins
+        more than `excerpt_length` ms after the start of any other.
+
+    rng : np.random.Generator
+        The random number generator to use. None to use numpy's global random
+        state.
+
+    Returns
+    -------
+    excerpts : list(pd.DataFrame)
+        The random excerpts, in order of their position in note_df. There are
+        fewer than num_excerpts if the piece does not have enough valid
+        (non-overlapping) excerpts, and none if it has no valid excerpt.
+    """
+    assert num_excerpts >= 0, "num_excerpts must not be negative."
+    rng = get_rng(rng)
+    onsets = note_df["onset"].to_numpy()
+    order = np.argsort(onsets, kind="stable")
+    sorted_onsets = onsets[order]
+    starts, ends = get_excerpt_starts(sorted_onsets, min_notes, excerpt_length)
+    if len(starts) == 0 or num_excerpts == 0:
+        return []
+
+    if overlapping:
+        num_chosen = min(num_excerpts, len(starts))
+        chosen = np.sort(rng.choice(len(starts), size=num_chosen, replace=False))
+    else:
+        # Try valid excerpts in a random order, keeping each which does not
+        # overlap those already chosen (its neighbours in onset order)
+        start_onsets = sorted_onsets[starts]
+        chosen = []
+        for candidate in rng.permutation(len(starts)):
+            pos = bisect.bisect(chosen, candidate)
+            if pos > 0 and (
+                start_onsets[candidate] - start_onsets[chosen[pos - 1]]
+                <= excerpt_length
+            ):
+                continue
+            if pos < len(chosen) and (
+                start_onsets[chosen[pos]] - start_onsets[candidate] <= excerpt_length
+            ):
+                continue
+            chosen.insert(pos, candidate)
+            if len(chosen) == num_excerpts:
+                break
+
+    onset_shifts = rng.integers(
+        first_onset_range[0], first_onset_range[1], size=len(chosen)
+    )
+    excerpts = []
+    for index, onset_shift in zip(chosen, onset_shifts):
+        # Keep the notes in their order in note_df, as in get_random_excerpt
+        rows = np.sort(order[starts[index] : ends[index]])
+        excerpt = note_df.iloc[rows].reset_index(drop=True)
+        excerpt["onset"] += onset_shift - sorted_onsets[starts[index]]
+        excerpts.append(excerpt)
+    return excerpts
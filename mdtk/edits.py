@@ -0,0 +1,380 @@
+"""A compact record of the edits a degradation makes to an excerpt.
+
+Degradations change at most a few notes, so rather than storing a full
+degraded copy of each excerpt, their edits can be stored as a NoteEdit (see the
+return_edit argument of the degradations) and applied later. A NoteEdit also
+gives exact labels of which notes and frames were changed, without comparing
+the clean and degraded excerpts."""
+import numpy as np
+
+from mdtk.note_array import NOTE_ARRAY_DTYPE, NoteArray
+
+# Edit operations
+CHANGE = 0
+REMOVE = 1
+ADD = 2
+
+EDIT_DTYPE = np.dtype(
+    [
+        ("op", np.int8),
+        ("index", np.int64),
+        ("old", NOTE_ARRAY_DTYPE),
+        ("new", NOTE_ARRAY_DTYPE),
+    ]
+)
+
+
+class NoteEdit:
+    """A NoteEdit is a thin wrapper around a structured numpy array of dtype
+    EDIT_DTYPE, with one record per edited note. Each record contains:
+
+    - op: CHANGE, REMOVE, or ADD.
+    - index: The index of the changed or removed note in the original
+      excerpt (-1 for added notes).
+    - old: The original values of the note (zeros for added notes).
+    - new: The new values of the note (zeros for removed notes)."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data=None):
+        """
+        Create a new NoteEdit.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            A 1-dimensional structured array with dtype EDIT_DTYPE. It is used
+            directly (not copied). None creates an empty NoteEdit, which makes
+            no changes.
+        """
+        if data is None:
+            data = np.zeros(0, dtype=EDIT_DTYPE)
+        self.data = data
+
+    @classmethod
+    def change(cls, notes, indices, **values):
+        """
+        Create a NoteEdit which changes some values of the given notes.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The original excerpt.
+
+        indices : int or array-like
+            The indices of the notes to change.
+
+        values : int or array-like
+            The new value of each changed field, by field name (for example,
+            pitch=60).
+
+        Returns
+        -------
+        edit : NoteEdit
+            An edit which changes the given notes.
+        """
+        indices = np.atleast_1d(indices)
+        data = np.zeros(len(indices), dtype=EDIT_DTYPE)
+        data["op"] = CHANGE
+        data["index"] = indices
+        data["old"] = notes.data[indices]
+        data["new"] = data["old"]
+        for name, value in values.items():
+            data["new"][name] = value
+        return cls(data)
+
+    @classmethod
+    def remove(cls, notes, indices):
+        """
+        Create a NoteEdit which removes the given notes.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The original excerpt.
+
+        indices : int or array-like
+            The indices of the notes to remove.
+
+        Returns
+        -------
+        edit : NoteEdit
+            An edit which removes the given notes.
+        """
+        indices = np.atleast_1d(indices)
+        data = np.zeros(len(indices), dtype=EDIT_DTYPE)
+        data["op"] = REMOVE
+        data["index"] = indices
+        data["old"] = notes.data[indices]
+        return cls(data)
+
+    @classmethod
+    def add(cls, new_notes):
+        """
+        Create a NoteEdit which adds the given notes.
+
+        Parameters
+        ----------
+        new_notes : NoteArray
+            The notes to add.
+
+        Returns
+        -------
+        edit : NoteEdit
+            An edit which adds the given notes.
+        """
+        data = np.zeros(len(new_notes), dtype=EDIT_DTYPE)
+        data["op"] = ADD
+        data["index"] = -1
+        data["new"] = new_notes.data
+        return cls(data)
+
+    @classmethod
+    def concatenate(cls, edits):
+        """
+        Combine the given NoteEdits (which must edit distinct notes) into one.
+
+        Parameters
+        ----------
+        edits : list(NoteEdit)
+            The edits to combine.
+
+        Returns
+        -------
+        edit : NoteEdit
+            An edit which makes all of the given edits.
+        """
+        return cls(np.concatenate([edit.data for edit in edits]))
+
+    def _apply(self, notes, sort):
+        """
+        Apply this edit to the given notes, and track which notes were edited.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The original excerpt.
+
+        sort : boolean
+            True to sort the result.
+
+        Returns
+        -------
+        degraded : NoteArray
+            The edited notes.
+
+        changed : np.ndarray
+            A boolean array which is True for each note of degraded which was
+            changed or added.
+        """
+        ops = self.data["op"]
+        changes = self.data[ops == CHANGE]
+        removed = self.data["index"][ops == REMOVE]
+        added = self.data["new"][ops == ADD]
+
+        degraded = notes.data.copy()
+        degraded[changes["index"]] = changes["new"]
+        changed = np.zeros(len(notes), dtype=bool)
+        changed[changes["index"]] = True
+
+        if len(removed) > 0:
+            degraded = np.delete(degraded, removed)
+            changed = np.delete(changed, removed)
+        if len(added) > 0:
+            degraded = np.concatenate((degraded, added))
+            changed = np.concatenate((changed, np.ones(len(added), dtype=bool)))
+
+        degraded = NoteArray(degraded)
+        if sort:
+            order = degraded.sort_order()
+            degraded = NoteArray(degraded.data[order])
+            changed = changed[order]
+        return degraded, changed
+
+    def apply(self, notes, sort=True):
+        """
+        Apply this edit to the given notes.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The excerpt this edit was created from.
+
+        sort : boolean
+            True to sort the result. False to leave changed notes in place,
+            with added notes at the end.
+
+        Returns
+        -------
+        degraded : NoteArray
+            The edited notes. The given notes are not changed.
+        """
+        return self._apply(notes, sort)[0]
+
+    def apply_in_place(self, notes):
+        """
+        Apply this edit to the given notes, as apply(notes, sort=False), but
+        writing changed notes directly into notes.data rather than into a copy.
+        Only removing or adding notes allocates a new array.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The excerpt this edit was created from. Its data is overwritten, so
+            it should not be used again (its cached indexes are stale).
+
+        Returns
+        -------
+        degraded : NoteArray
+            A new NoteArray of the edited notes, which shares the data of the
+            given notes if no notes were removed or added.
+        """
+        ops = self.data["op"]
+        changes = self.data[ops == CHANGE]
+        removed = self.data["index"][ops == REMOVE]
+        added = self.data["new"][ops == ADD]
+
+        degraded = notes.data
+        degraded[changes["index"]] = changes["new"]
+        if len(removed) > 0:
+            degraded = np.delete(degraded, removed)
+        if len(added) > 0:
+            degraded = np.concatenate((degraded, added))
+        return NoteArray(degraded)
+
+    def changed_notes(self, notes, sort=True):
+        """
+        Get which notes of the edited excerpt were changed or added.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The excerpt this edit was created from.
+
+        sort : boolean
+            Whether the edited excerpt is sorted, as in apply.
+
+        Returns
+        -------
+        changed : np.ndarray
+            A boolean array which is True for each note of
+            self.apply(notes, sort=sort) which was changed or added.
+        """
+        return self._apply(notes, sort)[1]
+
+    def edited_indices(self):
+        """
+        Get the indices of the notes of the original excerpt which this edit
+        changes or removes.
+
+        Returns
+        -------
+        indices : np.ndarray
+            The sorted indices of the changed and removed notes.
+        """
+        return np.sort(self.data["index"][self.data["op"] != ADD])
+
+    def changed_frames(self, notes, num_frames=None, time_increment=40):
+        """
+        Get which frames of the piano-roll of the given excerpt differ after
+        this edit, as in the changed_frames label of PianorollDataset. Only
+        the pitches of the edited notes are rolled out, so this is much faster
+        than comparing full piano-rolls.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The excerpt this edit was created from.
+
+        num_frames : int
+            The number of frames to return. None to return just enough frames
+            to include the last changed one.
+
+        time_increment : int
+            The length of a single frame, in milliseconds, as in
+            formatters.df_to_pianoroll_str.
+
+        Returns
+        -------
+        changed_frames : np.ndarray
+            An int array which is 1 for each frame whose notes or onsets
+            change, and 0 elsewhere.
+        """
+        ops = self.data["op"]
+        old_pitches = self.data["old"]["pitch"][ops != ADD]
+        new_pitches = self.data["new"]["pitch"][ops != REMOVE]
+        pitches = np.unique(np.concatenate((old_pitches, new_pitches)))
+        clean = notes[np.isin(notes.pitch, pitches)]
+        degraded = self.apply(notes, sort=False)
+        degraded = degraded[np.isin(degraded.pitch, pitches)]
+
+        clean_rolls = _pianorolls(clean, pitches, time_increment)
+        degraded_rolls = _pianorolls(degraded, pitches, time_increment)
+        length = max(len(clean_rolls[0]), len(degraded_rolls[0]))
+        changed = np.zeros(length, dtype=int)
+        for clean_roll, degraded_roll in zip(clean_rolls, degraded_rolls):
+            clean_roll = _pad(clean_roll, length)
+            degraded_roll = _pad(degraded_roll, length)
+            changed |= np.any(clean_roll != degraded_roll, axis=1)
+
+        if num_frames is None:
+            changed_indices = np.nonzero(changed)[0]
+            num_frames = changed_indices[-1] + 1 if len(changed_indices) > 0 else 0
+        return _pad(changed, num_frames)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"NoteEdit({self.data!r})"
+
+
+def _pad(array, length):
+    """Zero-pad or clip the given array to the given length along axis 0."""
+    if len(array) >= length:
+        return array[:length]
+    padding = np.zeros((length - len(array),) + array.shape[1:], dtype=array.dtype)
+    return np.concatenate((array, padding))
+
+
+def _pianorolls(notes, pitches, time_increment):
+    """
+    Create note and onset piano-rolls of the given notes, quantized as in
+    formatters.df_to_pianoroll_str.
+
+    Parameters
+    ----------
+    notes : NoteArray
+        The notes to roll out. Each must have a pitch in pitches.
+
+    pitches : np.ndarray
+        The sorted pitches to include, one column each.
+
+    time_increment : int
+        The length of a single frame, in milliseconds.
+
+    Returns
+    -------
+    note_roll : np.ndarray
+        A boolean array of shape (num_frames, len(pitches)), which is True
+        where a note is sounding.
+
+    onset_roll : np.ndarray
+        A boolean array of the same shape, which is True where a note begins.
+    """
+    onsets = np.round(notes.onset / time_increment).astype(np.int64)
+    offsets = np.maximum(
+        np.round(notes.offset / time_increment).astype(np.int64), onsets + 1
+    )
+    columns = np.searchsorted(pitches, notes.pitch)
+    num_frames = offsets.max() if len(notes) > 0 else 0
+
+    # Count sounding notes as a cumulative sum of starts and ends
+    counts = np.zeros((num_frames + 1, len(pitches)), dtype=np.int64)
+    np.add.at(counts, (onsets, columns), 1)
+    np.add.at(counts, (offsets, columns), -1)
+    note_roll = np.cumsum(counts, axis=0)[:-1] > 0
+
+    onset_roll = np.zeros((num_frames, len(pitches)), dtype=bool)
+    onset_roll[onsets, columns] = True
+    return note_roll, onset_roll
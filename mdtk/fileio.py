@@ -1,18 +1,27 @@
-"""Code to read/write note_dfs from/to midi and csv files."""
+"""Code to read/write note_dfs from/to midi and csv files, and ACME datasets
+from/to shard files."""
 import logging
 import os
 from glob import glob
 
+import numpy as np
 import pandas as pd
 import pretty_midi
 from tqdm import tqdm
 
 from mdtk.df_utils import NOTE_DF_SORT_ORDER, clean_df
+from mdtk.note_array import NoteArray, NoteBatch
 
 COLNAMES = NOTE_DF_SORT_ORDER
 
 DEFAULT_VELOCITY = 100
 
+# The directory of an ACME dataset containing its shard files
+SHARD_DIR = "shards"
+
+# The label arrays stored in each ACME shard, one value per excerpt
+SHARD_LABELS = ["degraded", "degradation_id", "clean_csv_path", "altered_csv_path"]
+
 
 def midi_dir_to_csv(
     midi_dir_path,
@@ -397,3 +406,126 @@ def df_to_midi(
 
     df.drop(columns=["start", "end"], axis=1, inplace=True)
     midi.write(midi_path)
+
+
+def write_acme_shard(shard_path, clean, altered, labels):
+    """
+    Write excerpts of an ACME dataset out to a single shard file.
+
+    A shard is an uncompressed npz file containing, for both the clean and
+    altered excerpts, the notes of every excerpt concatenated (as in a
+    NoteBatch) and the offset of each excerpt, as well as the labels of each
+    excerpt.
+
+    Parameters
+    ----------
+    shard_path : string
+        The path of the shard file to write. Any nested directories will be
+        created.
+
+    clean : NoteBatch
+        The clean excerpts.
+
+    altered : NoteBatch
+        The altered excerpts, in the same order. Those which were not degraded
+        are copies of the clean excerpt.
+
+    labels : dict
+        An array-like of one value per excerpt, for each label in
+        SHARD_LABELS: degraded (1 if the excerpt was degraded, else 0),
+        degradation_id, clean_csv_path, and altered_csv_path (the relative
+        paths at which the excerpts are written in the csv layout).
+    """
+    assert len(clean) == len(altered), "clean and altered must be the same length."
+    if os.path.split(shard_path)[0]:
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+
+    # Write to a temporary file first, so that a shard is never partial
+    tmp_path = f"{shard_path}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(
+            file,
+            clean_notes=clean.notes.data,
+            clean_offsets=clean.offsets,
+            altered_notes=altered.notes.data,
+            altered_offsets=altered.offsets,
+            degraded=np.asarray(labels["degraded"], dtype=np.int8),
+            degradation_id=np.asarray(labels["degradation_id"], dtype=np.int32),
+            clean_csv_path=np.asarray(labels["clean_csv_path"], dtype=str),
+            altered_csv_path=np.asarray(labels["altered_csv_path"], dtype=str),
+        )
+    os.replace(tmp_path, shard_path)
+
+
+def read_acme_shard(shard_path):
+    """
+    Read the excerpts of an ACME dataset from a single shard file.
+
+    Parameters
+    ----------
+    shard_path : string
+        The path of the shard file, as written by write_acme_shard.
+
+    Returns
+    -------
+    shard : dict
+        A dict containing the clean and altered excerpts as NoteBatches (under
+        "clean" and "altered"), and an array of each label in SHARD_LABELS.
+    """
+    with np.load(shard_path, allow_pickle=False) as data:
+        shard = {
+            "clean": NoteBatch(NoteArray(data["clean_notes"]), data["clean_offsets"]),
+            "altered": NoteBatch(
+                NoteArray(data["altered_notes"]), data["altered_offsets"]
+            ),
+        }
+        for label in SHARD_LABELS:
+            shard[label] = data[label]
+    return shard
+
+
+def acme_shard_paths(acme_dir, split=None):
+    """
+    Get the paths of the shard files of an ACME dataset.
+
+    Parameters
+    ----------
+    acme_dir : string
+        The directory containing the ACME data.
+
+    split : string
+        The split (train, valid, or test) to get the shards of. None to get
+        the shards of every split.
+
+    Returns
+    -------
+    shard_paths : list(string)
+        The path of each shard, sorted.
+    """
+    pattern = "*.npz" if split is None else f"{split}-*.npz"
+    return sorted(glob(os.path.join(acme_dir, SHARD_DIR, pattern)))
+
+
+def acme_shards_to_csvs(acme_dir):
+    """
+    Export the excerpts of a sharded ACME dataset to the csv layout, with one
+    csv file per clean and altered excerpt, at the paths given in the
+    dataset's metadata.csv.
+
+    Parameters
+    ----------
+    acme_dir : string
+        The directory containing the ACME data.
+    """
+    for shard_path in tqdm(acme_shard_paths(acme_dir), desc="Exporting shards"):
+        shard = read_acme_shard(shard_path)
+        for index in range(len(shard["clean"])):
+            df_to_csv(
+                shard["clean"][index].to_df(),
+                os.path.join(acme_dir, shard["clean_csv_path"][index]),
+            )
+            if shard["degraded"][index]:
+                df_to_csv(
+                    shard["altered"][index].to_df(),
+                    os.path.join(acme_dir, shard["altered_csv_path"][index]),
+                )
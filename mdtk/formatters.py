@@ -9,7 +9,7 @@ import tqdm
 
 from mdtk.degradations import MAX_PITCH_DEFAULT, MIN_PITCH_DEFAULT
 from mdtk.df_utils import NOTE_DF_SORT_ORDER
-from mdtk.fileio import DEFAULT_VELOCITY, csv_to_df
+from mdtk.fileio import DEFAULT_VELOCITY, csv_to_df, read_acme_shard
 
 
 # Convenience function...
@@ -67,7 +67,9 @@ class CommandVocab(object):
 def create_corpus_csvs(acme_dir, format_dict):
     """
     From a given acme dataset, create formatted csv files to use with
-    our provided pytorch Dataset classes.
+    our provided pytorch Dataset classes. The excerpts are read from the
+    dataset's shards if it was written with them (if metadata.csv has a
+    shard_path column), or from its csvs otherwise.
 
     Parameters
     ----------
@@ -96,12 +98,22 @@ def create_corpus_csvs(acme_dir, format_dict):
     }
     line_counts = {split: 0 for split in ["train", "valid", "test"]}
     meta_df = pd.read_csv(os.path.join(acme_dir, "metadata.csv"))
+    sharded = "shard_path" in meta_df.columns
+    shard_path = None
     for idx, row in tqdm.tqdm(
         meta_df.iterrows(), total=meta_df.shape[0], desc=f"Creating {name} corpus"
     ):
-        alt_df = csv_to_df(os.path.join(acme_dir, row.altered_csv_path))
+        if sharded:
+            # Excerpts are listed shard by shard, so only one is kept in memory
+            if row.shard_path != shard_path:
+                shard_path = row.shard_path
+                shard = read_acme_shard(os.path.join(acme_dir, shard_path))
+            alt_df = shard["altered"][row.shard_index].to_df()
+            clean_df = shard["clean"][row.shard_index].to_df()
+        else:
+            alt_df = csv_to_df(os.path.join(acme_dir, row.altered_csv_path))
+            clean_df = csv_to_df(os.path.join(acme_dir, row.clean_csv_path))
         alt_str = df_converter_func(alt_df)
-        clean_df = csv_to_df(os.path.join(acme_dir, row.clean_csv_path))
         clean_str = df_converter_func(clean_df)
         deg_num = row.degradation_id
         split = row.split
@@ -116,6 +128,38 @@ def create_corpus_csvs(acme_dir, format_dict):
     meta_df.to_csv(os.path.join(acme_dir, "metadata.csv"), index=False)
 
 
+def shard_corpus_lines(shard_paths, format_dict):
+    """
+    Get the formatted lines of a corpus (as written by create_corpus_csvs)
+    directly from the shards of an acme dataset.
+
+    Parameters
+    ----------
+    shard_paths : list(string)
+        The paths of the shards to read, such as those of a single split (see
+        fileio.acme_shard_paths).
+
+    format_dict: dict
+        A dictionary (likely one provided in FORMATTERS), containing at least:
+        df_to_str : function
+            The function to convert from a pandas DataFrame to a string in the
+            desired format.
+
+    Yields
+    ------
+    line : list(string)
+        The altered string, clean string, and degradation id of each excerpt
+        in the shards, in order, as in the rows of a corpus csv.
+    """
+    df_converter_func = format_dict["df_to_str"]
+    for shard_path in shard_paths:
+        shard = read_acme_shard(shard_path)
+        for index, deg_num in enumerate(shard["degradation_id"]):
+            alt_str = df_converter_func(shard["altered"][index].to_df())
+            clean_str = df_converter_func(shard["clean"][index].to_df())
+            yield [alt_str, clean_str, str(deg_num)]
+
+
 def df_to_pianoroll_str(df, time_increment=40):
     """
     Convert a given pandas DataFrame into a packed piano-roll representation:
@@ -0,0 +1,346 @@
+"""Opt-in instrumentation of the degradations, to see where time goes when
+generating data, and why degradations fail. While recording is enabled (see
+enable), every call of a degradation in mdtk.degradations records its wall
+time, input size, number of tries, and (if it failed) the cause of its failure.
+These are recorded whether or not warnings are disabled, as they are by
+Degrader.
+
+Recording is disabled by default, in which case each degradation call costs
+only a single extra check."""
+import heapq
+import json
+import time
+from functools import wraps
+
+# Causes of degradation failures
+NO_VALID_NOTES = "no_valid_notes"
+TRIES_EXHAUSTED = "tries_exhausted"
+NO_FREE_EDIT = "no_free_edit"
+EMPTY_DISTRIBUTION = "empty_distribution"
+NO_VALID_ALIGNMENT = "no_valid_alignment"
+INFEASIBLE = "infeasible"
+UNKNOWN = "unknown"
+
+# The DegradationStats being recorded to, or None if recording is disabled
+_STATS = None
+
+# The _Call record of the degradation currently being performed
+_CALL = None
+
+
+class _Call:
+    """The tries and failure cause of a single degradation call."""
+
+    __slots__ = ("tries", "cause")
+
+    def __init__(self):
+        self.tries = 0
+        self.cause = None
+
+
+class DegradationStats:
+    """A DegradationStats object aggregates the calls of each degradation
+    recorded while it is enabled: the number of calls and successes, failures
+    by cause, and totals of their wall time, tries, and input sizes. It also
+    keeps the slowest calls, to help find pathological inputs."""
+
+    def __init__(self, num_slowest=10):
+        """
+        Create a new, empty DegradationStats.
+
+        Parameters
+        ----------
+        num_slowest : int
+            The number of the slowest calls to keep.
+        """
+        self.num_slowest = num_slowest
+        self.degradations = {}
+        self.slowest = []
+
+    def _entry(self, name):
+        """
+        Get the statistics of the given degradation, creating them if needed.
+
+        Parameters
+        ----------
+        name : string
+            The name of the degradation.
+
+        Returns
+        -------
+        entry : dict
+            The statistics of the degradation.
+        """
+        if name not in self.degradations:
+            self.degradations[name] = {
+                "calls": 0,
+                "successes": 0,
+                "failures": {},
+                "skipped": 0,
+                "time": 0.0,
+                "max_time": 0.0,
+                "tries": 0,
+                "notes": 0,
+                "max_notes": 0,
+            }
+        return self.degradations[name]
+
+    def record(self, name, seconds, num_notes, tries=0, cause=None):
+        """
+        Record a single call of a degradation.
+
+        Parameters
+        ----------
+        name : string
+            The name of the degradation.
+
+        seconds : float
+            The wall time of the call, in seconds.
+
+        num_notes : int
+            The number of notes in the input excerpt.
+
+        tries : int
+            The number of times the degradation was attempted before it
+            succeeded or gave up (0 for degradations which never retry).
+
+        cause : string
+            The cause of the degradation's failure, or None if it succeeded.
+        """
+        entry = self._entry(name)
+        entry["calls"] += 1
+        if cause is None:
+            entry["successes"] += 1
+        else:
+            entry["failures"][cause] = entry["failures"].get(cause, 0) + 1
+        entry["time"] += seconds
+        entry["max_time"] = max(entry["max_time"], seconds)
+        entry["tries"] += tries
+        entry["notes"] += num_notes
+        entry["max_notes"] = max(entry["max_notes"], num_notes)
+
+        call = (seconds, name, num_notes, tries, cause)
+        if len(self.slowest) < self.num_slowest:
+            heapq.heappush(self.slowest, call)
+        elif self.num_slowest > 0 and seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, call)
+
+    def record_skip(self, name, cause=INFEASIBLE):
+        """
+        Record that a degradation was chosen but not attempted, because it
+        could not have succeeded. This counts as a failure, but not a call.
+
+        Parameters
+        ----------
+        name : string
+            The name of the degradation.
+
+        cause : string
+            The reason it was skipped.
+        """
+        entry = self._entry(name)
+        entry["skipped"] += 1
+        entry["failures"][cause] = entry["failures"].get(cause, 0) + 1
+
+    def merge(self, other):
+        """
+        Add the statistics recorded by another DegradationStats to these, for
+        example from another process.
+
+        Parameters
+        ----------
+        other : DegradationStats
+            The statistics to add.
+        """
+        for name, other_entry in other.degradations.items():
+            entry = self._entry(name)
+            for key, value in other_entry.items():
+                if key == "failures":
+                    for cause, count in value.items():
+                        entry[key][cause] = entry[key].get(cause, 0) + count
+                elif key.startswith("max_"):
+                    entry[key] = max(entry[key], value)
+                else:
+                    entry[key] += value
+        for call in other.slowest:
+            if len(self.slowest) < self.num_slowest:
+                heapq.heappush(self.slowest, call)
+            elif self.num_slowest > 0 and call[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, call)
+
+    def to_dict(self):
+        """
+        Get these statistics as a dict, with mean values added for each
+        degradation, which can be saved as json.
+
+        Returns
+        -------
+        stats : dict
+            A dict with a "degradations" dict of the statistics of each
+            degradation, and a "slowest" list of the slowest calls (slowest
+            first).
+        """
+        degradations = {}
+        for name, entry in self.degradations.items():
+            entry = dict(entry, failures=dict(entry["failures"]))
+            calls = max(entry["calls"], 1)
+            entry["mean_time"] = entry["time"] / calls
+            entry["mean_tries"] = entry["tries"] / calls
+            entry["mean_notes"] = entry["notes"] / calls
+            degradations[name] = entry
+
+        slowest = [
+            dict(zip(("time", "degradation", "notes", "tries", "cause"), call))
+            for call in sorted(self.slowest, reverse=True)
+        ]
+        return {"degradations": degradations, "slowest": slowest}
+
+    def to_json(self, path=None, **kwargs):
+        """
+        Export these statistics as json.
+
+        Parameters
+        ----------
+        path : string
+            A file to write the json to. None to only return it.
+
+        kwargs
+            Additional keyword arguments for json.dumps (such as indent).
+
+        Returns
+        -------
+        json_str : string
+            These statistics (see to_dict), as a json string.
+        """
+        json_str = json.dumps(self.to_dict(), **kwargs)
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(json_str)
+        return json_str
+
+
+def enable(stats=None):
+    """
+    Start recording degradation calls.
+
+    Parameters
+    ----------
+    stats : DegradationStats
+        The object to record to. None to create a new one.
+
+    Returns
+    -------
+    stats : DegradationStats
+        The object being recorded to.
+    """
+    global _STATS
+    _STATS = DegradationStats() if stats is None else stats
+    return _STATS
+
+
+def disable():
+    """
+    Stop recording degradation calls.
+
+    Returns
+    -------
+    stats : DegradationStats
+        The object which was being recorded to, or None if recording was not
+        enabled.
+    """
+    global _STATS
+    stats, _STATS = _STATS, None
+    return stats
+
+
+def get_stats():
+    """
+    Get the object being recorded to.
+
+    Returns
+    -------
+    stats : DegradationStats
+        The object being recorded to, or None if recording is not enabled.
+    """
+    return _STATS
+
+
+def record_failure(cause):
+    """
+    Record the cause of the failure of the degradation currently being
+    performed. This is called by each degradation as it gives up.
+
+    Parameters
+    ----------
+    cause : string
+        The cause of the failure.
+    """
+    if _CALL is not None:
+        _CALL.cause = cause
+
+
+def count_try():
+    """
+    Count one attempt of the degradation currently being performed. This is
+    called by each degradation which retries on overlaps, on every try.
+    """
+    if _CALL is not None:
+        _CALL.tries += 1
+
+
+def record_skip(name, cause=INFEASIBLE):
+    """
+    Record that a degradation was chosen but not attempted, if recording is
+    enabled (see DegradationStats.record_skip).
+
+    Parameters
+    ----------
+    name : string
+        The name of the degradation.
+
+    cause : string
+        The reason it was skipped.
+    """
+    if _STATS is not None:
+        _STATS.record_skip(name, cause)
+
+
+def instrumented(func):
+    """
+    A function decorator which records each call of the given degradation
+    while recording is enabled.
+
+    Parameters
+    ----------
+    func : function
+        The degradation to record, which takes an excerpt as its first
+        argument and returns None if it fails.
+
+    Returns
+    -------
+    instrumented_func : function
+        The degradation, recording each of its calls.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def instrumented_func(excerpt, *args, **kwargs):
+        global _CALL
+        if _STATS is None:
+            return func(excerpt, *args, **kwargs)
+
+        outer_call, _CALL = _CALL, _Call()
+        call = _CALL
+        start = time.perf_counter()
+        try:
+            result = func(excerpt, *args, **kwargs)
+        finally:
+            _CALL = outer_call
+        seconds = time.perf_counter() - start
+
+        cause = None if result is not None else call.cause or UNKNOWN
+        if _STATS is not None:
+            _STATS.record(name, seconds, len(excerpt), call.tries, cause)
+        return result
+
+    return instrumented_func
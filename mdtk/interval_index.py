@@ -0,0 +1,598 @@
+"""An index of the intervals occupied by notes on each (track, pitch), used to
+quickly check whether a new or edited note would overlap an existing one."""
+import numpy as np
+
+
+def _key_codes(track, pitch):
+    """
+    Combine the given track and pitch values into a single int64 key each.
+
+    Parameters
+    ----------
+    track, pitch : np.ndarray or int
+        The track and pitch of some notes.
+
+    Returns
+    -------
+    codes : np.ndarray or int
+        A unique code for each (track, pitch) pair.
+    """
+    if isinstance(track, np.ndarray):
+        return (track.astype(np.int64) << 32) | (pitch.astype(np.int64) & 0xFFFFFFFF)
+    return (int(track) << 32) | (int(pitch) & 0xFFFFFFFF)
+
+
+def _prefix_max(offsets, group_starts):
+    """
+    Calculate the latest offset of every prefix of each group of notes. Groups
+    are consecutive, and within each group, notes are sorted by onset.
+
+    Parameters
+    ----------
+    offsets : np.ndarray
+        The offset time of each note, as int64.
+
+    group_starts : np.ndarray
+        A boolean array which is True at the first note of each group.
+
+    Returns
+    -------
+    prefix_max : np.ndarray
+        The latest offset among the notes of the group up to and including
+        each note.
+
+    prefix_arg : np.ndarray
+        The position of the last note attaining prefix_max.
+    """
+    if len(offsets) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    # A segmented cumulative maximum, calculated by lifting each group above
+    # the previous one so that no maximum can carry over between groups.
+    low = offsets.min()
+    lift = (np.cumsum(group_starts) - 1) * (offsets.max() - low + 1)
+    prefix_max = np.maximum.accumulate(offsets + (lift - low)) - (lift - low)
+    prefix_arg = np.maximum.accumulate(
+        np.where(offsets == prefix_max, np.arange(len(offsets)), 0)
+    )
+    return prefix_max, prefix_arg
+
+
+def batch_overlaps(notes, excerpt_index, new_notes, new_excerpt_index, exclude):
+    """
+    Check whether each of many new notes would overlap any note of its own
+    excerpt, as NoteIntervalIndex.overlaps does for a single note. All of the
+    notes are checked at once, without building an index of each excerpt.
+
+    Parameters
+    ----------
+    notes : NoteArray
+        The notes of every excerpt, concatenated (as in NoteBatch.notes).
+
+    excerpt_index : np.ndarray
+        The index of the excerpt which each of notes belongs to.
+
+    new_notes : NoteArray
+        The notes which might overlap.
+
+    new_excerpt_index : np.ndarray
+        The index of the excerpt which each new note belongs to.
+
+    exclude : np.ndarray
+        The indices of notes to ignore (usually the notes being changed).
+
+    Returns
+    -------
+    overlap : np.ndarray
+        A boolean array which is True for each new note which overlaps some
+        note of its excerpt.
+    """
+    keep = np.ones(len(notes), dtype=bool)
+    keep[exclude] = False
+    old_data = notes.data[keep]
+
+    # Number each (excerpt, track, pitch) group of the old and new notes
+    codes = np.concatenate(
+        (
+            _key_codes(old_data["track"], old_data["pitch"]),
+            _key_codes(new_notes.track, new_notes.pitch),
+        )
+    )
+    if len(codes) == 0:
+        return np.zeros(len(new_notes), dtype=bool)
+    _, codes = np.unique(codes, return_inverse=True)
+    excerpts = np.concatenate((excerpt_index[keep], new_excerpt_index))
+    _, groups = np.unique(
+        excerpts.astype(np.int64) * (codes.max() + 1) + codes, return_inverse=True
+    )
+    groups = groups.reshape(-1)
+    old_groups, new_groups = groups[: len(old_data)], groups[len(old_data) :]
+
+    # Sort the old notes by group and then onset, with a single int64 key.
+    # Times relative to the earliest onset fit in 34 bits.
+    old_onsets = old_data["onset"].astype(np.int64)
+    new_onsets = new_notes.onset.astype(np.int64)
+    low = np.concatenate((old_onsets, new_onsets)).min()
+    old_keys = (old_groups << 34) + (old_onsets - low)
+    order = np.argsort(old_keys, kind="stable")
+    old_keys = old_keys[order]
+    group_starts = np.ones(len(order), dtype=bool)
+    group_starts[1:] = old_groups[order][1:] != old_groups[order][:-1]
+    prefix_max, _ = _prefix_max((old_onsets + old_data["dur"])[order], group_starts)
+
+    # Old notes which begin before a new note ends overlap it if any of them
+    # ends after it begins
+    group_begin = np.searchsorted(old_keys, new_groups << 34, side="left")
+    onset_end = np.searchsorted(
+        old_keys, (new_groups << 34) + (new_notes.offset - low), side="left"
+    )
+    overlap = np.zeros(len(new_notes), dtype=bool)
+    before = onset_end > group_begin
+    overlap[before] = prefix_max[onset_end[before] - 1] > new_onsets[before]
+    return overlap
+
+
+class NoteIntervalIndex:
+    """A NoteIntervalIndex stores the notes of an excerpt grouped by (track,
+    pitch) and sorted by onset, along with the running maximum offset time of
+    each group. This allows checking whether any interval overlaps a given note
+    in O(log n) time (for excerpts with no overlapping notes already), rather
+    than comparing against every note.
+
+    The index is built from a copy of the note values, so it is not updated
+    automatically if the notes are changed. Use update, add, and remove to keep
+    it in sync with edits instead."""
+
+    def __init__(self, notes):
+        """
+        Build an index of the given notes.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The notes to index. Each note is identified by its index in notes.
+        """
+        codes = _key_codes(notes.track, notes.pitch)
+        onsets = notes.onset.astype(np.int64)
+        order = np.lexsort((onsets, codes))
+
+        self._codes = codes[order]
+        self._onsets = onsets[order]
+        self._offsets = self._onsets + notes.dur[order]
+        self._ids = order
+        self._positions = np.empty(len(order), dtype=np.int64)
+        self._positions[order] = np.arange(len(order))
+        self._refresh()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _refresh(self, code=None):
+        """
+        Recalculate the prefix statistics of the given group.
+
+        Parameters
+        ----------
+        code : int
+            The key code of the group to recalculate. None to recalculate
+            every group.
+        """
+        if code is None:
+            start, end = 0, len(self._codes)
+        else:
+            start = np.searchsorted(self._codes, code, side="left")
+            end = np.searchsorted(self._codes, code, side="right")
+
+        codes = self._codes[start:end]
+        group_starts = np.ones(len(codes), dtype=bool)
+        group_starts[1:] = codes[1:] != codes[:-1]
+        prefix_max, prefix_arg = _prefix_max(self._offsets[start:end], group_starts)
+
+        if code is None:
+            self._max, self._arg = prefix_max, prefix_arg
+        else:
+            self._max[start:end] = prefix_max
+            self._arg[start:end] = prefix_arg + start
+
+    def overlaps(self, onset, dur, track, pitch, exclude=None):
+        """
+        Check if a note with the given values would overlap any indexed note.
+
+        Parameters
+        ----------
+        onset, dur, track, pitch : int
+            The values of the note which might overlap.
+
+        exclude : int
+            The index of a note to ignore (usually the note being changed).
+            None to check against every note.
+
+        Returns
+        -------
+        overlap : boolean
+            True if the note overlaps some indexed note. False otherwise.
+        """
+        code = _key_codes(track, pitch)
+        group_start = self._codes.searchsorted(code, side="left")
+        group_end = self._codes.searchsorted(code, side="right")
+        if group_start == group_end:
+            return False
+
+        onsets = self._onsets[group_start:group_end]
+        # Notes before onset_end begin before this note ends
+        onset_end = group_start + onsets.searchsorted(onset + dur, side="left")
+        # Notes from onset_start begin strictly within this note
+        onset_start = group_start + onsets.searchsorted(onset, side="right")
+
+        excluded = -1 if exclude is None else self._positions[exclude]
+
+        # Any note beginning strictly within this note overlaps it
+        within = onset_end - onset_start
+        if onset_start <= excluded < onset_end:
+            within -= 1
+        if within > 0:
+            return True
+
+        # Other notes overlap if they end after this note begins
+        last = min(onset_start, onset_end) - 1
+        if last < group_start:
+            return False
+        if self._arg[last] != excluded:
+            return bool(self._max[last] > onset)
+
+        # The excluded note ends last, so check the others individually. This
+        # is only slow if the excluded note already overlaps later notes.
+        if excluded > group_start and self._max[excluded - 1] > onset:
+            return True
+        return bool(np.any(self._offsets[excluded + 1 : last + 1] > onset))
+
+    def group(self, track, pitch, exclude=None):
+        """
+        Get the intervals of the indexed notes with the given track and pitch.
+
+        Parameters
+        ----------
+        track, pitch : int
+            The track and pitch of the notes to get.
+
+        exclude : int
+            The index of a note to leave out. None to get every note.
+
+        Returns
+        -------
+        onsets : np.ndarray
+            The onset time of each note, in sorted order.
+
+        offsets : np.ndarray
+            The offset time of each note.
+        """
+        code = _key_codes(track, pitch)
+        group_start = self._codes.searchsorted(code, side="left")
+        group_end = self._codes.searchsorted(code, side="right")
+        onsets = self._onsets[group_start:group_end]
+        offsets = self._offsets[group_start:group_end]
+
+        if exclude is not None:
+            position = self._positions[exclude]
+            if group_start <= position < group_end:
+                onsets = np.delete(onsets, position - group_start)
+                offsets = np.delete(offsets, position - group_start)
+
+        return onsets, offsets
+
+    def update(self, index, onset, dur, track, pitch):
+        """
+        Update the values of an indexed note.
+
+        Parameters
+        ----------
+        index : int
+            The index of the note to update.
+
+        onset, dur, track, pitch : int
+            The new values of the note.
+        """
+        self.remove(index, renumber=False)
+        self._insert(index, onset, dur, track, pitch)
+
+    def add(self, onset, dur, track, pitch):
+        """
+        Add a new note to the index. It is given the next available index.
+
+        Parameters
+        ----------
+        onset, dur, track, pitch : int
+            The values of the new note.
+
+        Returns
+        -------
+        index : int
+            The index of the new note.
+        """
+        index = len(self._ids)
+        self._positions = np.append(self._positions, 0)
+        self._insert(index, onset, dur, track, pitch)
+        return index
+
+    def remove(self, index, renumber=True):
+        """
+        Remove a note from the index.
+
+        Parameters
+        ----------
+        index : int
+            The index of the note to remove.
+
+        renumber : boolean
+            True to decrement the index of every later note, as when deleting
+            a note from a NoteArray. False to leave the index unused.
+        """
+        position = self._positions[index]
+        code = self._codes[position]
+        self._codes = np.delete(self._codes, position)
+        self._onsets = np.delete(self._onsets, position)
+        self._offsets = np.delete(self._offsets, position)
+        self._ids = np.delete(self._ids, position)
+        self._max = np.delete(self._max, position)
+        self._arg = np.delete(self._arg, position)
+        self._arg[self._arg > position] -= 1
+
+        later = self._positions > position
+        self._positions[later] -= 1
+        if renumber:
+            self._positions = np.delete(self._positions, index)
+            self._ids[self._ids > index] -= 1
+
+        self._refresh(code)
+
+    def _insert(self, index, onset, dur, track, pitch):
+        """
+        Insert a note into the sorted arrays, under the given (unused) index.
+
+        Parameters
+        ----------
+        index : int
+            The index of the new note.
+
+        onset, dur, track, pitch : int
+            The values of the new note.
+        """
+        code = _key_codes(track, pitch)
+        group_start = np.searchsorted(self._codes, code, side="left")
+        group_end = np.searchsorted(self._codes, code, side="right")
+        position = group_start + np.searchsorted(
+            self._onsets[group_start:group_end], onset, side="right"
+        )
+
+        self._codes = np.insert(self._codes, position, code)
+        self._onsets = np.insert(self._onsets, position, onset)
+        self._offsets = np.insert(self._offsets, position, onset + dur)
+        self._ids = np.insert(self._ids, position, index)
+        self._max = np.insert(self._max, position, 0)
+        self._arg[self._arg >= position] += 1
+        self._arg = np.insert(self._arg, position, position)
+
+        self._positions[self._positions >= position] += 1
+        self._positions[index] = position
+
+        self._refresh(code)
+
+
+def _segment_counts(starts, ends, uppers, max_count):
+    """
+    Count the valid (onset, duration) pairs of a new note in each segment of a
+    FreeIntervalIndex. A note beginning at onset time o in a segment may have
+    any of min(upper - o, max_count) durations (or none, if that is negative).
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        The [start, end) onset times of each segment, as int64.
+
+    uppers : np.ndarray
+        The upper value of each segment, as int64.
+
+    max_count : int
+        The number of durations allowed by the maximum duration.
+
+    Returns
+    -------
+    counts : np.ndarray
+        The number of valid (onset, duration) pairs in each segment.
+    """
+    # Onsets up to uppers - max_count allow every duration, and later onsets
+    # allow one fewer each
+    full_end = np.clip(uppers - max_count + 1, starts, ends)
+    linear_end = np.clip(uppers, full_end, ends)
+    first, last = uppers - full_end, uppers - linear_end + 1
+    linear_counts = (linear_end - full_end) * (first + last) // 2
+    return (full_end - starts) * max_count + linear_counts
+
+
+class FreeIntervalIndex:
+    """A FreeIntervalIndex stores the onset times at which a new note could be
+    added to each (track, pitch) of an excerpt without overlapping any existing
+    note there. These are stored as segments of consecutive onset times,
+    within each of which the next note onset at that (track, pitch) is fixed.
+    The number of valid durations for a new note is then a simple function of
+    its onset time, so a non-overlapping note can be sampled in a single draw,
+    rather than by rejecting overlapping notes.
+
+    Like a NoteIntervalIndex, it is built from a copy of the note values, so
+    it is not updated if the notes are changed."""
+
+    def __init__(self, notes, min_duration, start, end, max_offset):
+        """
+        Build an index of the free intervals of the given notes.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The notes to index.
+
+        min_duration : int
+            The minimum duration of a new note. Values less than 1 are treated
+            as 1 (zero-length notes are never sampled).
+
+        start, end : int
+            The range [start, end) of allowed onset times for a new note.
+
+        max_offset : int
+            The (exclusive) maximum offset time of a new note.
+        """
+        self.min_duration = max(int(min_duration), 1)
+        self.max_offset = int(max_offset)
+
+        codes = _key_codes(notes.track, notes.pitch)
+        self._codes, groups = np.unique(codes, return_inverse=True)
+        groups = groups.reshape(-1)
+        onsets = notes.onset.astype(np.int64)
+        offsets = notes.offset
+
+        # Lay the groups out one after another on a single time line, with
+        # time low at the beginning of each group's width
+        low = min(start, onsets.min(initial=start) - self.min_duration + 1) - 1
+        width = max(end, offsets.max(initial=end)) - low + 1
+        base = np.arange(len(self._codes), dtype=np.int64) * width - low
+
+        # Onsets in [onset - min_duration + 1, offset) overlap a note, and
+        # onsets outside of [start, end) are not allowed
+        blocked_starts = np.concatenate(
+            (onsets - self.min_duration + 1 + base[groups], base + low, base + end)
+        )
+        blocked_ends = np.concatenate(
+            (offsets + base[groups], base + start, base + low + width)
+        )
+        nonempty = blocked_starts < blocked_ends
+        order = np.argsort(blocked_starts[nonempty], kind="stable")
+        blocked_starts = blocked_starts[nonempty][order]
+        blocked_ends = np.maximum.accumulate(blocked_ends[nonempty][order])
+        is_gap = blocked_ends[:-1] < blocked_starts[1:]
+        gap_starts = blocked_ends[:-1][is_gap]
+        gap_ends = blocked_starts[1:][is_gap]
+
+        # Split the gaps at each onset time within them (only possible for
+        # notes with zero duration)
+        lifted_onsets = np.unique(onsets + base[groups])
+        gap_index = np.searchsorted(gap_starts, lifted_onsets, side="right") - 1
+        within = gap_index >= 0
+        within[within] = (lifted_onsets[within] > gap_starts[gap_index[within]]) & (
+            lifted_onsets[within] < gap_ends[gap_index[within]]
+        )
+        seg_starts = np.concatenate((gap_starts, lifted_onsets[within]))
+        seg_gaps = np.concatenate((np.arange(len(gap_starts)), gap_index[within]))
+        order = np.argsort(seg_starts, kind="stable")
+        seg_starts, seg_gaps = seg_starts[order], seg_gaps[order]
+        seg_ends = gap_ends[seg_gaps]
+        same_gap = seg_gaps[1:] == seg_gaps[:-1]
+        seg_ends[:-1][same_gap] = seg_starts[1:][same_gap]
+
+        # The next onset of each segment's group, after which no new note may
+        # sound
+        self._groups = seg_starts // width
+        next_index = np.searchsorted(lifted_onsets, seg_starts, side="right")
+        next_onsets = np.full(len(seg_starts), self.max_offset, dtype=np.int64)
+        has_next = next_index < len(lifted_onsets)
+        next_lifted = lifted_onsets[next_index[has_next]]
+        same_group = next_lifted // width == self._groups[has_next]
+        has_next[has_next] = same_group
+        next_onsets[has_next] = (
+            next_lifted[same_group] - base[self._groups[has_next]]
+        )
+
+        self._starts = seg_starts - base[self._groups]
+        self._ends = seg_ends - base[self._groups]
+        self._uppers = (
+            np.minimum(next_onsets + 1, self.max_offset) - self.min_duration
+        )
+        self._group_starts = np.searchsorted(
+            self._groups, np.arange(len(self._codes) + 1)
+        )
+
+        # Any (track, pitch) without notes has a single segment
+        self._empty_start = start
+        self._empty_end = max(start, end)
+        self._empty_upper = self.max_offset - self.min_duration
+
+    def sample(self, tracks, pitches, weights, max_duration, rng):
+        """
+        Sample a new note which does not overlap any indexed note, uniformly
+        from every valid (onset, duration) pair of each given (track, pitch)
+        pair, weighted by the given weights.
+
+        Parameters
+        ----------
+        tracks, pitches : np.ndarray
+            The track and pitch of each allowed (track, pitch) pair.
+
+        weights : np.ndarray
+            The weight of each (track, pitch) pair.
+
+        max_duration : int or float
+            The maximum duration of the new note.
+
+        rng : np.random.Generator
+            The random number generator to use.
+
+        Returns
+        -------
+        note : tuple(int) or None
+            The onset, duration, track, and pitch of the new note, or None if
+            no note can be added to any given (track, pitch) pair.
+        """
+        max_count = int(min(max_duration, self.max_offset)) + 1 - self.min_duration
+        if max_count <= 0:
+            return None
+
+        counts = _segment_counts(self._starts, self._ends, self._uppers, max_count)
+        group_counts = np.bincount(
+            self._groups, weights=counts, minlength=len(self._codes)
+        )
+        empty_count = _segment_counts(
+            np.array([self._empty_start]),
+            np.array([self._empty_end]),
+            np.array([self._empty_upper]),
+            max_count,
+        )[0]
+
+        # Sample a (track, pitch) pair
+        codes = _key_codes(np.asarray(tracks), np.asarray(pitches))
+        groups = np.searchsorted(self._codes, codes)
+        indexed = np.zeros(len(codes), dtype=bool)
+        found = groups < len(self._codes)
+        indexed[found] = self._codes[groups[found]] == codes[found]
+        pair_counts = np.full(len(codes), empty_count, dtype=float)
+        pair_counts[indexed] = group_counts[groups[indexed]]
+        pair_weights = weights * pair_counts
+        total = np.sum(pair_weights)
+        if total <= 0:
+            return None
+        pair = rng.choice(len(pair_weights), p=pair_weights / total)
+
+        # Sample a segment of its free intervals
+        if indexed[pair]:
+            group = groups[pair]
+            first = self._group_starts[group]
+            segment_counts = counts[first : self._group_starts[group + 1]]
+            segment = first + rng.choice(
+                len(segment_counts), p=segment_counts / np.sum(segment_counts)
+            )
+            start, end = self._starts[segment], self._ends[segment]
+            upper = self._uppers[segment]
+        else:
+            start, end = self._empty_start, self._empty_end
+            upper = self._empty_upper
+
+        # Sample an (onset, duration) pair within that segment
+        onset_counts = np.clip(upper - np.arange(start, end), 0, max_count)
+        cumulative = np.cumsum(onset_counts)
+        choice = rng.integers(cumulative[-1])
+        index = np.searchsorted(cumulative, choice, side="right")
+        duration = choice - (cumulative[index] - onset_counts[index])
+        return (
+            int(start + index),
+            int(self.min_duration + duration),
+            int(tracks[pair]),
+            int(pitches[pair]),
+        )
@@ -0,0 +1,490 @@
+"""A compact, array-backed container for note data.
+
+A NoteArray holds the same information as a note_df (onset, track, pitch, dur,
+and velocity for each note), but stores it in a single structured numpy array
+with int32 columns. This avoids the pandas overhead incurred by small excerpts,
+and is the native input and output type of the functions in the degradations
+module. A NoteBatch stores many excerpts in one flat NoteArray."""
+import numpy as np
+import pandas as pd
+
+from mdtk.df_utils import NOTE_DF_SORT_ORDER, is_sorted
+from mdtk.interval_index import FreeIntervalIndex, NoteIntervalIndex
+
+NOTE_ARRAY_DTYPE = np.dtype([(name, np.int32) for name in NOTE_DF_SORT_ORDER])
+
+# The largest value which can be stored in any column of a NoteArray
+MAX_NOTE_VALUE = np.iinfo(np.int32).max
+
+
+class NoteArray:
+    """A NoteArray is a thin wrapper around a structured numpy array of dtype
+    NOTE_ARRAY_DTYPE, with one record per note. Rows are always indexed by
+    consecutive ints from 0, like a pre-processed note_df.
+
+    A NoteArray caches whether it is sorted, and those returned by sort are
+    marked as sorted, so that sorting them again is free. Edit a copy of a
+    NoteArray rather than editing a sorted one in place."""
+
+    __slots__ = ("data", "_interval_index", "_free_interval_indexes", "_sorted")
+
+    def __init__(self, data=None):
+        """
+        Create a new NoteArray.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            A 1-dimensional structured array with dtype NOTE_ARRAY_DTYPE. It is
+            used directly (not copied). None creates an empty NoteArray.
+        """
+        if data is None:
+            data = np.empty(0, dtype=NOTE_ARRAY_DTYPE)
+        elif data.dtype != NOTE_ARRAY_DTYPE:
+            data = data.astype(NOTE_ARRAY_DTYPE)
+        self.data = data
+        self._interval_index = None
+        self._free_interval_indexes = {}
+        self._sorted = None
+
+    @classmethod
+    def from_columns(cls, onset, track, pitch, dur, velocity):
+        """
+        Create a NoteArray from one array-like per column.
+
+        Parameters
+        ----------
+        onset, track, pitch, dur, velocity : array-like or int
+            The values of each column. Scalars are broadcast to the length of
+            the other columns.
+
+        Returns
+        -------
+        notes : NoteArray
+            A new NoteArray containing the given values, in the given order.
+        """
+        columns = np.broadcast_arrays(onset, track, pitch, dur, velocity)
+        data = np.empty(columns[0].shape[0] if columns[0].ndim else 1, NOTE_ARRAY_DTYPE)
+        for name, column in zip(NOTE_DF_SORT_ORDER, columns):
+            data[name] = column
+        return cls(data)
+
+    @classmethod
+    def from_df(cls, df, sort=False):
+        """
+        Create a NoteArray from a note_df. Any additional columns are dropped,
+        and all values are rounded to ints.
+
+        If the df is already a view of a NoteArray (as returned by to_df), the
+        underlying data is reused and no copy is made.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            A note_df, with at least the columns onset, track, pitch, dur, and
+            velocity.
+
+        sort : boolean
+            True to sort the resulting notes by onset, track, pitch, dur, and
+            then velocity.
+
+        Returns
+        -------
+        notes : NoteArray
+            The notes from the given df.
+
+        Raises
+        ------
+        ValueError
+            If the given df does not have all of the necessary columns.
+        """
+        if list(df.columns) == NOTE_DF_SORT_ORDER and all(
+            dtype == np.int32 for dtype in df.dtypes
+        ):
+            values = df.to_numpy()
+            if values.flags.c_contiguous:
+                notes = cls(values.view(NOTE_ARRAY_DTYPE).reshape(-1))
+                return notes.sort() if sort else notes
+
+        try:
+            columns = [df[name].to_numpy() for name in NOTE_DF_SORT_ORDER]
+        except KeyError:  # df has incorrect columns
+            raise ValueError(
+                f"Input note_df must have all of the columns: {NOTE_DF_SORT_ORDER}"
+            )
+
+        data = np.empty(len(df), dtype=NOTE_ARRAY_DTYPE)
+        for name, column in zip(NOTE_DF_SORT_ORDER, columns):
+            if column.dtype.kind != "i":
+                column = np.rint(column.astype(float))
+            data[name] = column
+
+        notes = cls(data)
+        return notes.sort() if sort else notes
+
+    def to_df(self):
+        """
+        Get a note_df view of this NoteArray. No data is copied, so changes
+        to the returned df are reflected in this NoteArray (and vice versa).
+        Use to_df().astype("int64") for an independent df with the default
+        note_df dtypes.
+
+        Returns
+        -------
+        df : pd.DataFrame
+            A note_df with int32 columns onset, track, pitch, dur, and velocity.
+        """
+        values = self.data.view(np.int32).reshape(-1, len(NOTE_DF_SORT_ORDER))
+        return pd.DataFrame(values, columns=NOTE_DF_SORT_ORDER, copy=False)
+
+    @property
+    def onset(self):
+        return self.data["onset"]
+
+    @property
+    def track(self):
+        return self.data["track"]
+
+    @property
+    def pitch(self):
+        return self.data["pitch"]
+
+    @property
+    def dur(self):
+        return self.data["dur"]
+
+    @property
+    def velocity(self):
+        return self.data["velocity"]
+
+    @property
+    def offset(self):
+        """The offset time of each note, as int64 to avoid overflow."""
+        return self.data["onset"].astype(np.int64) + self.data["dur"]
+
+    def interval_index(self):
+        """
+        Get a NoteIntervalIndex of these notes, for fast overlap checks. The
+        index is built on the first call and cached, so this NoteArray must
+        not be edited in place after calling this (edit a copy instead).
+
+        Returns
+        -------
+        index : NoteIntervalIndex
+            An index of these notes.
+        """
+        if self._interval_index is None:
+            self._interval_index = NoteIntervalIndex(self)
+        return self._interval_index
+
+    def free_interval_index(self, min_duration, start, end, max_offset):
+        """
+        Get a FreeIntervalIndex of these notes, for sampling new notes which do
+        not overlap them. Each index is built on the first call with its
+        arguments and cached, as in interval_index.
+
+        Parameters
+        ----------
+        min_duration, start, end, max_offset : int
+            The arguments of FreeIntervalIndex.
+
+        Returns
+        -------
+        index : FreeIntervalIndex
+            An index of the free intervals of these notes.
+        """
+        key = (int(min_duration), int(start), int(end), int(max_offset))
+        if key not in self._free_interval_indexes:
+            self._free_interval_indexes[key] = FreeIntervalIndex(self, *key)
+        return self._free_interval_indexes[key]
+
+    def is_sorted(self):
+        """
+        Check if this NoteArray is sorted by onset, track, pitch, dur, and then
+        velocity. The result is cached (and NoteArrays returned by sort are
+        known to be sorted), so this NoteArray must not be edited in place
+        after calling this (edit a copy instead).
+
+        Returns
+        -------
+        sorted : boolean
+            True if the notes are in sorted order. False otherwise.
+        """
+        if self._sorted is None:
+            self._sorted = is_sorted(self.data)
+        return self._sorted
+
+    def sort_order(self):
+        """
+        Get the indices which would sort this NoteArray by onset, track, pitch,
+        dur, and then velocity.
+
+        Returns
+        -------
+        order : np.ndarray
+            The sorting indices.
+        """
+        if self._sorted:
+            return np.arange(len(self.data))
+        return np.lexsort(
+            [self.data[name] for name in reversed(NOTE_DF_SORT_ORDER)]
+        )
+
+    def sort(self):
+        """
+        Get a sorted copy of this NoteArray. If this NoteArray is already known
+        to be sorted, it is only copied.
+
+        Returns
+        -------
+        notes : NoteArray
+            A copy of this NoteArray, sorted by onset, track, pitch, dur, and
+            then velocity.
+        """
+        if self._sorted:
+            notes = self.copy()
+        else:
+            notes = NoteArray(self.data[self.sort_order()])
+        notes._sorted = True
+        return notes
+
+    def copy(self):
+        return NoteArray(self.data.copy())
+
+    def equals(self, other):
+        """
+        Check if this NoteArray contains the same notes, in the same order, as
+        another.
+
+        Parameters
+        ----------
+        other : NoteArray
+            The NoteArray to compare to.
+
+        Returns
+        -------
+        equal : boolean
+            True if the two NoteArrays are equal. False otherwise.
+        """
+        return isinstance(other, NoteArray) and np.array_equal(self.data, other.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        result = self.data[key]
+        if isinstance(result, np.ndarray):
+            return NoteArray(result)
+        return result
+
+    def __repr__(self):
+        return f"NoteArray(\n{self.to_df()}\n)"
+
+
+def _range_indices(starts, lengths):
+    """
+    Get the concatenation of the index ranges [start, start + length) for each
+    of the given starts and lengths, without a Python loop.
+
+    Parameters
+    ----------
+    starts : np.ndarray
+        The first index of each range.
+
+    lengths : np.ndarray
+        The length of each range.
+
+    Returns
+    -------
+    indices : np.ndarray
+        All of the indices of each range, in order.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    shifts = np.asarray(starts, dtype=np.int64) - (ends - lengths)
+    return np.arange(ends[-1] if len(ends) else 0) + np.repeat(shifts, lengths)
+
+
+class NoteBatch:
+    """A NoteBatch is a ragged batch of excerpts, stored as a single flat
+    NoteArray of all of their notes concatenated, plus the offset of each
+    excerpt within it. Excerpt i is notes[offsets[i]:offsets[i + 1]]."""
+
+    __slots__ = ("notes", "offsets")
+
+    def __init__(self, notes=None, offsets=None):
+        """
+        Create a new NoteBatch.
+
+        Parameters
+        ----------
+        notes : NoteArray
+            The notes of every excerpt, concatenated. None for no notes.
+
+        offsets : array-like
+            The index in notes at which each excerpt begins, followed by
+            len(notes). None for a batch containing a single excerpt.
+        """
+        self.notes = NoteArray() if notes is None else notes
+        if offsets is None:
+            offsets = [0, len(self.notes)]
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        assert (
+            len(self.offsets) > 0
+            and self.offsets[0] == 0
+            and self.offsets[-1] == len(self.notes)
+            and np.all(np.diff(self.offsets) >= 0)
+        ), "offsets must increase from 0 to len(notes)."
+
+    @classmethod
+    def from_excerpts(cls, excerpts):
+        """
+        Create a NoteBatch from a list of excerpts.
+
+        Parameters
+        ----------
+        excerpts : list(pd.DataFrame or NoteArray)
+            The excerpts to store in the batch, in order. DataFrames are
+            converted as in NoteArray.from_df.
+
+        Returns
+        -------
+        batch : NoteBatch
+            A new NoteBatch containing a copy of the given excerpts.
+        """
+        data = [
+            (ex if isinstance(ex, NoteArray) else NoteArray.from_df(ex)).data
+            for ex in excerpts
+        ]
+        offsets = np.zeros(len(data) + 1, dtype=np.int64)
+        np.cumsum([len(d) for d in data], out=offsets[1:])
+        if len(data) == 0:
+            return cls(NoteArray(), offsets)
+        return cls(NoteArray(np.concatenate(data)), offsets)
+
+    @classmethod
+    def concatenate(cls, batches):
+        """
+        Join the given NoteBatches into a single NoteBatch.
+
+        Parameters
+        ----------
+        batches : list(NoteBatch)
+            The batches to join, in order.
+
+        Returns
+        -------
+        batch : NoteBatch
+            A new NoteBatch containing the excerpts of every given batch.
+        """
+        if len(batches) == 0:
+            return cls()
+        note_counts = np.cumsum([0] + [len(batch.notes) for batch in batches[:-1]])
+        offsets = np.concatenate(
+            [[0]]
+            + [
+                batch.offsets[1:] + count
+                for batch, count in zip(batches, note_counts)
+            ]
+        )
+        notes = NoteArray(np.concatenate([batch.notes.data for batch in batches]))
+        return cls(notes, offsets)
+
+    @property
+    def lengths(self):
+        """The number of notes in each excerpt."""
+        return np.diff(self.offsets)
+
+    def excerpt_index(self):
+        """
+        Get the index of the excerpt which each note belongs to.
+
+        Returns
+        -------
+        index : np.ndarray
+            An array the length of self.notes, containing the excerpt index
+            of each note.
+        """
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def take(self, indices):
+        """
+        Get a new NoteBatch containing only the given excerpts.
+
+        Parameters
+        ----------
+        indices : array-like
+            The indices of the excerpts to take, in the desired order.
+
+        Returns
+        -------
+        batch : NoteBatch
+            A new NoteBatch containing a copy of the given excerpts.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.lengths[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        data = self.notes.data[_range_indices(self.offsets[indices], lengths)]
+        return NoteBatch(NoteArray(data), offsets)
+
+    def sort(self):
+        """
+        Get a copy of this NoteBatch with each excerpt sorted by onset, track,
+        pitch, dur, and then velocity, as in NoteArray.sort.
+
+        Returns
+        -------
+        batch : NoteBatch
+            A new NoteBatch containing each excerpt, sorted.
+        """
+        order = np.lexsort(
+            [self.notes.data[name] for name in reversed(NOTE_DF_SORT_ORDER)]
+            + [self.excerpt_index()]
+        )
+        return NoteBatch(NoteArray(self.notes.data[order]), self.offsets.copy())
+
+    def to_excerpts(self):
+        """
+        Split this NoteBatch into a list of excerpts.
+
+        Returns
+        -------
+        excerpts : list(NoteArray)
+            A view of each excerpt in the batch.
+        """
+        return [self[i] for i in range(len(self))]
+
+    def equals(self, other):
+        """
+        Check if this NoteBatch contains the same excerpts as another.
+
+        Parameters
+        ----------
+        other : NoteBatch
+            The NoteBatch to compare to.
+
+        Returns
+        -------
+        equal : boolean
+            True if the two NoteBatches are equal. False otherwise.
+        """
+        return (
+            isinstance(other, NoteBatch)
+            and np.array_equal(self.offsets, other.offsets)
+            and self.notes.equals(other.notes)
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """Get a view of the excerpt at the given index, as a NoteArray."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Excerpt index {index} out of range.")
+        return self.notes[self.offsets[index] : self.offsets[index + 1]]
+
+    def __repr__(self):
+        return f"NoteBatch({len(self)} excerpts, {len(self.notes)} notes)"
@@ -0,0 +1,242 @@
+"""A persistent cache of parsed and cleaned note_dfs, so that input files are
+only parsed once, rather than on every dataset build.
+
+Each entry is keyed by a hash of the input file's contents, the function which
+parsed it, and that function's keyword arguments (such as the cleaning
+options), so changed files and options are parsed again automatically. Entries
+are stored as uncompressed npz files of the note_df's columns, which load much
+faster than parsing MIDI. The cache is bounded in size: evict removes the
+least recently used entries once it is too large."""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from mdtk.downloaders import DEFAULT_CACHE_PATH
+
+DEFAULT_PARSE_CACHE_PATH = os.path.join(DEFAULT_CACHE_PATH, "parsed")
+
+# The default maximum size of a ParseCache, in bytes
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Included in every key. Change this if parsing changes, to invalidate all
+# existing entries.
+CACHE_VERSION = 1
+
+# The size of the chunks in which input files are read to be hashed
+HASH_CHUNK_SIZE = 1024 ** 2
+
+
+class ParseCache:
+    """A ParseCache stores the results of a parsing function such as
+    fileio.midi_to_df on disk, keyed by file contents. Its methods can be
+    used from many processes at once, and a ParseCache can be pickled (to be
+    sent to worker processes)."""
+
+    def __init__(self, cache_dir=DEFAULT_PARSE_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Create a new ParseCache.
+
+        Parameters
+        ----------
+        cache_dir : string
+            The directory to store entries in. It is created if needed.
+
+        max_bytes : int
+            The maximum total size of the entries, in bytes, which evict
+            reduces the cache to.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, path, load_func, load_kwargs):
+        """
+        Get the key of the entry for the given file and parsing function.
+
+        Parameters
+        ----------
+        path : string
+            The path of the input file.
+
+        load_func : function
+            The function which parses the file.
+
+        load_kwargs : dict
+            Keyword arguments for load_func. These must be json serializable.
+
+        Returns
+        -------
+        key : string
+            A hex digest of the file's contents, load_func, and load_kwargs.
+        """
+        digest = hashlib.sha256()
+        options = [
+            CACHE_VERSION,
+            f"{load_func.__module__}.{load_func.__qualname__}",
+            load_kwargs,
+        ]
+        digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        """
+        Get the path of the entry with the given key.
+
+        Parameters
+        ----------
+        key : string
+            The key of the entry.
+
+        Returns
+        -------
+        entry_path : string
+            The path of the entry's npz file (which may not exist).
+        """
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+
+    def load(self, path, load_func, **load_kwargs):
+        """
+        Load the note_df of the given file from the cache, or parse it (and
+        cache the result) if it is not cached.
+
+        Parameters
+        ----------
+        path : string
+            The path of the input file.
+
+        load_func : function
+            The function to parse the file with, such as fileio.midi_to_df. It
+            must return a DataFrame with a default index, or None.
+
+        load_kwargs
+            Keyword arguments for load_func, such as non_overlapping.
+
+        Returns
+        -------
+        df : pd.DataFrame
+            The result of load_func(path, **load_kwargs). Results of None are
+            not cached, so files which fail to parse are parsed every time.
+        """
+        key = self.key(path, load_func, load_kwargs)
+        entry_path = self.entry_path(key)
+
+        if os.path.exists(entry_path):
+            try:
+                with np.load(entry_path, allow_pickle=False) as entry:
+                    columns = entry["__columns__"].tolist()
+                    df = pd.DataFrame({name: entry[name] for name in columns})
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                logging.warning(f"Invalid parse cache entry {entry_path}. Reparsing.")
+            else:
+                # Mark the entry as recently used
+                try:
+                    os.utime(entry_path)
+                except OSError:  # Evicted by another process
+                    pass
+                return df
+
+        df = load_func(path, **load_kwargs)
+        if df is not None:
+            self.store(key, df)
+        return df
+
+    def store(self, key, df):
+        """
+        Store a note_df in the cache.
+
+        Parameters
+        ----------
+        key : string
+            The key of the entry.
+
+        df : pd.DataFrame
+            The note_df to store. Its columns are stored with their dtypes, but
+            its index is not.
+        """
+        entry_path = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        # Write to a temporary file first, so that other processes never read
+        # a partial entry
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.savez(
+                file,
+                __columns__=np.array(df.columns, dtype=str),
+                **{name: df[name].to_numpy() for name in df.columns},
+            )
+        os.replace(tmp_path, entry_path)
+
+    def size(self):
+        """
+        Get the total size of the entries in this cache.
+
+        Returns
+        -------
+        size : int
+            The total size of the entries, in bytes.
+        """
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        """
+        Get the path, last use time, and size of each entry in this cache.
+
+        Returns
+        -------
+        entries : list(tuple(string, float, int))
+            The path, modification time, and size (in bytes) of each entry.
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for subdir in os.scandir(self.cache_dir):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(".npz"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:  # Evicted by another process
+                        continue
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries from this cache until their
+        total size is at most max_bytes.
+
+        Returns
+        -------
+        num_evicted : int
+            The number of entries removed.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        size = sum(entry_size for _, _, entry_size in entries)
+        num_evicted = 0
+        for entry_path, _, entry_size in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:  # Evicted by another process
+                pass
+            size -= entry_size
+            num_evicted += 1
+        return num_evicted
+
+    def clear(self):
+        """
+        Remove every entry from this cache.
+        """
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
@@ -7,13 +7,48 @@ import tqdm
 from torch.utils.data import Dataset
 
 from mdtk.degradations import MAX_PITCH_DEFAULT, MIN_PITCH_DEFAULT
-from mdtk.formatters import FORMATTERS
+from mdtk.formatters import FORMATTERS, shard_corpus_lines
 
 
 def transform_to_torchtensor(output):
     return {key: torch.tensor(value) for key, value in output.items()}
 
 
+def is_shard_corpus(corpus_path):
+    """Check whether a corpus_path is an acme shard file, or a list of them."""
+    if isinstance(corpus_path, str):
+        return corpus_path.endswith(".npz")
+    return True
+
+
+def load_shard_corpus(shard_paths, formatter, in_memory=True):
+    """
+    Load the lines of a corpus directly from acme shard files.
+
+    Parameters
+    ----------
+    shard_paths : str or list(str)
+        The path of a shard file, or a list of them.
+
+    formatter : dict
+        The format to convert each excerpt to, from FORMATTERS.
+
+    in_memory : bool
+        Must be True, as shards can only be loaded into memory.
+
+    Returns
+    -------
+    lines : list(list(str))
+        The altered string, clean string, and degradation id of each excerpt.
+    """
+    assert in_memory, "Shard corpora can only be loaded in_memory."
+    if isinstance(shard_paths, str):
+        shard_paths = [shard_paths]
+    return list(
+        tqdm.tqdm(shard_corpus_lines(shard_paths, formatter), desc="Loading Dataset")
+    )
+
+
 # This is adapted from:
 # https://github.com/codertimo/BERT-pytorch/blob/master/bert_pytorch/dataset/dataset.py
 class CommandDataset(Dataset):
@@ -36,6 +71,10 @@ class CommandDataset(Dataset):
             Path to document containing the corpus of data. Each line is comma
             separated and contains the degraded command string, clean command
             string, then the degadation id label (0 is no degradation).
+            Alternatively, the path of an acme shard file (.npz), or a list of
+            them (such as those of one split, see fileio.acme_shard_paths), to
+            read the data directly from the shards of a dataset. Shards can only
+            be loaded in_memory.
 
         vocab : Vocab class
             A Vocab class object (see CommandVocab in formatters.py). This is
@@ -76,6 +115,11 @@ class CommandDataset(Dataset):
         self.transform = transform
         self.formatter = FORMATTERS["command"]
 
+        if is_shard_corpus(corpus_path):
+            self.lines = load_shard_corpus(corpus_path, self.formatter, in_memory)
+            self.corpus_lines = len(self.lines)
+            return
+
         with open(corpus_path, "r", encoding=encoding) as f:
             if self.corpus_lines is None and not in_memory:
                 for _ in tqdm.tqdm(f, desc="Counting nr corpus lines"):
@@ -189,6 +233,10 @@ class PianorollDataset(Dataset):
             Path to document containing the corpus of data. Each line is comma
             separated and contains the degraded command string, clean command
             string, then the degadation id label (0 is no degradation).
+            Alternatively, the path of an acme shard file (.npz), or a list of
+            them (such as those of one split, see fileio.acme_shard_paths), to
+            read the data directly from the shards of a dataset. Shards can only
+            be loaded in_memory.
 
         seq_len : int
             The maximum length for a piano-roll (all pianorolls will be 0-padded
@@ -231,6 +279,11 @@ class PianorollDataset(Dataset):
         self.transform = transform
         self.formatter = FORMATTERS["pianoroll"]
 
+        if is_shard_corpus(corpus_path):
+            self.lines = load_shard_corpus(corpus_path, self.formatter, in_memory)
+            self.corpus_lines = len(self.lines)
+            return
+
         with open(corpus_path, "r", encoding=encoding) as f:
             if self.corpus_lines is None and not in_memory:
                 for _ in tqdm.tqdm(f, desc="Counting nr corpus lines"):
@@ -0,0 +1,108 @@
+"""Random number generation utilities. Every function in mdtk which samples
+randomly takes an optional rng argument, which can be any np.random.Generator.
+If it is None, numpy's global random state (as seeded by np.random.seed) is used
+instead, exactly as in previous versions."""
+import hashlib
+
+import numpy as np
+
+
+class GlobalRandomState:
+    """A wrapper around numpy's global random state, with the same interface as
+    np.random.Generator for the methods used in mdtk. Each method calls the
+    corresponding legacy np.random function, so draws are unchanged."""
+
+    def integers(self, low, high=None, size=None):
+        return np.random.randint(low, high, size)
+
+    def random(self, size=None):
+        return np.random.random_sample(size)
+
+    def standard_exponential(self, size=None):
+        return np.random.standard_exponential(size)
+
+    def lognormal(self, mean=0.0, sigma=1.0, size=None):
+        return np.random.lognormal(mean, sigma, size)
+
+    def choice(self, a, size=None, replace=True, p=None):
+        return np.random.choice(a, size=size, replace=replace, p=p)
+
+    def permutation(self, x):
+        return np.random.permutation(x)
+
+    def shuffle(self, x):
+        np.random.shuffle(x)
+
+
+GLOBAL_RANDOM_STATE = GlobalRandomState()
+
+
+def get_rng(rng=None):
+    """
+    Get a random number generator from the given rng argument.
+
+    Parameters
+    ----------
+    rng : np.random.Generator or int
+        A Generator is returned as is, and an int is used as the seed of a new
+        Generator. None returns a wrapper of numpy's global random state.
+
+    Returns
+    -------
+    rng : np.random.Generator or GlobalRandomState
+        A random number generator.
+    """
+    if rng is None:
+        return GLOBAL_RANDOM_STATE
+    if isinstance(rng, (int, np.integer)):
+        return np.random.default_rng(rng)
+    return rng
+
+
+def _key_int(key):
+    """
+    Convert a key for derive_rng into a non-negative int.
+
+    Parameters
+    ----------
+    key : int or string
+        The key. Strings are hashed.
+
+    Returns
+    -------
+    key_int : int
+        The int version of the key.
+    """
+    if isinstance(key, str):
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "little")
+    assert key >= 0, "Integer rng keys must not be negative."
+    return int(key)
+
+
+def derive_rng(seed, *keys):
+    """
+    Get a random number generator for a single unit of work, such as degrading
+    one excerpt. The generator is a counter-based (Philox) generator keyed by
+    the given master seed and keys. It depends only on those values, so the
+    work is reproducible regardless of the order in which it is done, or how
+    many processes share it.
+
+    Parameters
+    ----------
+    seed : int
+        The master random seed.
+
+    keys : int or string
+        Values identifying the unit of work, for example the dataset and file
+        name of a piece. Ints must be non-negative.
+
+    Returns
+    -------
+    rng : np.random.Generator
+        A random number generator for the given seed and keys.
+    """
+    seed_sequence = np.random.SeedSequence(
+        seed, spawn_key=tuple(_key_int(key) for key in keys)
+    )
+    return np.random.Generator(np.random.Philox(seed_sequence))
@@ -0,0 +1,216 @@
+"""Generation of synthetic note data, for benchmarking and load testing without
+downloading any real datasets. Notes are generated with vectorised numpy code,
+so millions of notes can be generated in about a second, and every generator
+is seeded through its rng argument (see mdtk.rng)."""
+import os
+
+import numpy as np
+
+from mdtk import fileio
+from mdtk.note_array import MAX_NOTE_VALUE, NoteArray
+from mdtk.rng import derive_rng, get_rng
+
+FILE_FORMATS = ["csv", "mid"]
+
+
+def synthetic_notes(
+    num_notes,
+    polyphony=4,
+    min_pitch=21,
+    max_pitch=108,
+    num_tracks=1,
+    mean_duration=300,
+    duration_sigma=0.5,
+    min_duration=10,
+    overlap_rate=0.0,
+    min_velocity=20,
+    max_velocity=120,
+    rng=None,
+):
+    """
+    Generate a random excerpt.
+
+    Each note's track and pitch are drawn uniformly, and its duration from a
+    log-normal distribution. The notes of each (track, pitch) then follow one
+    another, separated by random gaps, in a timeline whose length gives the
+    requested average polyphony.
+
+    Parameters
+    ----------
+    num_notes : int
+        The number of notes to generate.
+
+    polyphony : float
+        The average number of notes sounding at any time. Unless overlap_rate
+        is positive, this must not be more than the number of (track, pitch)
+        pairs. The polyphony will be higher than this if some (track, pitch)
+        pair is given more notes than fit in the timeline.
+
+    min_pitch, max_pitch : int
+        The range of pitches to use, inclusive.
+
+    num_tracks : int
+        The number of tracks to use.
+
+    mean_duration : float
+        The mean note duration, in milliseconds.
+
+    duration_sigma : float
+        The standard deviation of the log of the note durations. 0 gives every
+        note the duration mean_duration.
+
+    min_duration : int
+        The minimum note duration, in milliseconds.
+
+    overlap_rate : float
+        The proportion of notes (other than the first note of each track and
+        pitch) which begin before the previous note of the same track and pitch
+        ends. 0 generates no overlapping notes, as in a cleaned note_df.
+
+    min_velocity, max_velocity : int
+        The range of velocities to use, inclusive.
+
+    rng : np.random.Generator
+        A random number generator. None to use numpy's global random state.
+
+    Returns
+    -------
+    notes : NoteArray
+        The generated notes, sorted.
+    """
+    assert num_notes >= 0, "num_notes must not be negative."
+    assert polyphony > 0, "polyphony must be positive."
+    assert min_pitch <= max_pitch, "min_pitch must not be greater than max_pitch."
+    assert num_tracks >= 1, "num_tracks must be at least 1."
+    assert 0 <= overlap_rate <= 1, "overlap_rate must be between 0 and 1."
+    num_lanes = num_tracks * (max_pitch - min_pitch + 1)
+    assert overlap_rate > 0 or polyphony <= num_lanes, (
+        "polyphony must not be greater than the number of (track, pitch) pairs "
+        "if overlap_rate is 0."
+    )
+    rng = get_rng(rng)
+    if num_notes == 0:
+        return NoteArray()
+
+    # Sort the notes by lane (track and pitch), as each lane is laid out in turn
+    lanes = np.sort(rng.integers(0, num_lanes, num_notes))
+    tracks, pitches = np.divmod(lanes, max_pitch - min_pitch + 1)
+    pitches += min_pitch
+    velocities = rng.integers(min_velocity, max_velocity + 1, num_notes)
+    mu = np.log(mean_duration) - duration_sigma ** 2 / 2
+    durs = rng.lognormal(mu, duration_sigma, num_notes)
+    durs = np.clip(np.rint(durs), min_duration, MAX_NOTE_VALUE // 4).astype(np.int64)
+
+    first = np.ones(num_notes, dtype=bool)
+    first[1:] = lanes[1:] != lanes[:-1]
+    lane_index = np.cumsum(first) - 1
+    prev_durs = np.concatenate(([0], durs[:-1]))
+
+    # The step from the previous note's onset to each note's onset, before gaps.
+    # Overlapping notes begin somewhere during the previous note.
+    overlapping = ~first & (rng.random(num_notes) < overlap_rate)
+    steps = prev_durs.astype(np.float64)
+    steps[overlapping] = np.floor(rng.random(overlapping.sum()) * steps[overlapping])
+    steps[first] = 0
+
+    # Spread each lane's free time randomly between its notes (and its end)
+    length = durs.sum() / polyphony
+    lane_ends = np.concatenate((first[1:], [True]))
+    used = np.bincount(lane_index, weights=steps) + durs[lane_ends]
+    free = np.maximum(length - used, 0)
+    weights = rng.standard_exponential(num_notes)
+    weights[overlapping] = 0
+    weight_sums = np.bincount(lane_index, weights=weights)
+    weight_sums += rng.standard_exponential(len(weight_sums))
+    gaps = np.floor(free[lane_index] * weights / weight_sums[lane_index])
+
+    # Onsets are a cumulative sum of steps and gaps within each lane
+    ends = np.cumsum(steps + gaps)
+    onsets = ends - (ends - (steps + gaps))[first][lane_index]
+    onsets = np.minimum(onsets, MAX_NOTE_VALUE // 2).astype(np.int64)
+
+    return NoteArray.from_columns(onsets, tracks, pitches, durs, velocities).sort()
+
+
+def synthetic_df(num_notes, rng=None, **kwargs):
+    """
+    Generate a random note_df.
+
+    Parameters
+    ----------
+    num_notes : int
+        The number of notes to generate.
+
+    rng : np.random.Generator
+        A random number generator. None to use numpy's global random state.
+
+    kwargs
+        Additional keyword arguments for synthetic_notes, such as polyphony.
+
+    Returns
+    -------
+    note_df : pd.DataFrame
+        The generated notes, sorted, with int64 columns onset, track, pitch,
+        dur, and velocity.
+    """
+    notes = synthetic_notes(num_notes, rng=rng, **kwargs)
+    return notes.to_df().astype("int64")
+
+
+def write_synthetic_files(
+    output_dir, num_files, num_notes, file_format="csv", seed=None, **kwargs
+):
+    """
+    Write random note data out to many files, for example to be used as a
+    local dataset by make_dataset.py.
+
+    Parameters
+    ----------
+    output_dir : string
+        The directory to write the files to. It is created if needed.
+
+    num_files : int
+        The number of files to write.
+
+    num_notes : int or tuple(int, int)
+        The number of notes in each file, or a range from which to draw the
+        number of notes in each file (low inclusive, high exclusive).
+
+    file_format : string
+        The format of the files: "csv" (see fileio.df_to_csv) or "mid" (see
+        fileio.df_to_midi).
+
+    seed : int
+        The random seed to use. Each file's notes depend only on this and its
+        index, so any subset of the files can be regenerated. None to use a
+        random seed.
+
+    kwargs
+        Additional keyword arguments for synthetic_notes, such as polyphony.
+
+    Returns
+    -------
+    paths : list(string)
+        The path of each written file.
+    """
+    assert file_format in FILE_FORMATS, f"file_format must be one of {FILE_FORMATS}."
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2 ** 32)
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = []
+    for index in range(num_files):
+        rng = derive_rng(seed, index)
+        if isinstance(num_notes, tuple):
+            file_num_notes = int(rng.integers(num_notes[0], num_notes[1]))
+        else:
+            file_num_notes = num_notes
+        df = synthetic_df(file_num_notes, rng=rng, **kwargs)
+
+        path = os.path.join(output_dir, f"synthetic_{index:06d}.{file_format}")
+        if file_format == "csv":
+            fileio.df_to_csv(df, path)
+        else:
+            fileio.df_to_midi(df, path)
+        paths.append(path)
+    return paths
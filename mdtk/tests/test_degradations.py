@@ -5,7 +5,13 @@ import pandas as pd
 import pytest
 
 import mdtk.degradations as deg
-from mdtk.degradations import MIN_PITCH_DEFAULT, TRIES_WARN_MSG
+from mdtk.degradations import (
+    MIN_PITCH_DEFAULT,
+    NO_FREE_EDIT_WARN_MSG,
+    TRIES_WARN_MSG,
+)
+from mdtk.df_utils import clean_df
+from mdtk.note_array import NoteArray, NoteBatch
 
 EMPTY_DF = pd.DataFrame(
     {"onset": [], "track": [], "pitch": [], "dur": [], "velocity": []}
@@ -110,6 +116,14 @@ def test_pre_process():
     with pytest.raises(ValueError):
         deg.pre_process(invalid_df)
 
+    # Already pre-processed dfs are copied
+    for df in [basic_res, unsorted_res]:
+        for sort in [False, True]:
+            res = deg.pre_process(df, sort=sort)
+            correct = deg.pre_process(df.set_index(df.index + 1), sort=sort)
+            assert res.equals(correct), "Canonical fast path gave a different result"
+            assert res is not df
+
 
 def test_post_process():
     basic_res = pd.DataFrame(
@@ -189,6 +203,66 @@ def test_overlaps():
     ), f"Overlaps incorrectly returned False for:\n{fixed_basic}."
 
 
+def test_note_array_input():
+    for name, func in deg.DEGRADATIONS.items():
+        for seed in range(5):
+            df_res = func(BASIC_DF, seed=seed)
+            notes = NoteArray.from_df(BASIC_DF)
+            prior = notes.copy()
+            notes_res = func(notes, seed=seed)
+
+            assert notes.equals(prior), f"{name} changed input NoteArray"
+            if df_res is None:
+                assert_none(notes_res, msg=f"{name} failed only on DataFrame input")
+                continue
+            assert isinstance(
+                notes_res, NoteArray
+            ), f"{name} did not return a NoteArray"
+            assert notes_res.to_df().astype(int).equals(df_res), (
+                f"{name} gave different results on NoteArray and DataFrame input:"
+                f"\n{notes_res}\n{df_res}"
+            )
+
+
+def test_rng():
+    notes = NoteArray.from_df(BASIC_DF)
+    for name, func in deg.DEGRADATIONS.items():
+        for seed in range(5):
+            np.random.seed(0)
+            res = func(notes, rng=np.random.default_rng(seed))
+            assert (
+                np.random.randint(2 ** 31) == np.random.RandomState(0).randint(2 ** 31)
+            ), f"{name} used global random state when given a Generator"
+
+            # Interleaving other draws does not change the result
+            func(notes, rng=np.random.default_rng(seed + 1))
+            func(notes, seed=seed)
+            res2 = func(notes, rng=np.random.default_rng(seed))
+            if res is None:
+                assert_none(res2, msg=f"{name} is not reproducible with rng")
+            else:
+                assert res.equals(res2), f"{name} is not reproducible with rng"
+
+    batch = NoteBatch.from_excerpts([notes] * 10)
+    res, _ = deg.remove_note_batch(batch, rng=np.random.default_rng(0))
+    res2, _ = deg.remove_note_batch(batch, rng=np.random.default_rng(0))
+    assert res.equals(res2)
+
+
+def test_unsorted_output():
+    notes = NoteArray.from_df(BASIC_DF)
+    for name, func in deg.DEGRADATIONS.items():
+        for seed in range(5):
+            res = func(notes, seed=seed)
+            unsorted_res = func(notes, seed=seed, sort=False)
+            if res is None:
+                assert_none(unsorted_res, msg=f"{name} failed only with sort=False")
+            else:
+                assert res.equals(
+                    unsorted_res.sort()
+                ), f"{name} gave different notes with sort=False"
+
+
 def test_unsorted(caplog):
     global BASIC_DF
     BASIC_DF = UNSORTED_DF
@@ -393,6 +467,139 @@ def test_tries(caplog):
     assert correct.equals(res[1])
 
 
+def assert_no_overlaps(df, msg=""):
+    for idx in range(len(df)):
+        assert not deg.overlaps(df, idx), f"{msg}\nNote {idx} overlaps in:\n{df}"
+
+
+def test_rejection_free(caplog):
+    # Cases from test_tries, which need retries but always succeed here
+    note_df = pd.DataFrame(
+        {
+            "onset": 0,
+            "track": 0,
+            "pitch": [1050, 1051],
+            "dur": 100,
+            "velocity": 100,
+        }
+    )
+    for seed in range(10):
+        res = deg.pitch_shift(
+            note_df,
+            min_pitch=1048,
+            max_pitch=1052,
+            distribution=[0, 0, 0, 0, 0.5, 0.5, 0],
+            tries=1,
+            rejection_free=True,
+            seed=seed,
+        )
+        assert 1052 in list(res["pitch"])
+        assert_no_overlaps(res, "Rejection-free pitch_shift overlaps.")
+
+    note_df = pd.DataFrame(
+        {
+            "onset": [0, 0, 10000, 10000],
+            "track": 0,
+            "pitch": [49, 50, 51, 50],
+            "dur": [10100, 100, 100, 100],
+            "velocity": 100,
+        }
+    )
+    correct = pd.DataFrame(
+        {
+            "onset": [0, 0, 0, 10000],
+            "track": 0,
+            "pitch": [49, 50, 51, 50],
+            "dur": [10100, 100, 10100, 100],
+            "velocity": 100,
+        }
+    )
+    for seed in range(10):
+        res = deg.onset_shift(
+            note_df,
+            min_shift=10000,
+            max_shift=10000,
+            min_duration=10000,
+            max_duration=10100,
+            align_onset=True,
+            align_dur=True,
+            tries=1,
+            rejection_free=True,
+            seed=seed,
+        )
+        assert correct.equals(res)
+
+    # No valid shift exists
+    note_df = pd.DataFrame(
+        {"onset": [0, 100], "track": 0, "pitch": 60, "dur": 100, "velocity": 100}
+    )
+    for func in [deg.time_shift, deg.offset_shift]:
+        res = func(note_df, min_shift=100, rejection_free=True)
+        assert_none(res, f"{func.__name__} found a shift with no room to shift.")
+        assert_warned(caplog, NO_FREE_EDIT_WARN_MSG)
+
+    res = deg.add_note(
+        note_df, min_pitch=60, max_pitch=60, min_duration=50, rejection_free=True
+    )
+    assert_none(res, "add_note found room for a note in a full excerpt.")
+    assert_warned(caplog, NO_FREE_EDIT_WARN_MSG)
+
+    # Crowded random excerpts
+    rng = np.random.RandomState(0)
+    for seed in range(20):
+        num_notes = 30
+        note_df = clean_df(
+            pd.DataFrame(
+                {
+                    "onset": rng.randint(0, 1000, num_notes),
+                    "track": rng.randint(0, 2, num_notes),
+                    "pitch": rng.randint(60, 63, num_notes),
+                    "dur": rng.randint(50, 200, num_notes),
+                    "velocity": 100,
+                }
+            ),
+            non_overlapping=True,
+        )
+        for name in ["pitch_shift", "time_shift", "onset_shift", "offset_shift"]:
+            kwargs = {"min_pitch": 60, "max_pitch": 62} if name == "pitch_shift" else {}
+            res = deg.DEGRADATIONS[name](
+                note_df, rejection_free=True, seed=seed, **kwargs
+            )
+            assert res is not None, f"Rejection-free {name} failed."
+            assert len(res) == len(note_df)
+            assert_no_overlaps(res, f"Rejection-free {name} overlaps.")
+
+        res = deg.add_note(
+            note_df,
+            min_pitch=60,
+            max_pitch=62,
+            align_time=seed % 2 == 0,
+            rejection_free=True,
+            seed=seed,
+        )
+        assert len(res) == len(note_df) + 1
+        assert_no_overlaps(res, "Rejection-free add_note overlaps.")
+
+    # Dense excerpt with room for only 1 note
+    notes = NoteArray.from_columns(
+        [0, 0, 0, 150], 0, [60, 61, 62, 61], [200, 100, 200, 50], 100
+    )
+    correct = NoteArray.from_columns(
+        [0, 0, 0, 100, 150], 0, [60, 61, 62, 61, 61], [200, 100, 200, 50, 50], 100
+    )
+    for seed in range(10):
+        res = deg.add_note(
+            notes,
+            min_pitch=60,
+            max_pitch=62,
+            min_duration=50,
+            tries=1,
+            rejection_free=True,
+            seed=seed,
+        )
+        assert res.equals(correct), "Rejection-free add_note added the wrong note."
+
+
 def test_pitch_shift(caplog):
     res = deg.pitch_shift(EMPTY_DF)
     assert_none(res, msg="Pitch shifting with empty data frame did not return None.")
@@ -1014,6 +1221,36 @@ def test_onset_shift(caplog):
     assert_warned(caplog, msg="No valid notes to onset shift. Returning None.")
 
 
+def test_onset_shift_align_large():
+    # Many notes and many distinct durations: too large for any method which
+    # checks every (note, duration) pair at once
+    rng = np.random.default_rng(0)
+    num_notes = 100000
+    notes = NoteArray.from_df(
+        pd.DataFrame(
+            {
+                "onset": np.arange(num_notes) * 10,
+                "track": np.arange(num_notes),
+                "pitch": rng.integers(21, 109, num_notes),
+                "dur": rng.integers(1, 5000, num_notes),
+                "velocity": 100,
+            }
+        )
+    )
+    for seed in range(3):
+        res = deg.onset_shift(
+            notes, align_onset=True, align_dur=True, seed=seed, sort=False
+        )
+        changed = np.flatnonzero(res.data != notes.data)
+        assert len(changed) == 1, "Onset shift changed other notes"
+        note = res.data[changed[0]]
+        assert note["onset"] in notes.onset, "Onset shift didn't align onset"
+        assert note["dur"] in notes.dur, "Onset shift didn't align duration"
+        assert (
+            note["onset"] + note["dur"] == notes.offset[changed[0]]
+        ), "Onset shift changed offset"
+
+
 def test_offset_shift(caplog):
     def check_offset_shift_result(
         df, res, min_shift, max_shift, min_duration, max_duration
@@ -1286,6 +1523,87 @@ def test_remove_note(caplog):
         ), "Remove note did not remove exactly 1 note."
 
 
+def test_remove_note_batch():
+    excerpts = [BASIC_DF, EMPTY_DF, BASIC_DF.iloc[:1]]
+    batch = NoteBatch.from_excerpts(excerpts)
+    prior = NoteBatch(batch.notes.copy(), batch.offsets)
+
+    for seed in range(10):
+        res, success = deg.remove_note_batch(batch, seed=seed)
+        assert batch.equals(prior), "Remove note batch changed its input."
+        assert list(success) == [True, False, True]
+        assert list(res.lengths) == [len(BASIC_DF) - 1, 0, 0]
+
+        merged = pd.merge(BASIC_DF, res[0].to_df().astype(int))
+        assert (
+            merged.shape[0] == BASIC_DF.shape[0] - 1
+        ), "Remove note batch did not remove exactly 1 note."
+        assert res[0].equals(res[0].sort()), "Remove note batch unsorted result."
+
+
+def test_batch_degradations():
+    excerpts = [
+        NoteArray.from_df(BASIC_DF),
+        NoteArray(),
+        NoteArray.from_df(BASIC_DF.iloc[:1]),
+        NoteArray.from_columns([0, 100], 0, 60, 100, 100),
+    ]
+    batch = NoteBatch.from_excerpts(excerpts)
+    prior = NoteBatch(batch.notes.copy(), batch.offsets)
+    degradation_kwargs = {
+        "pitch_shift": {"min_pitch": 58, "max_pitch": 62},
+        "time_shift": {"min_shift": 1, "max_shift": 3},
+        "onset_shift": {"min_shift": 1, "max_shift": 3, "min_duration": 5},
+        "offset_shift": {"min_shift": 1, "max_shift": 3, "min_duration": 5},
+    }
+
+    for name, kwargs in degradation_kwargs.items():
+        deg_fun = deg.DEGRADATIONS[name]
+        batch_fun = deg.BATCH_DEGRADATIONS[name]
+
+        # Every possible per-excerpt result
+        outcomes = [set() for _ in excerpts]
+        for seed in range(300):
+            for excerpt, excerpt_outcomes in zip(excerpts, outcomes):
+                res = deg_fun(excerpt, seed=seed, **kwargs)
+                if res is not None:
+                    excerpt_outcomes.add(res.data.tobytes())
+        possible = np.array([len(o) > 0 for o in outcomes])
+
+        for seed in range(50):
+            res, success = batch_fun(batch, seed=seed, **kwargs)
+            assert batch.equals(prior), f"{name} batch changed its input."
+            assert list(success) == list(
+                possible
+            ), f"{name} batch success differs from {name}."
+            for excerpt, excerpt_outcomes in zip(
+                res.take(np.flatnonzero(success)).to_excerpts(),
+                np.array(outcomes)[success],
+            ):
+                assert (
+                    excerpt.data.tobytes() in excerpt_outcomes
+                ), f"{name} batch result not possible from {name}."
+
+        res, success = batch_fun(batch, seed=0, **kwargs)
+        res2, success2 = batch_fun(batch, seed=0, **kwargs)
+        assert res.equals(res2) and list(success) == list(success2)
+
+    # Options without a vectorized version are degraded one excerpt at a time
+    for name, kwargs in [
+        ("pitch_shift", {"align_pitch": True}),
+        ("time_shift", {"align_onset": True}),
+        ("onset_shift", {"align_dur": True}),
+        ("offset_shift", {"rejection_free": True}),
+    ]:
+        res, success = deg.BATCH_DEGRADATIONS[name](
+            batch, rng=np.random.default_rng(0), **kwargs
+        )
+        res2, success2 = deg.degrade_each(
+            deg.DEGRADATIONS[name], batch, rng=np.random.default_rng(0), **kwargs
+        )
+        assert res.equals(res2) and list(success) == list(success2)
+
+
 def test_add_note(caplog):
     assert (
         deg.add_note(EMPTY_DF) is not None
@@ -1899,3 +2217,100 @@ def test_join_notes(caplog):
             msg="Joining notes with too large of a gap didn't return None.",
         )
         assert_warned(caplog, msg="No valid notes to join. Returning None.")
+
+
+def test_check_feasible():
+    names = list(deg.DEGRADATIONS)
+    rng = np.random.default_rng(0)
+    excerpts = [EMPTY_DF, BASIC_DF]
+    for _ in range(30):
+        num_notes = rng.integers(0, 6)
+        excerpts.append(
+            NoteArray.from_columns(
+                rng.integers(0, 500, num_notes),
+                rng.integers(0, 2, num_notes),
+                rng.integers(60, 63, num_notes),
+                rng.integers(1, 200, num_notes),
+                100,
+            ).sort()
+        )
+    batch = NoteBatch.from_excerpts(excerpts)
+
+    short_kwargs = {"split_note": {"min_duration": 80}, "join_notes": {"max_gap": 0}}
+    for kwargs in [{}, short_kwargs]:
+        feasible = deg.check_feasible(batch, names, kwargs)
+        assert feasible.shape == (len(excerpts), len(names))
+        assert list(feasible[0]) == [name == "add_note" for name in names]
+
+        for excerpt, excerpt_feasible in zip(batch.to_excerpts(), feasible):
+            for name, is_feasible in zip(names, excerpt_feasible):
+                if name not in deg.FEASIBILITY_CHECKS:
+                    continue
+                res = deg.DEGRADATIONS[name](excerpt, **kwargs.get(name, {}))
+                if not is_feasible:
+                    assert res is None, f"{name} succeeded when infeasible."
+                elif name in ["split_note", "join_notes"]:
+                    # These checks are exact
+                    assert res is not None, f"{name} failed when feasible."
+
+
+def test_distribution_cache():
+    values = np.arange(5, 10)
+    p = np.array([0.1, 0.2, 0.3, 0.15, 0.25])
+    cdf = deg._cdf(p)
+    for seed in range(20):
+        chosen = np.random.default_rng(seed).choice(values, p=p)
+        sampled = deg._sample_table(values, cdf, np.random.default_rng(seed))
+        assert chosen == sampled, "Inverse-CDF sample differs from rng.choice."
+
+    distribution = [0.5, 1, 0, 1, 0.5]
+    deg._pitch_shift_table.cache_clear()
+    for seed in range(10):
+        deg.pitch_shift(BASIC_DF, distribution=distribution, seed=seed)
+    info = deg._pitch_shift_table.cache_info()
+    assert info.currsize <= len(BASIC_DF["pitch"].unique())
+    assert info.hits >= 10 - info.currsize
+
+    targets, p, cdf = deg._pitch_shift_table(
+        60, 0, 127, deg._distribution_key([0.5, 1, 0, 1, 0.5]), None
+    )
+    assert list(targets) == [58, 59, 61, 62]
+    assert np.allclose(p, [1 / 6, 1 / 3, 1 / 3, 1 / 6])
+    assert not targets.flags.writeable and not cdf.flags.writeable
+
+    deg._add_note_table.cache_clear()
+    for seed in range(10):
+        deg.add_note(BASIC_DF, pitch_distribution=np.ones(128), seed=seed)
+    assert deg._add_note_table.cache_info().currsize == 1
+
+
+def test_split_range_sample():
+    split_range = [(0, 10), (20, 25), (30, 30)]
+    for seed in range(20):
+        sample = deg.split_range_sample(split_range, rng=seed)
+        assert 0 <= sample < 10 or 20 <= sample < 25
+
+        lows, highs = np.array([[0, 20, 30]]), np.array([[10, 25, 30]])
+        batch_sample = deg.split_range_sample_batch(lows, highs, rng=seed)
+        assert list(batch_sample) == [sample]
+
+        sample = deg.split_range_sample(split_range, p=np.array([0, 1, 0]), rng=seed)
+        assert 20 <= sample < 25
+
+    # Many ragged split ranges at once, padded with empty ranges
+    lows = np.array([[0, 100, 0], [50, 0, 0], [-10, 10, 1000]])
+    highs = np.array([[10, 150, 0], [60, 0, 0], [-5, 20, 1001]])
+    samples = deg.split_range_sample_batch(
+        np.repeat(lows, 1000, axis=0), np.repeat(highs, 1000, axis=0), rng=0
+    ).reshape(3, 1000)
+    in_range = (samples[..., None] >= lows[:, None]) & (
+        samples[..., None] < highs[:, None]
+    )
+    assert np.all(np.sum(in_range, axis=2) == 1)
+    assert 800 < np.sum(samples[0] >= 100) < 870, "Ranges not sampled by size."
+    assert set(np.unique(samples[1])) == set(range(50, 60))
+    assert 0 < np.sum(samples[2] == 1000) < 150
+
+    p = np.array([[1, 0, 0], [0, 1, 0], [0, 1, 1]])
+    samples = deg.split_range_sample_batch(lows[[0, 2, 2]], highs[[0, 2, 2]], p=p)
+    assert samples[0] < 10 and 10 <= samples[1] < 20 and samples[2] >= 10
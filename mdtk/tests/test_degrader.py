@@ -0,0 +1,212 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mdtk.degrader import DegradationPipeline, Degrader
+from mdtk.note_array import NoteArray, NoteBatch
+
+NOTE_DF = pd.DataFrame(
+    {
+        "onset": [0, 100, 200, 200, 400],
+        "track": [0, 1, 0, 1, 0],
+        "pitch": [10, 20, 30, 40, 50],
+        "dur": [100, 100, 100, 100, 100],
+        "velocity": [1, 2, 3, 4, 5],
+    }
+)
+
+
+def test_degrade():
+    degrader = Degrader(seed=0, clean_prop=0)
+    for _ in range(10):
+        degraded, label = degrader.degrade(NOTE_DF)
+        assert isinstance(degraded, pd.DataFrame)
+        assert label > 0
+        assert not degraded.equals(NOTE_DF)
+
+    notes = NoteArray.from_df(NOTE_DF)
+    degraded, label = degrader.degrade(notes)
+    assert isinstance(degraded, NoteArray)
+    assert not degraded.equals(notes)
+
+
+def test_degrade_batch():
+    excerpts = [NOTE_DF, NOTE_DF.iloc[:0], NOTE_DF.iloc[:1]] * 20
+    batch = NoteBatch.from_excerpts(excerpts)
+
+    degrader = Degrader(seed=0, clean_prop=0.2)
+    degraded, labels = degrader.degrade_batch(batch)
+    assert len(degraded) == len(batch)
+    assert labels.shape == (len(batch),)
+    assert np.any(labels > 0)
+
+    for label, excerpt, result in zip(labels, batch.to_excerpts(), degraded):
+        if label == 0:
+            assert result.equals(excerpt)
+            continue
+        name = degrader.degradations[label - 1]
+        assert not result.equals(excerpt), f"{name} did not change excerpt."
+        assert result.equals(result.sort()), f"{name} gave unsorted result."
+        if name == "remove_note":
+            assert len(result) == len(excerpt) - 1
+        elif name == "add_note":
+            assert len(result) == len(excerpt) + 1
+
+    # Lists are converted, and failures are counted
+    degrader = Degrader(
+        seed=0,
+        degradations=["remove_note", "join_notes"],
+        degradation_dist=[0, 1],
+        clean_prop=0,
+    )
+    degraded, labels = degrader.degrade_batch(excerpts[:3])
+    assert list(labels) == [0, 0, 0]
+    assert list(degrader.failed) == [0, 3]
+
+    # Owed degradations are performed first
+    degrader.degradation_dist = np.array([1, 1])
+    degrader.failed = np.array([3.0, 0.0])
+    degraded, labels = degrader.degrade_batch(excerpts[:1] * 3)
+    assert list(labels) == [1, 1, 1]
+    assert list(degrader.failed) == [0, 0]
+    for result in degraded:
+        assert len(result) == len(NOTE_DF) - 1
+
+
+def test_rng():
+    excerpts = [NOTE_DF, NOTE_DF.iloc[:1]] * 10
+
+    np.random.seed(0)
+    state = np.random.randint(2 ** 31)
+    results = []
+    for _ in range(2):
+        np.random.seed(0)
+        degrader = Degrader(seed=0, clean_prop=0.2)
+        results.append([degrader.degrade(excerpt) for excerpt in excerpts])
+        results.append(degrader.degrade_batch(excerpts))
+        assert np.random.randint(2 ** 31) == state, "Degrader used global state"
+
+    for (df, label), (df2, label2) in zip(results[0], results[2]):
+        assert label == label2 and df.equals(df2)
+    assert results[1][0].equals(results[3][0])
+    assert list(results[1][1]) == list(results[3][1])
+
+    # A given rng overrides the degrader's own
+    degrader = Degrader(seed=0, clean_prop=0)
+    other = Degrader(seed=1, clean_prop=0)
+    degraded, label = degrader.degrade(NOTE_DF, rng=np.random.default_rng(5))
+    degraded2, label2 = other.degrade(NOTE_DF, rng=np.random.default_rng(5))
+    assert label == label2 and degraded.equals(degraded2)
+
+
+def test_pipeline():
+    pipeline = DegradationPipeline(seed=0)
+    for _ in range(10):
+        degraded, labels = pipeline.degrade(NOTE_DF)
+        assert isinstance(degraded, pd.DataFrame)
+        assert 1 <= len(labels) <= 3
+        assert all(0 < label <= len(pipeline.degradations) for label in labels)
+        assert degraded.equals(degraded.sort_values(list(NOTE_DF.columns)))
+
+    notes = NoteArray.from_df(NOTE_DF)
+    pipeline = DegradationPipeline(
+        seed=0,
+        degradations=["remove_note", "add_note"],
+        degradation_dist=[1, 0],
+        min_degradations=2,
+        max_degradations=2,
+    )
+    degraded, labels = pipeline.degrade(notes)
+    assert isinstance(degraded, NoteArray)
+    assert labels == [1, 1]
+    assert len(degraded) == len(notes) - 2
+
+    # Steps stop once every degradation fails
+    pipeline.max_degradations = 10
+    pipeline.min_degradations = 10
+    degraded, labels = pipeline.degrade(notes)
+    assert labels == [1] * len(notes)
+    assert len(degraded) == 0
+
+    # Keyword arguments are passed through
+    pipeline = DegradationPipeline(
+        seed=0,
+        degradations=["add_note"],
+        degradation_dist=[1],
+        min_degradations=3,
+        max_degradations=3,
+        degradation_kwargs={"add_note": {"min_pitch": 100, "max_pitch": 100}},
+    )
+    degraded, labels = pipeline.degrade(notes)
+    assert labels == [1, 1, 1]
+    assert list(degraded.pitch).count(100) == 3
+    assert degraded.equals(degraded.sort())
+
+    # The input is not changed
+    prior = notes.copy()
+    pipeline = DegradationPipeline(seed=0, min_degradations=3, max_degradations=3)
+    for _ in range(10):
+        pipeline.degrade(notes)
+    assert notes.equals(prior)
+
+    # Logging is restored even if a degradation raises
+    pipeline = DegradationPipeline(
+        seed=0,
+        degradations=["pitch_shift"],
+        degradation_dist=[1],
+        degradation_kwargs={"pitch_shift": {"no_such_arg": 1}},
+    )
+    with pytest.raises(TypeError):
+        pipeline.degrade(notes)
+    assert logging.root.manager.disable == logging.NOTSET
+
+
+def test_infeasible():
+    # Only add_note can succeed on an empty excerpt
+    empty = NoteArray()
+    degrader = Degrader(seed=0, clean_prop=0)
+    for _ in range(10):
+        degraded, label = degrader.degrade(empty)
+        assert label == degrader.degradations.index("add_note") + 1
+        assert len(degraded) == 1
+
+    # No degradation can succeed, so all are counted as failures
+    degrader = Degrader(
+        seed=0,
+        degradations=["split_note", "join_notes"],
+        degradation_dist=[1, 1],
+        clean_prop=0,
+    )
+    for _ in range(5):
+        degraded, label = degrader.degrade(empty)
+        assert label == 0 and len(degraded) == 0
+    assert degrader.failed.sum() >= 5
+
+    batch = NoteBatch.from_excerpts([empty, NOTE_DF, empty])
+    degraded, labels = degrader.degrade_batch(batch)
+    assert labels[0] == 0 and labels[2] == 0
+    assert degraded[0].equals(empty) and degraded[2].equals(empty)
+
+
+def test_degradation_kwargs():
+    # No note of NOTE_DF is long enough to split with a large min_duration
+    degrader = Degrader(
+        seed=0,
+        degradations=["split_note"],
+        degradation_dist=[1],
+        clean_prop=0,
+        degradation_kwargs={"split_note": {"min_duration": 60}},
+    )
+    degraded, label = degrader.degrade(NOTE_DF)
+    assert label == 0 and degraded.equals(NOTE_DF)
+    assert degrader.failed[0] == 1
+
+    degrader.degradation_kwargs = {"split_note": {"min_duration": 50}}
+    degraded, label = degrader.degrade(NOTE_DF)
+    assert label == 1 and len(degraded) == len(NOTE_DF) + 1
+    assert degrader.failed[0] == 0
+
+    degraded, labels = degrader.degrade_batch(NoteBatch.from_excerpts([NOTE_DF]))
+    assert list(labels) == [1] and len(degraded[0]) == len(NOTE_DF) + 1
@@ -1,8 +1,16 @@
 import itertools
 
+import numpy as np
 import pandas as pd
 
-from mdtk.df_utils import clean_df, get_random_excerpt, remove_pitch_overlaps
+from mdtk.df_utils import (
+    clean_df,
+    get_excerpt_starts,
+    get_random_excerpt,
+    get_random_excerpts,
+    is_sorted,
+    remove_pitch_overlaps,
+)
 
 CLEAN_INPUT_DF = pd.DataFrame(
     {
@@ -189,3 +197,120 @@ def test_get_random_excerpt():
         is None
     ), "Did not return None with excerpt_length too short"
     assert prior.equals(note_df), "get_random_excerpt changed input df"
+
+    # Reproducible with a Generator
+    excerpts = [
+        get_random_excerpt(
+            note_df, min_notes=10, excerpt_length=1000, rng=np.random.default_rng(0)
+        )
+        for _ in range(2)
+    ]
+    assert excerpts[0].equals(excerpts[1])
+
+
+def test_get_excerpt_starts():
+    onsets = np.array([0, 0, 100, 200, 200, 200, 1000])
+    starts, ends = get_excerpt_starts(onsets, min_notes=1, excerpt_length=100)
+    assert list(starts) == [0, 2, 3, 6]
+    assert list(ends) == [3, 6, 6, 7]
+
+    starts, ends = get_excerpt_starts(onsets, min_notes=4, excerpt_length=100)
+    assert list(starts) == [2]
+    assert list(ends) == [6]
+
+    starts, ends = get_excerpt_starts(onsets, min_notes=8, excerpt_length=10000)
+    assert len(starts) == len(ends) == 0
+    assert len(get_excerpt_starts(np.zeros(0, dtype=int))[0]) == 0
+
+
+def test_get_random_excerpts():
+    NUM_NOTES = 50
+    NOTE_DURATION = 50
+    note_df = pd.DataFrame(
+        {
+            "onset": [NOTE_DURATION * i for i in range(NUM_NOTES)],
+            "track": 0,
+            "pitch": list(range(NUM_NOTES)),
+            "dur": NOTE_DURATION,
+        }
+    )
+    # Shuffled rows are excerpted in the same order
+    shuffled_df = note_df.sample(frac=1, random_state=0)
+    prior = shuffled_df.copy()
+
+    for overlapping in [False, True]:
+        excerpts = get_random_excerpts(
+            shuffled_df,
+            num_excerpts=3,
+            min_notes=5,
+            excerpt_length=NOTE_DURATION * 9,
+            first_onset_range=(500, 600),
+            overlapping=overlapping,
+            rng=np.random.default_rng(0),
+        )
+        assert prior.equals(shuffled_df), "get_random_excerpts changed input df"
+        assert len(excerpts) == 3
+        first_pitches = []
+        for excerpt in excerpts:
+            assert 5 <= len(excerpt) <= 10
+            assert list(excerpt.index) == list(range(len(excerpt)))
+            assert 500 <= excerpt.onset.min() < 600
+            expected = shuffled_df.loc[shuffled_df.pitch.isin(excerpt.pitch)]
+            assert list(excerpt.pitch) == list(expected.pitch)
+            assert all(
+                excerpt.onset - excerpt.onset.min()
+                == NOTE_DURATION * (excerpt.pitch - excerpt.pitch.min())
+            )
+            first_pitches.append(excerpt.pitch.min())
+        assert len(set(first_pitches)) == 3
+        if not overlapping:
+            first_pitches.sort()
+            assert all(np.diff(first_pitches) >= 10)
+
+    # Non-overlapping excerpts run out
+    excerpts = get_random_excerpts(
+        note_df, num_excerpts=10, min_notes=10, excerpt_length=NOTE_DURATION * 9
+    )
+    assert 3 <= len(excerpts) <= 5
+    pitches = np.concatenate([excerpt.pitch for excerpt in excerpts])
+    assert len(set(pitches)) == len(pitches) == 10 * len(excerpts)
+    excerpts = get_random_excerpts(
+        note_df,
+        num_excerpts=100,
+        min_notes=10,
+        excerpt_length=NOTE_DURATION * 9,
+        overlapping=True,
+    )
+    assert len(excerpts) == NUM_NOTES - 9
+
+    # No valid excerpts
+    assert get_random_excerpts(note_df, min_notes=NUM_NOTES + 1) == []
+    assert get_random_excerpts(note_df, num_excerpts=0) == []
+
+    # Reproducible with a Generator
+    excerpts = [
+        get_random_excerpts(note_df, num_excerpts=3, rng=np.random.default_rng(0))
+        for _ in range(2)
+    ]
+    assert all(ex1.equals(ex2) for ex1, ex2 in zip(*excerpts))
+
+
+def test_is_sorted():
+    note_df = pd.DataFrame(
+        {
+            "onset": [0, 0, 100, 100, 100],
+            "track": [0, 1, 0, 0, 0],
+            "pitch": [10, 5, 20, 20, 20],
+            "dur": [100, 100, 50, 50, 60],
+            "velocity": [1, 1, 1, 2, 1],
+        }
+    )
+    assert is_sorted(note_df)
+    assert is_sorted(note_df.iloc[:0]) and is_sorted(note_df.iloc[:1])
+    for _ in range(20):
+        shuffled = note_df.sample(frac=1)
+        assert is_sorted(shuffled) == shuffled.index.equals(note_df.index)
+
+    # Ties are broken by later columns
+    assert not is_sorted(note_df.assign(velocity=[1, 1, 2, 1, 1]))
+    assert not is_sorted(note_df.assign(track=[1, 0, 0, 0, 0]))
@@ -0,0 +1,82 @@
+import numpy as np
+
+import mdtk.degradations as deg
+from mdtk.edits import ADD, CHANGE, REMOVE, NoteEdit
+from mdtk.formatters import df_to_pianoroll_str
+from mdtk.note_array import NoteArray
+
+NOTES = NoteArray.from_columns(
+    [200, 0, 100, 0], [0, 1, 0, 0], [30, 20, 10, 10], [100, 50, 100, 100], 100
+)
+
+
+def pianoroll_changed_frames(clean, degraded):
+    clean_frames = df_to_pianoroll_str(clean.to_df().astype(int)).split("/")
+    degraded_frames = df_to_pianoroll_str(degraded.to_df().astype(int)).split("/")
+    length = max(len(clean_frames), len(degraded_frames))
+    clean_frames += [""] * (length - len(clean_frames))
+    degraded_frames += [""] * (length - len(degraded_frames))
+    return np.array([int(c != d) for c, d in zip(clean_frames, degraded_frames)])
+
+
+def test_apply():
+    edit = NoteEdit.concatenate(
+        [
+            NoteEdit.change(NOTES, 0, pitch=40, dur=50),
+            NoteEdit.remove(NOTES, [1]),
+            NoteEdit.add(NoteArray.from_columns(50, 0, 50, 10, 100)),
+        ]
+    )
+    assert len(edit) == 3
+    assert list(edit.data["op"]) == [CHANGE, REMOVE, ADD]
+    assert list(edit.edited_indices()) == [0, 1]
+    assert edit.data["old"][0]["pitch"] == 30
+
+    prior = NOTES.copy()
+    degraded = edit.apply(NOTES, sort=False)
+    assert NOTES.equals(prior)
+    assert list(degraded.pitch) == [40, 10, 10, 50]
+    assert list(degraded.dur) == [50, 100, 100, 10]
+    assert list(edit.changed_notes(NOTES, sort=False)) == [True, False, False, True]
+
+    degraded = edit.apply(NOTES)
+    assert degraded.equals(degraded.sort())
+    assert list(degraded.onset) == [0, 50, 100, 200]
+    assert list(edit.changed_notes(NOTES)) == [False, True, False, True]
+
+    assert NoteEdit().apply(NOTES).equals(NOTES.sort())
+
+    # In place, changes are written into the given data
+    notes = NOTES.copy()
+    change = NoteEdit.change(notes, 0, pitch=40, dur=50)
+    degraded = change.apply_in_place(notes)
+    assert degraded.data is notes.data
+    assert degraded.equals(change.apply(NOTES, sort=False))
+    notes = NOTES.copy()
+    degraded = edit.apply_in_place(notes)
+    assert degraded.equals(edit.apply(NOTES, sort=False))
+
+
+def test_changed_frames():
+    # Lengthening a note only changes the frames it is extended into
+    edit = NoteEdit.change(NOTES, 1, dur=130)
+    assert list(edit.changed_frames(NOTES)) == [0, 1, 1]
+    assert list(edit.changed_frames(NOTES, num_frames=6)) == [0, 1, 1, 0, 0, 0]
+    assert list(edit.changed_frames(NOTES, num_frames=2)) == [0, 1]
+
+    for name, func in deg.DEGRADATIONS.items():
+        for seed in range(5):
+            edit = func(NOTES, seed=seed, return_edit=True)
+            degraded = func(NOTES, seed=seed)
+            if edit is None:
+                assert degraded is None, f"{name} edit failed inconsistently"
+                continue
+            assert isinstance(edit, NoteEdit)
+            if name != "remove_note":
+                assert edit.apply(NOTES).equals(degraded), f"{name} edit is wrong"
+
+            correct = pianoroll_changed_frames(NOTES, degraded)
+            changed_frames = edit.changed_frames(NOTES, num_frames=len(correct))
+            assert np.array_equal(
+                changed_frames, correct
+            ), f"{name} changed_frames are wrong"
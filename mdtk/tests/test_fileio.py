@@ -2,11 +2,15 @@ import itertools
 import os
 import shutil
 
+import numpy as np
 import pandas as pd
 import pretty_midi
 
 import mdtk.fileio as fileio
 from mdtk.df_utils import NOTE_DF_SORT_ORDER, clean_df
+from mdtk.formatters import FORMATTERS, shard_corpus_lines
+from mdtk.note_array import NoteBatch
+from mdtk.synth import synthetic_df
 from mdtk.tests.test_df_utils import CLEAN_INPUT_DF, CLEAN_RES_DFS
 
 USER_HOME = os.path.expanduser("~")
@@ -537,3 +541,59 @@ def test_csv_to_midi():
             os.remove(filename)
         except Exception:
             pass
+
+
+def test_acme_shards():
+    acme_dir = os.path.join(TEST_CACHE_PATH, "acme_shards")
+    if os.path.exists(acme_dir):
+        shutil.rmtree(acme_dir)
+
+    rng = np.random.default_rng(0)
+    clean = [synthetic_df(num_notes, rng=rng) for num_notes in [10, 1, 25]]
+    altered = [clean[0], clean[1], synthetic_df(20, rng=rng)]
+    labels = {
+        "degraded": [0, 0, 1],
+        "degradation_id": [0, 0, 3],
+        "clean_csv_path": [os.path.join("clean", "ds", f"{i}.csv") for i in range(3)],
+        "altered_csv_path": [
+            os.path.join("clean", "ds", "0.csv"),
+            os.path.join("clean", "ds", "1.csv"),
+            os.path.join("altered", "ds", "2.csv"),
+        ],
+    }
+    for split in ["train", "valid"]:
+        fileio.write_acme_shard(
+            os.path.join(acme_dir, fileio.SHARD_DIR, f"{split}-00000.npz"),
+            NoteBatch.from_excerpts(clean),
+            NoteBatch.from_excerpts(altered),
+            labels,
+        )
+    shard_paths = fileio.acme_shard_paths(acme_dir)
+    assert [os.path.basename(path) for path in shard_paths] == [
+        "train-00000.npz",
+        "valid-00000.npz",
+    ]
+    assert fileio.acme_shard_paths(acme_dir, "valid") == shard_paths[1:]
+    assert fileio.acme_shard_paths(acme_dir, "test") == []
+
+    shard = fileio.read_acme_shard(shard_paths[0])
+    assert len(shard["clean"]) == len(shard["altered"]) == 3
+    for index in range(3):
+        assert shard["clean"][index].to_df().astype("int64").equals(clean[index])
+        assert shard["altered"][index].to_df().astype("int64").equals(altered[index])
+    for label, values in labels.items():
+        assert list(shard[label]) == values
+
+    # Export to the csv layout. Altered csvs are only written if degraded.
+    fileio.acme_shards_to_csvs(acme_dir)
+    for index in range(3):
+        df = fileio.csv_to_df(os.path.join(acme_dir, labels["clean_csv_path"][index]))
+        assert len(df) == len(clean[index])
+    assert os.listdir(os.path.join(acme_dir, "altered", "ds")) == ["2.csv"]
+    df = fileio.csv_to_df(os.path.join(acme_dir, labels["altered_csv_path"][2]))
+    assert df.equals(altered[2])
+
+    lines = list(shard_corpus_lines(shard_paths, FORMATTERS["command"]))
+    df_to_str = FORMATTERS["command"]["df_to_str"]
+    assert len(lines) == 6
+    assert lines[2] == [df_to_str(altered[2]), df_to_str(clean[2]), "3"]
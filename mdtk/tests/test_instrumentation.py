@@ -0,0 +1,98 @@
+import json
+
+import pandas as pd
+
+import mdtk.degradations as deg
+import mdtk.instrumentation as instrumentation
+from mdtk.degrader import Degrader
+from mdtk.note_array import NoteArray
+
+NOTE_DF = pd.DataFrame(
+    {
+        "onset": [0, 100, 200, 200, 400],
+        "track": [0, 1, 0, 1, 0],
+        "pitch": [10, 20, 30, 40, 50],
+        "dur": [100, 100, 100, 100, 100],
+        "velocity": [1, 2, 3, 4, 5],
+    }
+)
+
+
+def test_record():
+    assert instrumentation.get_stats() is None
+    deg.pitch_shift(NOTE_DF, seed=0)
+
+    stats = instrumentation.enable()
+    try:
+        assert instrumentation.get_stats() is stats
+        for seed in range(3):
+            assert deg.pitch_shift(NOTE_DF, seed=seed) is not None
+        assert deg.split_note(NoteArray()) is None
+        assert deg.join_notes(NOTE_DF) is None
+        assert deg.pitch_shift(NOTE_DF, distribution=[0, 1, 0]) is None
+
+        # Only 1 valid (but overlapping) shift exists
+        full = NoteArray.from_columns(0, 0, [60, 61], 100, 100)
+        res = deg.pitch_shift(full, min_pitch=60, max_pitch=61, tries=4)
+        assert res is None
+    finally:
+        assert instrumentation.disable() is stats
+    deg.pitch_shift(NOTE_DF, seed=0)
+
+    pitch_shift = stats.degradations["pitch_shift"]
+    assert pitch_shift["calls"] == 5
+    assert pitch_shift["successes"] == 3
+    assert pitch_shift["failures"] == {
+        instrumentation.EMPTY_DISTRIBUTION: 1,
+        instrumentation.TRIES_EXHAUSTED: 1,
+    }
+    assert pitch_shift["tries"] == 3 + 4
+    assert pitch_shift["notes"] == 4 * len(NOTE_DF) + 2
+    assert pitch_shift["max_notes"] == len(NOTE_DF)
+    assert 0 < pitch_shift["max_time"] <= pitch_shift["time"]
+
+    assert stats.degradations["split_note"]["failures"] == {
+        instrumentation.NO_VALID_NOTES: 1
+    }
+    assert stats.degradations["join_notes"]["failures"] == {
+        instrumentation.NO_VALID_NOTES: 1
+    }
+
+    # Export
+    exported = json.loads(stats.to_json())
+    assert exported["degradations"]["pitch_shift"]["calls"] == 5
+    assert exported["degradations"]["pitch_shift"]["mean_tries"] == 7 / 5
+    slowest = exported["slowest"]
+    assert len(slowest) == 7
+    assert all(a["time"] >= b["time"] for a, b in zip(slowest, slowest[1:]))
+
+    # Merge
+    merged = instrumentation.DegradationStats(num_slowest=3)
+    merged.merge(stats)
+    merged.merge(stats)
+    assert merged.degradations["pitch_shift"]["calls"] == 10
+    assert merged.degradations["pitch_shift"]["max_notes"] == len(NOTE_DF)
+    assert merged.degradations["split_note"]["failures"] == {
+        instrumentation.NO_VALID_NOTES: 2
+    }
+    assert len(merged.slowest) == 3
+
+
+def test_degrader_skips():
+    degrader = Degrader(
+        seed=0,
+        degradations=["split_note", "add_note"],
+        degradation_dist=[1, 1],
+        clean_prop=0,
+    )
+    stats = instrumentation.enable()
+    try:
+        for _ in range(10):
+            degrader.degrade(NoteArray())
+    finally:
+        instrumentation.disable()
+
+    assert stats.degradations["add_note"]["successes"] == 10
+    split_note = stats.degradations["split_note"]
+    assert split_note["calls"] == 0
+    assert split_note["skipped"] == split_note["failures"]["infeasible"] > 0
@@ -0,0 +1,247 @@
+import numpy as np
+
+from mdtk.interval_index import FreeIntervalIndex, NoteIntervalIndex, batch_overlaps
+from mdtk.note_array import NoteArray, NoteBatch
+
+
+def brute_force_overlaps(notes, onset, dur, track, pitch, exclude=None):
+    same = (notes.pitch == pitch) & (notes.track == track)
+    if exclude is not None:
+        same[exclude] = False
+    other_onset = notes.onset[same].astype(np.int64)
+    other_offset = other_onset + notes.dur[same]
+    return bool(np.any((onset < other_offset) & (onset + dur > other_onset)))
+
+
+def random_note(rng):
+    onset, dur = rng.randint(0, 300), rng.randint(0, 80)
+    return onset, dur, rng.randint(0, 2), rng.randint(0, 3)
+
+
+def check_queries(index, notes, rng, num_queries=20):
+    for _ in range(num_queries):
+        query = random_note(rng)
+        exclude = None
+        if len(notes) > 0 and rng.rand() < 0.7:
+            exclude = rng.randint(len(notes))
+        correct = brute_force_overlaps(notes, *query, exclude=exclude)
+        assert index.overlaps(*query, exclude=exclude) == correct, (
+            f"Overlap of {query} (excluding {exclude}) should be {correct} "
+            f"for notes:\n{notes}"
+        )
+
+
+def test_overlaps():
+    notes = NoteArray.from_columns(
+        [0, 100, 200, 0, 150], [0, 0, 0, 1, 1], 60, [100, 50, 100, 300, 10], 100
+    )
+    index = NoteIntervalIndex(notes)
+    assert len(index) == 5
+
+    assert not index.overlaps(150, 50, 0, 60)
+    assert index.overlaps(150, 51, 0, 60)
+    assert index.overlaps(99, 1, 0, 60)
+    assert not index.overlaps(150, 50, 0, 61)
+    assert not index.overlaps(300, 50, 0, 60)
+    assert index.overlaps(250, 50, 1, 60)
+    assert not index.overlaps(250, 50, 1, 60, exclude=3)
+    assert index.overlaps(100, 50, 0, 60)
+    assert not index.overlaps(100, 50, 0, 60, exclude=1)
+
+    # Zero duration
+    assert not index.overlaps(100, 0, 0, 60, exclude=1)
+    assert index.overlaps(120, 0, 0, 60)
+
+    rng = np.random.RandomState(0)
+    for _ in range(100):
+        num_notes = rng.randint(0, 25)
+        notes = NoteArray.from_columns(
+            rng.randint(0, 300, num_notes),
+            rng.randint(0, 2, num_notes),
+            rng.randint(0, 3, num_notes),
+            rng.randint(0, 80, num_notes),
+            100,
+        )
+        check_queries(NoteIntervalIndex(notes), notes, rng)
+
+    # Empty
+    assert not NoteIntervalIndex(NoteArray()).overlaps(0, 100, 0, 60)
+
+
+def test_batch_overlaps():
+    rng = np.random.RandomState(0)
+    for _ in range(100):
+        excerpts = []
+        for _ in range(rng.randint(1, 6)):
+            num_notes = rng.randint(0, 15)
+            excerpts.append(
+                NoteArray.from_columns(
+                    rng.randint(0, 300, num_notes),
+                    rng.randint(0, 2, num_notes),
+                    rng.randint(0, 3, num_notes),
+                    rng.randint(0, 80, num_notes),
+                    100,
+                )
+            )
+        batch = NoteBatch.from_excerpts(excerpts)
+        excerpt_index = batch.excerpt_index()
+
+        # Change at most one note per excerpt
+        _, exclude = np.unique(excerpt_index, return_index=True)
+        queries = [random_note(rng) for _ in exclude]
+        onset, dur, track, pitch = np.array(queries, dtype=int).reshape(-1, 4).T
+        new_notes = NoteArray.from_columns(onset, track, pitch, dur, 100)
+        overlap = batch_overlaps(
+            batch.notes, excerpt_index, new_notes, excerpt_index[exclude], exclude
+        )
+        for index, query, result in zip(exclude, queries, overlap):
+            excerpt = excerpt_index[index]
+            correct = brute_force_overlaps(
+                batch[excerpt], *query, exclude=index - batch.offsets[excerpt]
+            )
+            assert result == correct, (
+                f"Overlap of {query} (excluding {index}) should be {correct} "
+                f"for notes:\n{batch.notes}"
+            )
+
+    # Empty
+    overlap = batch_overlaps(NoteArray(), [], NoteArray(), [], [])
+    assert len(overlap) == 0
+
+
+def test_updates():
+    rng = np.random.RandomState(0)
+    for _ in range(50):
+        num_notes = rng.randint(0, 10)
+        notes = NoteArray.from_columns(
+            rng.randint(0, 300, num_notes),
+            rng.randint(0, 2, num_notes),
+            rng.randint(0, 3, num_notes),
+            rng.randint(0, 80, num_notes),
+            100,
+        )
+        index = NoteIntervalIndex(notes)
+
+        for _ in range(10):
+            action = rng.rand()
+            onset, dur, track, pitch = random_note(rng)
+            if action < 0.4 and len(notes) > 0:
+                note_index = rng.randint(len(notes))
+                index.update(note_index, onset, dur, track, pitch)
+                notes = notes.copy()
+                notes.onset[note_index] = onset
+                notes.dur[note_index] = dur
+                notes.track[note_index] = track
+                notes.pitch[note_index] = pitch
+            elif action < 0.7:
+                assert index.add(onset, dur, track, pitch) == len(notes)
+                new_note = NoteArray.from_columns(onset, track, pitch, dur, 100)
+                notes = NoteArray(np.concatenate([notes.data, new_note.data]))
+            elif len(notes) > 0:
+                note_index = rng.randint(len(notes))
+                index.remove(note_index)
+                notes = NoteArray(np.delete(notes.data, note_index))
+
+            assert len(index) == len(notes)
+            check_queries(index, notes, rng)
+
+
+def test_note_array_cache():
+    notes = NoteArray.from_columns([0, 100], 0, 60, 100, 100)
+    index = notes.interval_index()
+    assert notes.interval_index() is index
+    assert notes.copy().interval_index() is not index
+
+
+def test_group():
+    notes = NoteArray.from_columns([200, 0, 100, 0], [0, 0, 0, 1], 60, 100, 100)
+    index = NoteIntervalIndex(notes)
+
+    onsets, offsets = index.group(0, 60)
+    assert list(onsets) == [0, 100, 200]
+    assert list(offsets) == [100, 200, 300]
+
+    onsets, offsets = index.group(0, 60, exclude=2)
+    assert list(onsets) == [0, 200]
+    assert list(offsets) == [100, 300]
+
+    onsets, offsets = index.group(0, 60, exclude=3)
+    assert list(onsets) == [0, 100, 200]
+
+    onsets, offsets = index.group(1, 61)
+    assert len(onsets) == 0 and len(offsets) == 0
+
+
+def brute_force_free_notes(notes, min_dur, start, end, max_offset, max_dur, pairs):
+    index = NoteIntervalIndex(notes)
+    return {
+        (onset, dur, track, pitch)
+        for track, pitch in pairs
+        for onset in range(start, end)
+        for dur in range(min_dur, min(max_dur, max_offset) + 1)
+        if onset + dur < max_offset and not index.overlaps(onset, dur, track, pitch)
+    }
+
+
+def test_free_interval_index():
+    # Includes a zero-duration note, which only limits the duration
+    notes = NoteArray.from_columns([0, 10, 14], 0, [0, 0, 1], [5, 0, 3], 100)
+    index = FreeIntervalIndex(notes, 2, 0, 16, 18)
+    tracks, pitches = np.array([0, 0, 1]), np.array([0, 1, 0])
+    correct = brute_force_free_notes(notes, 2, 0, 16, 18, 4, zip(tracks, pitches))
+
+    rng = np.random.default_rng(0)
+    samples = {
+        index.sample(tracks, pitches, np.ones(3), 4, rng) for _ in range(5000)
+    }
+    assert samples == correct
+
+    # Weights
+    samples = {
+        index.sample(tracks, pitches, np.array([0, 1, 0]), 4, rng)[2:]
+        for _ in range(100)
+    }
+    assert samples == {(0, 1)}
+
+    # Full
+    full = NoteArray.from_columns(0, 0, 0, 100, 100)
+    index = FreeIntervalIndex(full, 10, 0, 90, 100)
+    assert index.sample(np.array([0]), np.array([0]), np.ones(1), 50, rng) is None
+    assert index.sample(np.array([0]), np.array([1]), np.ones(1), 50, rng) is not None
+
+    rng = np.random.RandomState(0)
+    generator = np.random.default_rng(0)
+    pairs = [(track, pitch) for track in range(2) for pitch in range(3)]
+    tracks, pitches = np.array(pairs).T
+    for _ in range(100):
+        num_notes = rng.randint(0, 8)
+        notes = NoteArray.from_columns(
+            rng.randint(0, 60, num_notes),
+            rng.randint(0, 2, num_notes),
+            rng.randint(0, 3, num_notes),
+            rng.randint(0, 25, num_notes),
+            100,
+        )
+        min_dur, start = rng.randint(1, 6), rng.randint(-3, 30)
+        end = start + rng.randint(0, 50)
+        max_offset = end + min_dur + rng.randint(0, 10)
+        max_dur = rng.randint(1, 30)
+        index = FreeIntervalIndex(notes, min_dur, start, end, max_offset)
+        correct = brute_force_free_notes(
+            notes, min_dur, start, end, max_offset, max_dur, pairs
+        )
+
+        for _ in range(10):
+            sample = index.sample(tracks, pitches, np.ones(6), max_dur, generator)
+            if len(correct) == 0:
+                assert sample is None
+            else:
+                assert sample in correct, f"Invalid sample {sample} for:\n{notes}"
+
+
+def test_free_interval_index_cache():
+    notes = NoteArray.from_columns([0, 100], 0, 60, 100, 100)
+    index = notes.free_interval_index(50, 0, 150, 200)
+    assert notes.free_interval_index(50, 0, 150, 200) is index
+    assert notes.free_interval_index(60, 0, 150, 200) is not index
+    assert notes.copy().free_interval_index(50, 0, 150, 200) is not index
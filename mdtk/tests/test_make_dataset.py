@@ -0,0 +1,56 @@
+import numpy as np
+
+from make_dataset import balanced_schedule, degrade_excerpt, parse_degradation_kwargs
+from mdtk import degradations
+from mdtk.note_array import NoteBatch
+from mdtk.rng import derive_rng
+from mdtk.synth import synthetic_df
+
+
+def test_balanced_schedule():
+    choices = np.array(["none", "a", "b", "c"])
+    goal_dist = np.ones(4) / 4
+
+    schedule = balanced_schedule(80, goal_dist, choices)
+    first = [order[0][1] for order in schedule]
+    assert list(np.bincount(first)) == [20, 20, 20, 20]
+
+    # Infeasible choices are never planned, and are tried last
+    feasible = np.ones((80, 4), dtype=bool)
+    feasible[::2, 3] = False
+    feasible[1::4, 1] = False
+    schedule = balanced_schedule(80, goal_dist, choices, feasible)
+    first = [order[0][1] for order in schedule]
+    assert list(np.bincount(first)) == [20, 20, 20, 20]
+    for index, order in enumerate(schedule):
+        assert sorted(order) == sorted(zip(choices, range(4)))
+        planned = [feasible[index, choice] for _, choice in order]
+        assert planned == sorted(planned, reverse=True)
+
+
+def test_balanced_schedule_histogram():
+    # Short excerpts, on most of which join_notes cannot succeed
+    num_excerpts = 90
+    excerpts = [
+        synthetic_df(10, polyphony=2, min_duration=40, rng=derive_rng(0, index))
+        for index in range(num_excerpts)
+    ]
+    deg_choices = np.array(["none"] + list(degradations.DEGRADATIONS))
+    goal_dist = np.ones(len(deg_choices)) / len(deg_choices)
+    degradation_kwargs = parse_degradation_kwargs({})
+    feasible = degradations.check_feasible(
+        NoteBatch.from_excerpts(excerpts), list(deg_choices), degradation_kwargs
+    )
+    assert not np.all(feasible)
+
+    schedule = balanced_schedule(num_excerpts, goal_dist, deg_choices, feasible)
+    deg_nums = []
+    for index, (excerpt, deg_order) in enumerate(zip(excerpts, schedule)):
+        _, deg_num = degrade_excerpt(
+            excerpt, derive_rng(1, index), deg_order, degradation_kwargs
+        )
+        deg_nums.append(deg_num)
+
+    # Failed degradations do not pile onto a single fallback label
+    counts = np.bincount(deg_nums, minlength=len(deg_choices))
+    assert np.all(np.abs(counts - num_excerpts * goal_dist) <= 2), counts
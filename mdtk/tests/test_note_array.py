@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mdtk.df_utils import NOTE_DF_SORT_ORDER
+from mdtk.note_array import NOTE_ARRAY_DTYPE, NoteArray, NoteBatch
+
+NOTE_DF = pd.DataFrame(
+    {
+        "onset": [200, 0, 100, 0],
+        "track": [0, 1, 0, 0],
+        "pitch": [30, 20, 10, 10],
+        "dur": [100, 50, 100, 100],
+        "velocity": [1, 2, 3, 4],
+    }
+)
+
+
+def test_from_df():
+    notes = NoteArray.from_df(NOTE_DF)
+    assert notes.data.dtype == NOTE_ARRAY_DTYPE
+    assert len(notes) == len(NOTE_DF)
+    for col in NOTE_DF_SORT_ORDER:
+        assert np.array_equal(getattr(notes, col), NOTE_DF[col])
+    assert np.array_equal(notes.offset, NOTE_DF["onset"] + NOTE_DF["dur"])
+
+    # Rounding and extra columns, as in pre_process
+    float_df = NOTE_DF.assign(onset=[200.4, 0.5, 99.6, 0], extra="apple")
+    notes = NoteArray.from_df(float_df)
+    assert list(notes.onset) == [200, 0, 100, 0]
+
+    # Sorting
+    notes = NoteArray.from_df(NOTE_DF, sort=True)
+    correct = NOTE_DF.sort_values(NOTE_DF_SORT_ORDER).reset_index(drop=True)
+    assert notes.to_df().astype(int).equals(correct)
+
+    # Missing columns
+    with pytest.raises(ValueError):
+        NoteArray.from_df(NOTE_DF[["onset", "pitch", "dur"]])
+
+
+def test_zero_copy():
+    notes = NoteArray.from_df(NOTE_DF)
+    df = notes.to_df()
+    assert np.shares_memory(df.to_numpy(), notes.data)
+    assert all(dtype == np.int32 for dtype in df.dtypes)
+
+    round_trip = NoteArray.from_df(df)
+    assert np.shares_memory(round_trip.data, notes.data)
+    assert round_trip.equals(notes)
+
+    # Copying to the default note_df dtypes gives an independent df
+    df = notes.to_df().astype(int)
+    assert df.equals(NOTE_DF)
+    assert not np.shares_memory(df.to_numpy(), notes.data)
+
+
+def test_from_columns():
+    notes = NoteArray.from_columns([0, 100], 0, [60, 62], 100, 80)
+    assert list(notes.pitch) == [60, 62]
+    assert list(notes.track) == [0, 0]
+    assert list(notes.velocity) == [80, 80]
+
+    notes = NoteArray.from_columns(0, 0, 60, 100, 80)
+    assert len(notes) == 1
+
+    assert len(NoteArray()) == 0
+    assert len(NoteArray().to_df()) == 0
+
+
+def test_indexing():
+    notes = NoteArray.from_df(NOTE_DF)
+    assert isinstance(notes[1:3], NoteArray)
+    assert len(notes[notes.pitch == 10]) == 2
+    assert notes[0]["onset"] == 200
+
+    copy = notes.copy()
+    copy.pitch[0] = 0
+    assert notes.pitch[0] == 30
+    assert not copy.equals(notes)
+
+
+def test_sorted():
+    notes = NoteArray.from_df(NOTE_DF)
+    assert not notes.is_sorted()
+    sorted_notes = notes.sort()
+    assert sorted_notes.is_sorted()
+    assert list(sorted_notes.sort_order()) == list(range(len(notes)))
+    assert sorted_notes.sort().equals(sorted_notes)
+    assert sorted_notes.sort() is not sorted_notes
+    assert NoteArray(sorted_notes.data.copy()).is_sorted()
+
+    # Copies are not assumed to be sorted, since they may be edited
+    copy = sorted_notes.copy()
+    copy.onset[0] = 500
+    assert not copy.is_sorted()
+    assert copy.sort().equals(NoteArray(np.sort(copy.data)))
+
+
+def test_note_batch():
+    excerpts = [
+        NoteArray.from_df(NOTE_DF),
+        NoteArray(),
+        NoteArray.from_columns([0, 100], 0, [60, 62], 100, 80),
+    ]
+    batch = NoteBatch.from_excerpts(excerpts)
+    assert len(batch) == 3
+    assert list(batch.offsets) == [0, 4, 4, 6]
+    assert list(batch.lengths) == [4, 0, 2]
+    assert list(batch.excerpt_index()) == [0, 0, 0, 0, 2, 2]
+    for excerpt, batch_excerpt in zip(excerpts, batch.to_excerpts()):
+        assert batch_excerpt.equals(excerpt)
+    assert batch[-1].equals(excerpts[2])
+    with pytest.raises(IndexError):
+        batch[3]
+
+    # DataFrames are converted
+    assert NoteBatch.from_excerpts([NOTE_DF, excerpts[2]]).notes.equals(
+        NoteBatch.from_excerpts([excerpts[0], excerpts[2]]).notes
+    )
+
+    taken = batch.take([2, 1, 0, 2])
+    assert list(taken.lengths) == [2, 0, 4, 2]
+    for index, excerpt in zip([2, 1, 0, 2], taken.to_excerpts()):
+        assert excerpt.equals(excerpts[index])
+
+    joined = NoteBatch.concatenate([batch, taken])
+    assert len(joined) == 7
+    assert joined.take(range(3)).equals(batch)
+    assert joined.take(range(3, 7)).equals(taken)
+
+    unsorted = NoteBatch.from_excerpts(
+        [NoteArray.from_columns([100, 0], 0, 60, 100, 80), excerpts[0]]
+    )
+    for excerpt in unsorted.sort().to_excerpts():
+        assert excerpt.equals(excerpt.sort())
+    assert list(unsorted.sort().offsets) == list(unsorted.offsets)
+
+    assert len(NoteBatch.from_excerpts([])) == 0
+    assert len(NoteBatch.concatenate([])) == 1
+    with pytest.raises(AssertionError):
+        NoteBatch(NoteArray.from_df(NOTE_DF), [0, 3])
@@ -0,0 +1,93 @@
+import os
+import shutil
+import time
+
+from mdtk import fileio
+from mdtk.parse_cache import ParseCache
+
+USER_HOME = os.path.expanduser("~")
+TEST_CACHE_PATH = os.path.join(USER_HOME, ".mdtk_test_cache")
+PARSE_CACHE_PATH = os.path.join(TEST_CACHE_PATH, "parsed")
+MIDI_PATH = f"mdtk{os.path.sep}tests"
+
+TEST_MID = f"{MIDI_PATH}{os.path.sep}test.mid"
+ALB_MID = f"{MIDI_PATH}{os.path.sep}alb_se2.mid"
+
+
+def test_load():
+    cache = ParseCache(PARSE_CACHE_PATH)
+    cache.clear()
+    calls = []
+
+    def counting_midi_to_df(path, **kwargs):
+        calls.append(path)
+        return fileio.midi_to_df(path, **kwargs)
+
+    for kwargs in [{}, {"single_track": True, "non_overlapping": True}]:
+        expected = fileio.midi_to_df(ALB_MID, **kwargs)
+        for _ in range(2):
+            df = cache.load(ALB_MID, counting_midi_to_df, **kwargs)
+            assert df.equals(expected)
+            assert df.index.equals(expected.index)
+    # Each set of options is parsed once
+    assert calls == [ALB_MID, ALB_MID]
+
+    # Csvs (and their float values) are stored exactly
+    csv_path = os.path.join(TEST_CACHE_PATH, "parse_cache.csv")
+    with open(csv_path, "w") as file:
+        file.write("0,0,60,100.5,80\n50,1,62,100,\n")
+    expected = fileio.csv_to_df(csv_path)
+    for _ in range(2):
+        df = cache.load(csv_path, fileio.csv_to_df)
+        assert df.equals(expected)
+        assert list(df.dtypes) == list(expected.dtypes)
+
+    # Changed contents are parsed again
+    with open(csv_path, "w") as file:
+        file.write("0,0,60,100,80\n")
+    assert len(cache.load(csv_path, fileio.csv_to_df)) == 1
+
+    # Files which fail to parse are not cached
+    assert cache.load(csv_path, lambda path: None) is None
+    assert len(cache._entries()) == 4
+
+    # Invalid entries are parsed again
+    key = cache.key(TEST_MID, fileio.midi_to_df, {})
+    cache.load(TEST_MID, fileio.midi_to_df)
+    with open(cache.entry_path(key), "wb") as file:
+        file.write(b"invalid")
+    assert cache.load(TEST_MID, fileio.midi_to_df).equals(fileio.midi_to_df(TEST_MID))
+
+
+def test_evict():
+    cache = ParseCache(PARSE_CACHE_PATH)
+    cache.clear()
+    assert cache.size() == 0
+    assert cache.evict() == 0
+
+    midi_dir = os.path.join(TEST_CACHE_PATH, "parse_cache_midi")
+    os.makedirs(midi_dir, exist_ok=True)
+    paths = []
+    for index in range(3):
+        path = os.path.join(midi_dir, f"{index}.mid")
+        shutil.copyfile(ALB_MID, path)
+        with open(path, "ab") as file:  # Different contents for each file
+            file.write(bytes(index))
+        paths.append(path)
+        cache.load(path, fileio.midi_to_df)
+        time.sleep(0.01)
+    entry_size = cache.size() // 3
+
+    # Using the first entry makes the second the least recently used
+    cache.load(paths[0], fileio.midi_to_df)
+    cache.max_bytes = 2 * entry_size
+    assert cache.evict() == 1
+    remaining = {entry_path for entry_path, _, _ in cache._entries()}
+    assert remaining == {
+        cache.entry_path(cache.key(paths[index], fileio.midi_to_df, {}))
+        for index in [0, 2]
+    }
+
+    cache.max_bytes = 0
+    assert cache.evict() == 2
+    assert cache.size() == 0
@@ -0,0 +1,47 @@
+import numpy as np
+
+from mdtk.rng import GLOBAL_RANDOM_STATE, derive_rng, get_rng
+
+
+def test_get_rng():
+    assert get_rng() is GLOBAL_RANDOM_STATE
+    rng = np.random.default_rng(0)
+    assert get_rng(rng) is rng
+    assert get_rng(5).integers(100) == np.random.default_rng(5).integers(100)
+
+    # The global wrapper gives the same draws as np.random
+    np.random.seed(0)
+    expected = [
+        np.random.randint(10),
+        np.random.randint(5, 10, 3).tolist(),
+        np.random.random_sample(),
+        np.random.choice([1, 2, 3], p=[0.2, 0.3, 0.5]),
+        np.random.permutation(5).tolist(),
+    ]
+    np.random.seed(0)
+    rng = get_rng()
+    assert [
+        rng.integers(10),
+        rng.integers(5, 10, 3).tolist(),
+        rng.random(),
+        rng.choice([1, 2, 3], p=[0.2, 0.3, 0.5]),
+        rng.permutation(5).tolist(),
+    ] == expected
+
+
+def test_derive_rng():
+    def draws(rng):
+        return rng.integers(0, 2 ** 32, 5).tolist()
+
+    assert draws(derive_rng(0, "piano", 3)) == draws(derive_rng(0, "piano", 3))
+    assert draws(derive_rng(0, "piano", 3)) != draws(derive_rng(1, "piano", 3))
+    assert draws(derive_rng(0, "piano", 3)) != draws(derive_rng(0, "piano", 4))
+    assert draws(derive_rng(0, "piano", 3)) != draws(derive_rng(0, "guitar", 3))
+    assert draws(derive_rng(0, "piano")) != draws(derive_rng(0))
+
+    # Creating other generators first does not change the draws
+    first = draws(derive_rng(0, "piano", 3))
+    np.random.seed(0)
+    for key in range(10):
+        draws(derive_rng(0, key))
+    assert draws(derive_rng(0, "piano", 3)) == first
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+
+from mdtk import fileio
+from mdtk.synth import synthetic_df, synthetic_notes, write_synthetic_files
+
+USER_HOME = os.path.expanduser("~")
+TEST_CACHE_PATH = os.path.join(USER_HOME, ".mdtk_test_cache")
+
+
+def overlap_proportion(notes):
+    """Get the proportion of notes which overlap the previous note of the same
+    track and pitch."""
+    df = notes.to_df().astype("int64").sort_values(["track", "pitch", "onset"])
+    same = (df.track.values[1:] == df.track.values[:-1]) & (
+        df.pitch.values[1:] == df.pitch.values[:-1]
+    )
+    offsets = (df.onset + df.dur).values
+    return np.sum(same & (df.onset.values[1:] < offsets[:-1])) / np.sum(same)
+
+
+def test_synthetic_notes():
+    assert len(synthetic_notes(0)) == 0
+
+    for polyphony in [1, 4, 16]:
+        notes = synthetic_notes(
+            5000,
+            polyphony=polyphony,
+            min_pitch=40,
+            max_pitch=80,
+            num_tracks=3,
+            min_duration=50,
+            min_velocity=10,
+            max_velocity=20,
+            rng=np.random.default_rng(0),
+        )
+        assert len(notes) == 5000
+        assert notes.is_sorted()
+        assert notes.onset.min() >= 0
+        assert notes.pitch.min() >= 40 and notes.pitch.max() <= 80
+        assert set(notes.track) == {0, 1, 2}
+        assert notes.dur.min() >= 50
+        assert notes.velocity.min() >= 10 and notes.velocity.max() <= 20
+        assert abs(notes.dur.mean() - 300) < 10
+        assert overlap_proportion(notes) == 0
+
+        length = notes.offset.max() - notes.onset.min()
+        assert abs(notes.dur.sum() / length - polyphony) < 0.05 * polyphony
+
+    notes = synthetic_notes(5000, overlap_rate=0.3, rng=np.random.default_rng(0))
+    assert abs(overlap_proportion(notes) - 0.3) < 0.03
+
+    notes = synthetic_notes(100, duration_sigma=0, rng=np.random.default_rng(0))
+    assert np.all(notes.dur == 300)
+
+    # Seeding
+    assert synthetic_notes(100, rng=np.random.default_rng(1)).equals(
+        synthetic_notes(100, rng=np.random.default_rng(1))
+    )
+    np.random.seed(0)
+    notes = synthetic_notes(100)
+    np.random.seed(0)
+    assert notes.equals(synthetic_notes(100))
+
+    df = synthetic_df(100, rng=np.random.default_rng(1))
+    notes = synthetic_notes(100, rng=np.random.default_rng(1))
+    assert df.equals(notes.to_df().astype("int64"))
+    assert all(dtype == np.int64 for dtype in df.dtypes)
+
+
+def test_write_synthetic_files():
+    lengths = []
+    for file_format, load_func in [
+        ("csv", fileio.csv_to_df),
+        ("mid", fileio.midi_to_df),
+    ]:
+        output_dir = os.path.join(TEST_CACHE_PATH, "synth", file_format)
+        paths = write_synthetic_files(
+            output_dir, 3, (10, 20), file_format=file_format, seed=0, polyphony=2
+        )
+        assert len(paths) == 3
+        for path in paths:
+            assert os.path.dirname(path) == output_dir
+            df = load_func(path)
+            assert 10 <= len(df) < 20
+            lengths.append(len(df))
+
+        # Each file depends only on the seed and its index
+        again = write_synthetic_files(
+            output_dir, 2, (10, 20), file_format=file_format, seed=0, polyphony=2
+        )
+        assert load_func(again[1]).equals(load_func(paths[1]))
+
+    # Both formats contain the same notes
+    assert lengths[:3] == lengths[3:]